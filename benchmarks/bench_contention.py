@@ -0,0 +1,160 @@
+"""
+Multi-worker contention benchmark
+
+Runs N simulated workers (one GSheetsMLScheduler per thread) against a sheet of M ready runs stored in an InMemorySpreadsheet
+and reports runs/minute, API calls per claimed run, claim-collision rate and p50/p99 claim latency
+
+Usage (from the repository root):
+  python benchmarks/bench_contention.py --workers 4 --runs 40 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.rate_limiter import QuotaRateLimiter
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+def make_sheet_data(nb_runs, nb_config_keys=4):
+  """
+  A sheet in the template format: header line, defaults line, then nb_runs "ready" runs
+  """
+  config_keys = [f"param_{j}" for j in range(nb_config_keys)]
+  data = [["run_name", "status", "worker_name"] + config_keys]
+  data.append(["", "", ""] + [str(j) for j in range(nb_config_keys)])
+  for i in range(nb_runs):
+    data.append([str(i+1), "ready", ""] + [str(0.1*i) if j == 0 else "" for j in range(nb_config_keys)])
+  return data
+
+def percentile(sorted_values, q):
+  if len(sorted_values) == 0:
+    return float("nan")
+  index = min(len(sorted_values)-1, int(round(q*(len(sorted_values)-1))))
+  return sorted_values[index]
+
+def worker_loop(spreadsheet, train_s, scheduler_kwargs, rate_limiter, results, results_lock):
+  scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, rate_limiter=rate_limiter, **scheduler_kwargs)
+  claimed_run_names = []
+  claim_latencies = []
+  nb_errors = 0
+  while True:
+    start_time = time.perf_counter()
+    try:
+      run_name, _ = scheduler.find_claim_and_start_run(auto_retry=1000) # Only stop when no run is ready
+      if run_name is None:
+        break
+      claim_latencies.append(time.perf_counter() - start_time)
+      claimed_run_names.append(run_name)
+      time.sleep(train_s)
+      scheduler.run_done()
+    except Exception as error: # Quota errors and simulated 429s end up here
+      nb_errors += 1
+      print(f"Worker <{scheduler.worker_name}> error: {error}")
+      time.sleep(1.0)
+  scheduler.close()
+
+  with results_lock:
+    results["claimed_run_names"].extend(claimed_run_names)
+    results["claim_latencies"].extend(claim_latencies)
+    results["claim_attempts"] += scheduler.claim_stats["attempts"]
+    results["collisions"] += scheduler.claim_stats["losses"]
+    results["claim_time_s"] += scheduler.claim_stats["time_s"]
+    results["errors"] += nb_errors
+
+def run_benchmark(nb_workers=4, nb_runs=40, latency_s=0.05, train_s=0.0, read_quota_per_minute=None, write_quota_per_minute=None, error_rate=0.0, scheduler_kwargs=None, rate_limited=False, quiet=True):
+  """
+  rate_limited (bool, optional): Share a QuotaRateLimiter sized to the quotas between the workers
+  Returns: a report dict, see print_report
+  """
+  if scheduler_kwargs is None:
+    scheduler_kwargs = {}
+  spreadsheet = InMemorySpreadsheet([make_sheet_data(nb_runs)], latency_s=latency_s, read_quota_per_minute=read_quota_per_minute,
+                                    write_quota_per_minute=write_quota_per_minute, error_rate=error_rate, seed=0)
+  results = {"claimed_run_names": [], "claim_latencies": [], "claim_attempts": 0, "collisions": 0, "claim_time_s": 0.0, "errors": 0}
+  results_lock = threading.Lock()
+  rate_limiter = None
+  if rate_limited:
+    rate_limiter = QuotaRateLimiter(read_quota_per_minute=read_quota_per_minute or 300, write_quota_per_minute=write_quota_per_minute or 300,
+                                    base_backoff_s=0.1, max_backoff_s=5.0)
+
+  output = io.StringIO() if quiet else sys.stdout
+  with contextlib.redirect_stdout(output):
+    start_time = time.perf_counter()
+    threads = [threading.Thread(target=worker_loop, args=(spreadsheet, train_s, scheduler_kwargs, rate_limiter, results, results_lock)) for _ in range(nb_workers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    elapsed_s = time.perf_counter() - start_time
+
+  nb_claimed = len(results["claimed_run_names"])
+  claim_counts = Counter(results["claimed_run_names"])
+  latencies = sorted(results["claim_latencies"])
+  return {
+    "scheduler_kwargs": scheduler_kwargs,
+    "workers": nb_workers,
+    "runs": nb_runs,
+    "claimed_runs": nb_claimed,
+    "double_claimed_runs": sum(1 for count in claim_counts.values() if count > 1),
+    "elapsed_s": elapsed_s,
+    "runs_per_minute": 60.0*nb_claimed/elapsed_s if elapsed_s > 0 else float("nan"),
+    "api_calls": spreadsheet.total_api_calls(),
+    "api_calls_per_run": spreadsheet.total_api_calls()/nb_claimed if nb_claimed > 0 else float("nan"),
+    "api_calls_by_operation": dict(spreadsheet.api_calls),
+    "collision_rate": results["collisions"]/results["claim_attempts"] if results["claim_attempts"] > 0 else 0.0,
+    "claim_overhead_per_run_s": results["claim_time_s"]/nb_claimed if nb_claimed > 0 else float("nan"),
+    "errors": results["errors"],
+    "claim_latency_p50_s": percentile(latencies, 0.50),
+    "claim_latency_p99_s": percentile(latencies, 0.99),
+    "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+  }
+
+def print_report(report):
+  print(f"{report['scheduler_kwargs']}")
+  print(f"{report['workers']} workers, {report['claimed_runs']}/{report['runs']} runs claimed in {report['elapsed_s']:.2f}s")
+  print(f"  runs/minute:          {report['runs_per_minute']:.1f}")
+  print(f"  API calls per run:    {report['api_calls_per_run']:.2f} ({report['api_calls']} total)")
+  print(f"  API calls by op:      {report['api_calls_by_operation']}")
+  print(f"  claim collision rate: {100*report['collision_rate']:.1f}%")
+  print(f"  claim overhead/run:   {report['claim_overhead_per_run_s']:.3f}s (amortized)")
+  print(f"  claim latency p50:    {report['claim_latency_p50_s']:.3f}s")
+  print(f"  claim latency p99:    {report['claim_latency_p99_s']:.3f}s")
+  print(f"  double-claimed runs:  {report['double_claimed_runs']}")
+  print(f"  worker errors:        {report['errors']}")
+  if report["rate_limiter"] is not None:
+    print(f"  limiter retries:      {report['rate_limiter']['nb_retries']}")
+    print(f"  limiter mean delay:   {report['rate_limiter']['mean_queueing_delay_s']:.3f}s per call")
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--workers", type=int, nargs="+", default=[4], help="Number of simulated workers, several values run several benchmarks")
+  parser.add_argument("--runs", type=int, default=40, help="Number of ready runs in the sheet")
+  parser.add_argument("--latency", type=float, default=0.05, help="Simulated API round-trip time in seconds")
+  parser.add_argument("--train", type=float, default=0.0, help="Simulated training time of each run in seconds")
+  parser.add_argument("--read-quota", type=int, default=None, help="Read calls allowed per minute")
+  parser.add_argument("--write-quota", type=int, default=None, help="Write calls allowed per minute")
+  parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a random 429 error per call")
+  parser.add_argument("--claim-mode", default="lease", choices=["lease", "legacy"], help="Claim protocol of the schedulers")
+  parser.add_argument("--prefetch", type=int, default=1, help="Number of runs each worker claims at once")
+  parser.add_argument("--claim-spread", type=int, default=1, help="Each claim picks at random among that many best ready runs")
+  parser.add_argument("--no-cosmetics", action="store_true", help="Schedulers don't color the lines (cosmetics=False)")
+  parser.add_argument("--rate-limit", action="store_true", help="Share a rate limiter sized to the quotas between the workers")
+  parser.add_argument("--verbose", action="store_true", help="Show the schedulers prints")
+  args = parser.parse_args()
+
+  for nb_workers in args.workers:
+    report = run_benchmark(nb_workers=nb_workers, nb_runs=args.runs, latency_s=args.latency, train_s=args.train,
+                           read_quota_per_minute=args.read_quota, write_quota_per_minute=args.write_quota,
+                           error_rate=args.error_rate, scheduler_kwargs={"claim_mode": args.claim_mode, "prefetch": args.prefetch, "claim_spread": args.claim_spread, "cosmetics": not args.no_cosmetics},
+                           rate_limited=args.rate_limit, quiet=not args.verbose)
+    print_report(report)
+
+if __name__ == "__main__":
+  main()
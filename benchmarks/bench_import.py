@@ -0,0 +1,118 @@
+"""
+Cold-start benchmark
+
+Measures the import time of gsheets_ml_scheduler in fresh interpreters (and which heavy modules it pulls in),
+then the time and API calls to construct N schedulers and a run writer in the same process,
+each logging in separately or sharing one SharedSpreadsheet (see gsheets_ml_scheduler.clients)
+
+Usage (from the repository root):
+  python benchmarks/bench_import.py --repeats 10 --schedulers 4 --latency 0.05
+  python benchmarks/bench_import.py --url <GSheets URL> --service-account service_account.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+HEAVY_MODULES = ("numpy", "pandas", "gspread", "google.auth", "google.colab", "requests")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import gsheets_ml_scheduler.scheduler, gsheets_ml_scheduler.run_writer
+elapsed_s = time.perf_counter() - start
+print(json.dumps({"elapsed_s": elapsed_s, "loaded": [name for name in %r if name in sys.modules]}))
+"""
+
+def measure_import(nb_repeats):
+  """
+  Returns: a report dict {"median_s", "min_s", "loaded"}, the import is timed in a new interpreter each time so nothing is already cached in sys.modules
+  """
+  times = []
+  loaded = []
+  for _ in range(nb_repeats):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT % (HEAVY_MODULES,)], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    times.append(result["elapsed_s"])
+    loaded = result["loaded"]
+  return {"median_s": statistics.median(times), "min_s": min(times), "loaded": loaded}
+
+def make_sheet_data(nb_runs, nb_config_keys=4):
+  config_keys = [f"param_{j}" for j in range(nb_config_keys)]
+  data = [["run_name", "status", "worker_name"] + config_keys]
+  data.append(["", "", ""] + [str(j) for j in range(nb_config_keys)])
+  for i in range(nb_runs):
+    data.append([str(i+1), "ready", ""] + [str(0.1*i) if j == 0 else "" for j in range(nb_config_keys)])
+  return data
+
+def measure_construction(nb_schedulers, nb_runs, latency_s, shared):
+  """
+  Constructs nb_schedulers schedulers then a run writer on the same InMemorySpreadsheet
+  shared (bool): Whether they all use one SharedSpreadsheet, as they do when logging in to Google
+  """
+  from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+  from gsheets_ml_scheduler.clients import SharedSpreadsheet
+  from gsheets_ml_scheduler.run_writer import GSheetsMLRunWriter
+  from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+  spreadsheet = InMemorySpreadsheet([make_sheet_data(nb_runs)], latency_s=latency_s)
+  shared_spreadsheet = SharedSpreadsheet(spreadsheet)
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(nb_schedulers):
+      GSheetsMLScheduler(spreadsheet.url, backend=shared_spreadsheet if shared else spreadsheet)
+    GSheetsMLRunWriter(spreadsheet.url, backend=shared_spreadsheet if shared else spreadsheet)
+  elapsed_s = time.perf_counter() - start
+  return {"elapsed_s": elapsed_s, "api_calls": sum(spreadsheet.api_calls.values()), "api_calls_by_operation": dict(spreadsheet.api_calls)}
+
+def measure_google(url, service_account_json_path, nb_schedulers):
+  """
+  Returns: the time to construct the first scheduler (login included) and the mean time of the next ones, against the real Google Sheets API
+  """
+  from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+  times = []
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(nb_schedulers):
+      start = time.perf_counter()
+      GSheetsMLScheduler(url, service_account_json_path=service_account_json_path)
+      times.append(time.perf_counter() - start)
+  return {"first_s": times[0], "next_mean_s": statistics.mean(times[1:]) if len(times) > 1 else float("nan")}
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--repeats", type=int, default=10, help="Number of fresh interpreters the import is timed in")
+  parser.add_argument("--schedulers", type=int, default=4, help="Number of schedulers constructed in the same process")
+  parser.add_argument("--runs", type=int, default=40, help="Number of ready runs in the sheet")
+  parser.add_argument("--latency", type=float, default=0.05, help="Simulated API round-trip time in seconds")
+  parser.add_argument("--url", default=None, help="A real GSheets file to also time the login against")
+  parser.add_argument("--service-account", default=None, help="Service account key used with --url (default is the Colab login)")
+  args = parser.parse_args()
+
+  report = measure_import(args.repeats)
+  print(f"import gsheets_ml_scheduler.scheduler, .run_writer")
+  print(f"  median:               {1000*report['median_s']:.1f}ms (min {1000*report['min_s']:.1f}ms over {args.repeats} interpreters)")
+  print(f"  heavy modules loaded: {report['loaded'] or 'none'}")
+
+  for shared in (False, True):
+    report = measure_construction(args.schedulers, args.runs, args.latency, shared)
+    print(f"{args.schedulers} schedulers + 1 run writer, {'one SharedSpreadsheet' if shared else 'separate spreadsheets'}")
+    print(f"  construction:         {report['elapsed_s']:.2f}s")
+    print(f"  API calls:            {report['api_calls']} {report['api_calls_by_operation']}")
+
+  if args.url is not None:
+    report = measure_google(args.url, args.service_account, args.schedulers)
+    print(f"Google Sheets, {args.schedulers} schedulers")
+    print(f"  first (with login):   {report['first_s']:.2f}s")
+    print(f"  next ones:            {report['next_mean_s']:.2f}s")
+
+if __name__ == "__main__":
+  main()
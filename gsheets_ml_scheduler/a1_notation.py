@@ -0,0 +1,56 @@
+# Same results as the A1 notation functions of gspread.utils, without importing gspread (and google-auth, requests...) with the scheduler
+# Invalid labels raise a ValueError
+import re
+
+CELL_LABEL_RE = re.compile(r"([A-Za-z]+)([1-9]\d*)$")
+UNBOUNDED_LABEL_RE = re.compile(r"([A-Za-z]+)?([1-9]\d*)?$")
+
+def column_label_to_number(column_label):
+  col = 0
+  for c in column_label.upper():
+    col = 26*col + ord(c) - ord("A") + 1
+  return col
+
+def rowcol_to_a1(row, col):
+  """
+  (1, 1) -> "A1"
+  """
+  if row < 1 or col < 1:
+    raise ValueError(f"Incorrect cell ({row}, {col})")
+  column_label = ""
+  while col > 0:
+    col, mod = divmod(col-1, 26)
+    column_label = chr(ord("A") + mod) + column_label
+  return f"{column_label}{row}"
+
+def a1_to_rowcol(label):
+  """
+  "B1" -> (1, 2)
+  """
+  match = CELL_LABEL_RE.match(label)
+  if match is None:
+    raise ValueError(f"Incorrect cell label {label}")
+  return int(match.group(2)), column_label_to_number(match.group(1))
+
+def a1_to_rowcol_unbounded(label):
+  """
+  Same as a1_to_rowcol, a missing row or column is float("inf"): "C" -> (inf, 3)
+  """
+  match = UNBOUNDED_LABEL_RE.match(label)
+  if match is None:
+    raise ValueError(f"Incorrect cell label {label}")
+  column_label, row = match.groups()
+  return (int(row) if row else float("inf")), (column_label_to_number(column_label) if column_label else float("inf"))
+
+def a1_range_to_grid_range(range_name):
+  """
+  "A3:B4" -> {"startRowIndex": 2, "endRowIndex": 4, "startColumnIndex": 0, "endColumnIndex": 2}
+  Zero-based half-open indexes, like the GridRange of the Sheets API. Unbounded sides are missing ("C:C" has no row indexes)
+  """
+  start_label, _, end_label = range_name.partition(":")
+  start_row, start_col = a1_to_rowcol_unbounded(start_label)
+  end_row, end_col = a1_to_rowcol_unbounded(end_label or start_label)
+  start_row, end_row = min(start_row, end_row), max(start_row, end_row)
+  start_col, end_col = min(start_col, end_col), max(start_col, end_col)
+  grid_range = {"startRowIndex": start_row - 1, "endRowIndex": end_row, "startColumnIndex": start_col - 1, "endColumnIndex": end_col}
+  return {key: value for key, value in grid_range.items() if isinstance(value, int)}
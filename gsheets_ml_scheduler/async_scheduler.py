@@ -0,0 +1,123 @@
+import asyncio
+
+from .run_writer import GSheetsMLRunWriter
+from .scheduler import GSheetsMLScheduler
+
+class AsyncGSheetsMLScheduler():
+  def __init__(self, scheduler):
+    """
+    scheduler (GSheetsMLScheduler): The scheduler to drive. Use `await AsyncGSheetsMLScheduler.create(...)` to build both at once
+
+    asyncio version of GSheetsMLScheduler, with the same methods as coroutines
+    Every call runs the synchronous method in the default executor (asyncio.to_thread), so one event loop can drive many schedulers
+    (workers, monitoring dashboards...). The claims, including their waits, run in the executor too: they hold scheduler.lock like the
+    synchronous methods, in case a background sync of the previous run is still polling
+    Calls on one instance are serialized by an asyncio.Lock
+    The synchronous scheduler stays available in self.scheduler (values, worker_name, claim_stats...)
+    """
+    self.scheduler = scheduler
+    self.lock = asyncio.Lock()
+
+  @classmethod
+  async def create(cls, gsheets_file_url, **kwargs):
+    """
+    Same arguments as GSheetsMLScheduler. The login and the first download don't block the event loop
+    """
+    scheduler = await asyncio.to_thread(GSheetsMLScheduler, gsheets_file_url, **kwargs)
+    return cls(scheduler)
+
+  @property
+  def worker_name(self):
+    return self.scheduler.worker_name
+
+  @property
+  def values(self):
+    return self.scheduler.values
+
+  async def call(self, function, *args, **kwargs):
+    async with self.lock:
+      return await asyncio.to_thread(function, *args, **kwargs)
+
+  async def download_data(self):
+    return await self.call(self.scheduler.download_data)
+
+  async def find_ready_run(self):
+    return await self.call(self.scheduler.find_ready_run)
+
+  async def get_run_config(self, run_id):
+    return await self.call(self.scheduler.get_run_config, run_id)
+
+  async def claim_and_start_run(self, run_id):
+    """
+    See GSheetsMLScheduler.claim_and_start_run
+    """
+    return await self.call(self.scheduler.claim_and_start_run, run_id)
+
+  async def claim_runs(self, nb_runs):
+    """
+    See GSheetsMLScheduler.claim_runs
+    """
+    return await self.call(self.scheduler.claim_runs, nb_runs)
+
+  async def find_claim_and_start_run(self, auto_retry=3):
+    """
+    See GSheetsMLScheduler.find_claim_and_start_run
+    Returns: run_name, config
+    """
+    return await self.call(self.scheduler.find_claim_and_start_run, auto_retry=auto_retry)
+
+  async def run_done(self, new_status_str="done", run_id=None):
+    return await self.call(self.scheduler.run_done, new_status_str, run_id=run_id)
+
+  async def update_status(self, new_status_str, flush=True, run_id=None):
+    return await self.call(self.scheduler.update_status, new_status_str, flush=flush, run_id=run_id)
+
+  async def log(self, metrics, run_id=None):
+    return await self.call(self.scheduler.log, metrics, run_id=run_id)
+
+  async def heartbeat(self, run_id=None):
+    return await self.call(self.scheduler.heartbeat, run_id=run_id)
+
+  async def check_for_config_updates(self):
+    return await self.call(self.scheduler.check_for_config_updates)
+
+  async def sync_config_and_status(self, new_status_str=None):
+    return await self.call(self.scheduler.sync_config_and_status, new_status_str)
+
+  async def flush(self):
+    return await self.call(self.scheduler.flush)
+
+  async def close(self):
+    return await self.call(self.scheduler.close)
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close()
+    return False
+
+class AsyncGSheetsMLRunWriter():
+  def __init__(self, writer):
+    """
+    writer (GSheetsMLRunWriter): The writer to drive. Use `await AsyncGSheetsMLRunWriter.create(...)` to build both at once
+
+    asyncio version of GSheetsMLRunWriter, write_runs() runs in the default executor
+    """
+    self.writer = writer
+    self.lock = asyncio.Lock()
+
+  @classmethod
+  async def create(cls, gsheets_file_url, **kwargs):
+    """
+    Same arguments as GSheetsMLRunWriter
+    """
+    writer = await asyncio.to_thread(GSheetsMLRunWriter, gsheets_file_url, **kwargs)
+    return cls(writer)
+
+  async def write_runs(self, configs, **kwargs):
+    """
+    Same arguments as GSheetsMLRunWriter.write_runs, progress_callback is called from the executor thread
+    """
+    async with self.lock:
+      return await asyncio.to_thread(self.writer.write_runs, configs, **kwargs)
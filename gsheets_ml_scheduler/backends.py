@@ -0,0 +1,297 @@
+"""
+Sheet backends
+
+GSheetsMLScheduler and GSheetsMLRunWriter only use a small subset of the gspread API:
+  Spreadsheet: worksheets(), get_worksheet(index)
+  Worksheet: get_all_values(), row_values(), col_values(), batch_get(), update_cell(), batch_update(), format(), batch_format()
+
+Optionally, a Spreadsheet can implement get_change_marker(): a value that changes whenever the spreadsheet is modified, cheaper to get than a read
+(see get_change_marker_function). gspread Spreadsheets use their Drive modified time instead
+
+Any object implementing that subset can be given as `backend` to the scheduler and the run writer instead of logging in to Google
+A gspread Spreadsheet is the default backend, InMemorySpreadsheet is a local stand-in used for tests and benchmarks
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+
+from .a1_notation import a1_range_to_grid_range
+
+class QuotaExceededError(Exception):
+  """
+  Raised by InMemorySpreadsheet like the Sheets API answers "429 RESOURCE_EXHAUSTED"
+  `code` mimics gspread.exceptions.APIError.code so callers can handle both the same way
+  """
+  def __init__(self, message="Quota exceeded"):
+    super().__init__(message)
+    self.code = 429
+
+def get_change_marker_function(spreadsheet):
+  """
+  Returns: the function giving the change marker of spreadsheet, None if the backend has no change marker
+  """
+  if hasattr(spreadsheet, "get_change_marker"):
+    return spreadsheet.get_change_marker
+  if hasattr(spreadsheet, "get_lastUpdateTime"): # gspread, metadata of the file from the Drive API
+    return spreadsheet.get_lastUpdateTime
+  return None
+
+def cell_to_str(value):
+  """
+  The string a cell shows once a Python value has been written in it with USER_ENTERED
+  """
+  if value is None:
+    return ""
+  if isinstance(value, bool):
+    return "TRUE" if value else "FALSE"
+  return str(value)
+
+class InMemorySpreadsheet():
+  def __init__(self, sheets_data=None, latency_s=0.0, read_quota_per_minute=None, write_quota_per_minute=None, error_rate=0.0, seed=None):
+    """
+    sheets_data (list, optional): One 2d list of cell values per worksheet (default is a single empty worksheet)
+    latency_s (float or (float, float), optional): Simulated round-trip time of each API call, or a (min, max) range to draw it uniformly from
+    read_quota_per_minute (int, optional): Max number of read calls in any 60s window, None for unlimited. The real Sheets API allows 60 per user
+    write_quota_per_minute (int, optional): Same as read_quota_per_minute for write calls (values and formats)
+    error_rate (float, optional): Probability that any call randomly fails with a 429 QuotaExceededError
+    seed (int, optional): Seed of the latency and error draws
+
+    Cells are last-writer-wins: each call is applied atomically in the middle of its simulated round-trip
+    """
+    self.latency_s = latency_s
+    self.read_quota_per_minute = read_quota_per_minute
+    self.write_quota_per_minute = write_quota_per_minute
+    self.error_rate = error_rate
+    self.random = random.Random(seed)
+
+    self.lock = threading.RLock()
+    self.read_times = deque()
+    self.write_times = deque()
+    self.api_calls = Counter() # api_calls[operation_name] is the number of accepted calls
+    self.rejected_calls = Counter() # Calls that raised a QuotaExceededError
+    self.revision = 0 # Incremented by every write call, see get_change_marker
+
+    self.id = "in_memory"
+    self.url = "in-memory://spreadsheet"
+    self.title = "InMemorySpreadsheet"
+
+    if sheets_data is None:
+      sheets_data = [[]]
+    self._worksheets = []
+    for data in sheets_data:
+      self.add_worksheet(rows=data)
+
+  def worksheets(self):
+    latency = self.api_call("fetch_sheet_metadata", is_write=False)
+    if latency > 0:
+      time.sleep(latency)
+    return list(self._worksheets)
+
+  def get_worksheet(self, index):
+    latency = self.api_call("fetch_sheet_metadata", is_write=False)
+    if latency > 0:
+      time.sleep(latency)
+    return self._worksheets[index]
+
+  def get_change_marker(self):
+    """
+    Returns: the revision number of the spreadsheet. Like the Drive modified time, it changes with every write, formats included
+    """
+    latency = self.api_call("get_change_marker", is_write=False)
+    if latency > 0:
+      time.sleep(latency)
+    return self.revision
+
+  def add_worksheet(self, title=None, rows=None):
+    """
+    rows (list, optional): 2d list of initial cell values
+    """
+    index = len(self._worksheets)
+    if title is None:
+      title = f"Sheet{index+1}"
+    worksheet = InMemoryWorksheet(self, index, title, rows)
+    self._worksheets.append(worksheet)
+    return worksheet
+
+  def draw_latency(self):
+    if isinstance(self.latency_s, (tuple, list)):
+      return self.random.uniform(self.latency_s[0], self.latency_s[1])
+    return self.latency_s
+
+  def api_call(self, operation_name, is_write):
+    """
+    Checks the quota and the random error rate of one call
+    Returns: the simulated latency of the call
+    """
+    with self.lock:
+      now = time.monotonic()
+      window = self.write_times if is_write else self.read_times
+      quota = self.write_quota_per_minute if is_write else self.read_quota_per_minute
+      while len(window) > 0 and now - window[0] > 60.0:
+        window.popleft()
+      if quota is not None and len(window) >= quota:
+        self.rejected_calls[operation_name] += 1
+        raise QuotaExceededError(f"Quota exceeded for {'write' if is_write else 'read'} requests per minute ({operation_name})")
+      if self.error_rate > 0 and self.random.random() < self.error_rate:
+        self.rejected_calls[operation_name] += 1
+        raise QuotaExceededError(f"Simulated 429 error ({operation_name})")
+      window.append(now)
+      self.api_calls[operation_name] += 1
+      return self.draw_latency()
+
+  def total_api_calls(self):
+    return sum(self.api_calls.values())
+
+class InMemoryWorksheet():
+  def __init__(self, spreadsheet, index, title, rows=None):
+    """
+    Cells are stored as strings, like the "formatted value" the Sheets API returns
+    (1,1) is the top left cell, as in gspread
+    """
+    self.spreadsheet = spreadsheet
+    self.index = index
+    self.id = index
+    self.title = title
+    self.cells = []
+    self.formats = {} # formats[(row, col)] is the merged format dict of that cell
+    if rows is not None:
+      for i, row in enumerate(rows):
+        for j, value in enumerate(row):
+          self.set_cell(i+1, j+1, value)
+
+  # Internal helpers, called with the spreadsheet lock held
+
+  def set_cell(self, row, col, value):
+    while len(self.cells) < row:
+      self.cells.append([])
+    line = self.cells[row-1]
+    while len(line) < col:
+      line.append("")
+    line[col-1] = cell_to_str(value)
+
+  def get_cell(self, row, col):
+    if row > len(self.cells) or col > len(self.cells[row-1]):
+      return ""
+    return self.cells[row-1][col-1]
+
+  def nb_rows(self):
+    nb_rows = len(self.cells)
+    while nb_rows > 0 and all(value == "" for value in self.cells[nb_rows-1]):
+      nb_rows -= 1
+    return nb_rows
+
+  def nb_cols(self):
+    nb_cols = 0
+    for line in self.cells:
+      for j in range(len(line), 0, -1):
+        if line[j-1] != "":
+          nb_cols = max(nb_cols, j)
+          break
+    return nb_cols
+
+  def range_bounds(self, range_name):
+    """
+    Converts an A1 range ("B3", "A1:C4", "2:2", "C:C", "A3:B") into 1-based inclusive (row_start, row_end, col_start, col_end)
+    """
+    grid_range = a1_range_to_grid_range(range_name)
+    row_start = grid_range.get("startRowIndex", 0) + 1
+    row_end = grid_range.get("endRowIndex", max(self.nb_rows(), row_start-1))
+    col_start = grid_range.get("startColumnIndex", 0) + 1
+    col_end = grid_range.get("endColumnIndex", max(self.nb_cols(), col_start-1))
+    return row_start, row_end, col_start, col_end
+
+  def read_range(self, range_name):
+    """
+    Like the Sheets API, trailing empty rows and trailing empty cells of each row are not returned
+    """
+    row_start, row_end, col_start, col_end = self.range_bounds(range_name)
+    values = []
+    for row in range(row_start, row_end+1):
+      line = [self.get_cell(row, col) for col in range(col_start, col_end+1)]
+      while len(line) > 0 and line[-1] == "":
+        line.pop()
+      values.append(line)
+    while len(values) > 0 and len(values[-1]) == 0:
+      values.pop()
+    return values
+
+  def simulate(self, operation_name, is_write, function):
+    """
+    Runs function() atomically in the middle of the simulated round-trip
+    """
+    latency = self.spreadsheet.api_call(operation_name, is_write)
+    if latency > 0:
+      time.sleep(latency/2)
+    with self.spreadsheet.lock:
+      result = function()
+      if is_write:
+        self.spreadsheet.revision += 1
+    if latency > 0:
+      time.sleep(latency/2)
+    return result
+
+  # gspread Worksheet API subset
+
+  def get_all_values(self):
+    def read():
+      nb_cols = self.nb_cols()
+      data = []
+      for row in range(1, self.nb_rows()+1):
+        data.append([self.get_cell(row, col) for col in range(1, nb_cols+1)])
+      return data
+    return self.simulate("get_all_values", False, read)
+
+  def row_values(self, row):
+    return self.simulate("row_values", False, lambda: (self.read_range(f"{row}:{row}") or [[]])[0])
+
+  def col_values(self, col):
+    def read():
+      return [self.get_cell(row, col) for row in range(1, self.nb_rows()+1)]
+    values = self.simulate("col_values", False, read)
+    while len(values) > 0 and values[-1] == "":
+      values.pop()
+    return values
+
+  def get(self, range_name):
+    return self.simulate("get", False, lambda: self.read_range(range_name))
+
+  def batch_get(self, ranges):
+    ranges = list(ranges)
+    return self.simulate("batch_get", False, lambda: [self.read_range(range_name) for range_name in ranges])
+
+  def update_cell(self, row, col, value):
+    return self.simulate("update_cell", True, lambda: self.set_cell(row, col, value))
+
+  def batch_update(self, data, raw=True, value_input_option=None):
+    data = list(data)
+    def write():
+      for update in data:
+        row_start, _, col_start, _ = self.range_bounds(update["range"])
+        for i, line in enumerate(update["values"]):
+          for j, value in enumerate(line):
+            self.set_cell(row_start+i, col_start+j, value)
+    return self.simulate("batch_update", True, write)
+
+  def apply_format(self, range_name, cell_format):
+    row_start, row_end, col_start, col_end = self.range_bounds(range_name)
+    for row in range(row_start, row_end+1):
+      for col in range(col_start, col_end+1):
+        merged_format = dict(self.formats.get((row, col), {}))
+        merged_format.update(cell_format)
+        self.formats[(row, col)] = merged_format
+
+  def format(self, ranges, format):
+    if isinstance(ranges, str):
+      ranges = [ranges]
+    def write():
+      for range_name in ranges:
+        self.apply_format(range_name, format)
+    return self.simulate("format", True, write)
+
+  def batch_format(self, formats):
+    formats = list(formats)
+    def write():
+      for cell_format in formats:
+        self.apply_format(cell_format["range"], cell_format["format"])
+    return self.simulate("batch_format", True, write)
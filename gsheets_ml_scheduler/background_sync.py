@@ -0,0 +1,112 @@
+import threading
+
+class BackgroundConfigSync(threading.Thread):
+  def __init__(self, scheduler, min_interval_s=5.0, max_interval_s=60.0, backoff_factor=1.5, callback=None):
+    """
+    scheduler (GSheetsMLScheduler): The scheduler of the running run, use scheduler.start_background_sync() rather than this constructor
+    min_interval_s (float, optional): Polling interval right after a config change
+    max_interval_s (float, optional): The interval grows by backoff_factor after each poll without change, up to max_interval_s
+    backoff_factor (float, optional): See max_interval_s
+    callback (function, optional): callback(updated_config, changed_keys) is called from the background thread after each poll that found changes
+
+    Polls the line of the running run in a daemon thread and pushes the status writes given to set_status()
+    Each poll holds scheduler.lock and sends its writes, even with auto_flush=False
+    The training loop reads the latest merged config (hardcoded_default_config applied) from `config` at zero latency:
+    the snapshot is a tuple replaced in a single assignment, so reading it needs no lock
+    """
+    super().__init__(daemon=True)
+    self.scheduler = scheduler
+    self.min_interval_s = min_interval_s
+    self.max_interval_s = max_interval_s
+    self.backoff_factor = backoff_factor
+    self.callback = callback
+
+    self.interval_s = min_interval_s
+    self.stop_event = threading.Event()
+    self.lock = threading.Lock() # Only guards pending_status, snapshot and changed_keys, never held during network calls
+    self.run_id = scheduler.currently_running_run_id
+    self.pending_status = None
+    self.changed_keys = [] # Changed keys not consumed by consume_updates() yet
+    self.nb_polls = 0
+    self.nb_errors = 0
+
+    config = scheduler.currently_running_config
+    if scheduler.hardcoded_default_config is not None:
+      config = scheduler.complete_missing_config_params(config, scheduler.hardcoded_default_config)
+    self.snapshot = (config, 0) # (latest merged config, number of polls that produced it)
+
+  @property
+  def config(self):
+    return self.snapshot[0]
+
+  def set_status(self, new_status_str):
+    """
+    Non-blocking: the status is written by the next poll. If set several times in between, only the last one is written
+    """
+    with self.lock:
+      self.pending_status = new_status_str
+
+  def consume_updates(self):
+    """
+    Returns: (updated_config, changed_keys) like check_for_config_updates, with the keys changed since the previous consume_updates()
+    """
+    with self.lock:
+      changed_keys = self.changed_keys
+      self.changed_keys = []
+      return self.snapshot[0], changed_keys
+
+  def acquire_scheduler_lock(self, wait_s=0.05):
+    """
+    Returns: False if stop() was called before scheduler.lock was free: the thread calling stop() may hold it, stop_background_sync then writes the pending status
+    """
+    while not self.scheduler.lock.acquire(timeout=wait_s):
+      if self.stop_event.is_set():
+        return False
+    return True
+
+  def sync_once(self):
+    if not self.acquire_scheduler_lock():
+      return
+    with self.lock:
+      new_status_str = self.pending_status
+      self.pending_status = None
+
+    try:
+      updated_config, changed_keys = self.scheduler.poll_config_updates(new_status_str, flush=True)
+    except Exception as error:
+      self.nb_errors += 1
+      print(f"Background config sync error: {error}")
+      with self.lock:
+        if self.pending_status is None: # Send it again with the next poll
+          self.pending_status = new_status_str
+      self.interval_s = self.max_interval_s
+      return
+    finally:
+      self.scheduler.lock.release()
+
+    with self.lock: # consume_updates never sees the new snapshot without its changed keys
+      self.nb_polls += 1
+      self.snapshot = (updated_config, self.nb_polls)
+      self.changed_keys += [key for key in changed_keys if key not in self.changed_keys]
+    if len(changed_keys) > 0:
+      self.interval_s = self.min_interval_s
+      if self.callback is not None:
+        self.callback(updated_config, changed_keys)
+    else:
+      self.interval_s = min(self.max_interval_s, self.interval_s*self.backoff_factor)
+
+  def next_wait_s(self):
+    if self.pending_status is not None:
+      return min(self.interval_s, self.min_interval_s)
+    return self.interval_s
+
+  def run(self):
+    while not self.stop_event.wait(self.next_wait_s()):
+      self.sync_once()
+    if self.pending_status is not None: # Last status given before stop()
+      self.sync_once()
+
+  def stop(self):
+    self.stop_event.set()
+    if self.is_alive() and threading.current_thread() is not self:
+      self.join()
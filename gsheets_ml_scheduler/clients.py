@@ -0,0 +1,86 @@
+import os
+import threading
+
+CLIENTS = {} # CLIENTS[credentials key] = authorized gspread client
+SPREADSHEETS = {} # SPREADSHEETS[(credentials key, url)] = SharedSpreadsheet
+LOCK = threading.Lock() # Held during the login, so that schedulers created in parallel don't open several Colab popups
+
+def credentials_key(service_account_json_path):
+  if service_account_json_path is None:
+    return ("colab",)
+  return ("service_account", os.path.abspath(service_account_json_path))
+
+def authorize(service_account_json_path):
+  """
+  Returns: a new gspread client, see GSheetsMLScheduler.login_and_get_sheets
+  gspread, google-auth and the Colab modules are only imported here: they take a few hundred milliseconds to import
+  """
+  import gspread
+
+  if service_account_json_path is None: # Use Google Docs Sheets API through Colab
+    try:
+      from google.colab import auth as colab_auth
+      from google.auth import default as google_auth_default
+    except:
+      print("This isn't running on Colab. Outside of Colab, you must use 'service_account_json_path' to authenticate")
+      raise(Exception("NotColabNorServiceAccountError"))
+    colab_auth.authenticate_user() # That line is the only part that is Colab specific. Popup that asks for the right to modify a Google Account
+    credentials, _ = google_auth_default()
+    return gspread.authorize(credentials)
+  # Use Google Docs Sheets API with a Google Service Account key
+  return gspread.service_account(filename=service_account_json_path)
+
+def get_client(service_account_json_path=None):
+  """
+  Returns: the authorized gspread client of these credentials, created by the first call of the process
+  """
+  key = credentials_key(service_account_json_path)
+  with LOCK:
+    if key not in CLIENTS:
+      CLIENTS[key] = authorize(service_account_json_path)
+    return CLIENTS[key]
+
+def open_spreadsheet(gsheets_file_url, service_account_json_path=None):
+  """
+  Returns: the SharedSpreadsheet of that URL, opened by the first call of the process with these credentials
+  All the schedulers and run writers of a process share it: one login, one open_by_url, one metadata read per worksheet
+  """
+  client = get_client(service_account_json_path)
+  key = (credentials_key(service_account_json_path), gsheets_file_url)
+  with LOCK:
+    if key not in SPREADSHEETS:
+      SPREADSHEETS[key] = SharedSpreadsheet(client.open_by_url(gsheets_file_url))
+    return SPREADSHEETS[key]
+
+def clear_cache():
+  """
+  Forgets the clients and spreadsheets, the next scheduler logs in again (e.g. after the credentials were revoked)
+  """
+  with LOCK:
+    CLIENTS.clear()
+    SPREADSHEETS.clear()
+
+class SharedSpreadsheet():
+  def __init__(self, spreadsheet):
+    """
+    Wraps a gspread Spreadsheet: get_worksheet(index) only reads the spreadsheet metadata the first time for each index
+    Worksheets keep their id when tabs are renamed or moved, but call worksheets() to see the tabs added since
+    """
+    self.spreadsheet = spreadsheet
+    self.worksheets_by_index = {}
+    self.lock = threading.Lock()
+
+  def get_worksheet(self, index):
+    with self.lock:
+      if index not in self.worksheets_by_index:
+        self.worksheets_by_index[index] = self.spreadsheet.get_worksheet(index)
+      return self.worksheets_by_index[index]
+
+  def worksheets(self, *args, **kwargs):
+    sheets = self.spreadsheet.worksheets(*args, **kwargs)
+    with self.lock:
+      self.worksheets_by_index = dict(enumerate(sheets))
+    return sheets
+
+  def __getattr__(self, name):
+    return getattr(self.spreadsheet, name)
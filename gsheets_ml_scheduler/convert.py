@@ -0,0 +1,85 @@
+from array import array
+
+from .run_table import INT64_MAX, INT64_MIN
+
+MIN_VECTORIZED_COLUMN_SIZE = 64 # Below that, a plain Python loop over the memo is faster than factorizing
+
+def convert_str_to_bool_int_float_str(str_point_format):
+  """
+  Convert raw data str to bool/int/float/str. Hex isn't handled, nor other exotic types
+  The number decimal separator must be a point
+  """
+  if str_point_format == '':
+    return str_point_format
+
+  str_lower_case = str_point_format.lower() # Boolean
+  if str_lower_case == 'true':
+    return True
+  if str_lower_case == 'false':
+    return False
+
+  if str_point_format.isdecimal(): # Positive integer
+    try:
+      return int(str_point_format)
+    except:
+      return str_point_format
+
+  if str_point_format[0] == '-' and str_point_format[1:].isdecimal(): # Negative integer
+    try:
+      return int(str_point_format)
+    except:
+      return str_point_format
+
+  try:
+    return float(str_point_format) # We trust python's float convertion
+  except:
+    return str_point_format
+
+class CellConverter():
+  def __init__(self, comma_number_format=False, max_memo_size=100000):
+    """
+    comma_number_format (bool, optional): Replace commas by points before converting, see GSheetsMLScheduler
+    max_memo_size (int, optional): The memo is emptied when it grows above that many distinct raw strings
+
+    Converts raw cell strings with convert_str_to_bool_int_float_str, remembering the result of every distinct raw string
+    The memo is kept across refreshes: grid-search sheets repeat the same few values in thousands of cells
+    """
+    self.comma_number_format = comma_number_format
+    self.max_memo_size = max_memo_size
+    self.memo = {} # memo[raw string] = converted value
+
+  def convert(self, str_value):
+    if str_value in self.memo:
+      return self.memo[str_value]
+    if len(self.memo) >= self.max_memo_size:
+      self.memo = {}
+    point_value = str_value.replace(",", ".") if self.comma_number_format else str_value
+    converted_value = convert_str_to_bool_int_float_str(point_value)
+    self.memo[str_value] = converted_value
+    return converted_value
+
+  def convert_column(self, str_values):
+    """
+    str_values (list): Raw strings of a whole column
+
+    Returns: the converted values, as a typed array("q") or array("d") if the whole column is int64 or float, as a list otherwise
+    The column is factorized with pandas, so only its distinct strings go through convert(),
+    and its type is inferred once from these distinct values
+    """
+    if len(str_values) < MIN_VECTORIZED_COLUMN_SIZE:
+      return [self.convert(str_value) for str_value in str_values]
+
+    import numpy as np # Imported on the first big column only: pandas alone takes ~0.2s to import, small sheets never need it
+    import pandas as pd
+    codes, uniques = pd.factorize(np.asarray(str_values, dtype=object))
+    converted_uniques = [self.convert(str_value) for str_value in uniques]
+
+    unique_types = set(type(value) for value in converted_uniques)
+    if unique_types == {int} and min(converted_uniques) >= INT64_MIN and max(converted_uniques) <= INT64_MAX:
+      return array("q", np.asarray(converted_uniques, dtype=np.int64)[codes].tobytes())
+    if unique_types == {float}:
+      return array("d", np.asarray(converted_uniques, dtype=np.float64)[codes].tobytes())
+
+    converted_uniques_array = np.empty(len(converted_uniques), dtype=object)
+    converted_uniques_array[:] = converted_uniques
+    return converted_uniques_array[codes].tolist()
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import queue
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .scheduler import GSheetsMLScheduler
+
+class StatusReporter():
+  def __init__(self, status_queue, run_id):
+    """
+    Given to the train function of a local worker process: report(new_status_str) sends a status update of its run to the dispatcher,
+    report.log(metrics) sends metrics (see GSheetsMLScheduler.log)
+    """
+    self.status_queue = status_queue
+    self.run_id = run_id
+
+  def __call__(self, new_status_str):
+    self.status_queue.put((self.run_id, new_status_str, None))
+
+  def log(self, metrics):
+    self.status_queue.put((self.run_id, None, dict(metrics)))
+
+def run_in_slot(train_function, run_name, config, report):
+  """
+  Runs in a worker process of the pool
+  Returns: the final status, "done" if train_function returned None, "failed" if it raised an exception
+  """
+  try:
+    final_status = train_function(run_name, config, report)
+  except Exception:
+    traceback.print_exc()
+    return "failed"
+  return "done" if final_status is None else str(final_status)
+
+class LocalDispatcher():
+  def __init__(self, gsheets_file_url, train_function, nb_slots=None, poll_interval_s=1.0, mp_context=None, **scheduler_kwargs):
+    """
+    gsheets_file_url (str): The URL of the Google Sheets file
+    train_function (function): train_function(run_name, config, report) runs one config in a worker process.
+                               report(new_status_str) updates the status of the run in the sheet, report.log(metrics) writes metrics in its "metric_<name>" columns
+                               The returned str (default "done") is written by run_done
+                               It must be picklable: defined at the top level of a module
+    nb_slots (int, optional): Number of runs trained in parallel on this machine (default is the number of CPUs)
+    poll_interval_s (float, optional): Max time between two rounds of status writes
+    mp_context (optional): multiprocessing context of the process pool, e.g. multiprocessing.get_context("spawn") for CUDA
+    scheduler_kwargs: The other arguments of GSheetsMLScheduler (sheet_index, hardcoded_default_config, service_account_json_path, backend...)
+
+    One GSheetsMLScheduler claims runs for all the local slots: local workers never compete with each other through the sheet,
+    the free slots are filled with a single claim_runs() round, and the status updates and run_done writes of all the slots
+    are sent together, at most one value batch update and one format batch update per round
+    """
+    self.train_function = train_function
+    self.nb_slots = nb_slots if nb_slots is not None else os.cpu_count()
+    self.poll_interval_s = poll_interval_s
+    self.mp_context = mp_context
+
+    scheduler_kwargs["auto_flush"] = False # Flushed once per round by the dispatcher
+    self.scheduler = GSheetsMLScheduler(gsheets_file_url, **scheduler_kwargs)
+
+    self.running_futures = {} # running_futures[future] = run_id
+    self.nothing_ready = False # Don't read the sheet again until a slot gets free
+    self.final_statuses = {} # final_statuses[run_name] = status written by run_done
+
+  def run(self):
+    """
+    Trains runs until no run is "ready" and all the slots are idle
+    Returns: final_statuses, a dict run_name -> final status
+    """
+    manager_context = self.mp_context if self.mp_context is not None else multiprocessing
+    with manager_context.Manager() as manager, ProcessPoolExecutor(max_workers=self.nb_slots, mp_context=self.mp_context) as executor:
+      status_queue = manager.Queue()
+      try:
+        while True:
+          self.apply_status_updates(status_queue)
+          self.finish_done_runs(status_queue)
+          self.fill_free_slots(executor, status_queue)
+          self.write_heartbeats()
+          self.scheduler.flush()
+          if len(self.running_futures) == 0:
+            if self.nothing_ready:
+              break
+            continue # All the claims were lost, try the other ready runs
+          wait(list(self.running_futures.keys()), timeout=self.poll_interval_s, return_when=FIRST_COMPLETED)
+      finally:
+        self.scheduler.close()
+    return self.final_statuses
+
+  def apply_status_updates(self, status_queue):
+    """
+    Buffers the statuses reported since the last round, only the last one of each run is written, and passes the metrics to the scheduler
+    The updates of runs that aren't running anymore are dropped, they would overwrite the final status
+    """
+    new_status_strs = {}
+    running_run_ids = set(self.running_futures.values())
+    while True:
+      try:
+        run_id, new_status_str, metrics = status_queue.get_nowait()
+      except queue.Empty:
+        break
+      if run_id not in running_run_ids:
+        continue
+      if metrics is not None:
+        self.scheduler.log(metrics, run_id=run_id)
+      else:
+        new_status_strs[run_id] = new_status_str
+    for run_id, new_status_str in new_status_strs.items():
+      self.scheduler.update_status(new_status_str, flush=False, run_id=run_id)
+
+  def finish_done_runs(self, status_queue):
+    done_futures = [future for future in self.running_futures if future.done()]
+    if len(done_futures) == 0:
+      return
+    self.apply_status_updates(status_queue) # Reported by the done runs before they returned, written before their final status
+    new_status_strs = {}
+    for future in done_futures:
+      run_id = self.running_futures.pop(future)
+      try:
+        new_status_strs[run_id] = future.result()
+      except Exception as error: # The worker process died
+        print(f"Failure, run {self.scheduler.values['run_name'][run_id]} crashed: {error}")
+        new_status_strs[run_id] = "failed"
+      self.final_statuses[self.scheduler.values["run_name"][run_id]] = new_status_strs[run_id]
+    self.scheduler.runs_done(new_status_strs)
+    self.nothing_ready = False
+
+  def write_heartbeats(self):
+    """
+    Keeps the running and queued runs alive with lease_timeout_s (see GSheetsMLScheduler.heartbeat_due), sent with the other writes of the round
+    """
+    for run_id in list(self.running_futures.values()) + list(self.scheduler.prefetched_run_ids):
+      if self.scheduler.heartbeat_due(run_id):
+        self.scheduler.write_heartbeat(run_id)
+
+  def fill_free_slots(self, executor, status_queue):
+    nb_free_slots = self.nb_slots - len(self.running_futures)
+    if nb_free_slots == 0 or self.nothing_ready:
+      return
+    self.scheduler.claim_runs(nb_free_slots)
+    nb_started = 0
+    while len(self.scheduler.prefetched_run_ids) > 0:
+      run_id, config = self.scheduler.start_prefetched_run()
+      if run_id is None:
+        break # The queued runs left were taken over
+      run_name = self.scheduler.values["run_name"][run_id]
+      future = executor.submit(run_in_slot, self.train_function, run_name, config, StatusReporter(status_queue, run_id))
+      self.running_futures[future] = run_id
+      nb_started += 1
+    if nb_started == 0 and self.scheduler.next_claimable_run() is None:
+      self.nothing_ready = True
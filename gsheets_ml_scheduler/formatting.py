@@ -0,0 +1,54 @@
+from .a1_notation import rowcol_to_a1
+
+class SheetFormatter():
+  def __init__(self, write_buffer, cosmetics=True):
+    """
+    write_buffer (SheetWriteBuffer): The format changes are queued there, and sent by its flush() as one batch_format
+    cosmetics (bool, optional): Set to False to never format anything (headless fleets), only the values are written
+
+    Remembers the format each cell was last given by this worker: format_cells only queues the cells whose format changes,
+    and the changed cells of a line that get the same format are merged into one range (one repeatCell instead of one per cell)
+    """
+    self.write_buffer = write_buffer
+    self.cosmetics = cosmetics
+    self.applied_formats = {} # applied_formats[row][col] = {format field: value} last queued for that cell
+
+  def format_cells(self, row, cols, cell_format):
+    """
+    row (int): The line, (1,1) is the top left cell as in gspread
+    cols (iterable): The columns of the cells to format
+    cell_format (dict): Same as gspread format, for example {"backgroundColor": color}
+
+    Returns: the number of cells whose format changed
+    """
+    if not self.cosmetics:
+      return 0
+    line_formats = self.applied_formats.setdefault(row, {})
+    changed_cols = []
+    for col in sorted(set(cols)):
+      applied_format = line_formats.setdefault(col, {})
+      if any(applied_format.get(field) != value for field, value in cell_format.items()):
+        applied_format.update(cell_format)
+        changed_cols.append(col)
+
+    span_start = None
+    for i, col in enumerate(changed_cols):
+      if span_start is None:
+        span_start = col
+      if i+1 == len(changed_cols) or changed_cols[i+1] != col+1: # End of a span of adjacent cells
+        range_name = rowcol_to_a1(row, span_start) if span_start == col else rowcol_to_a1(row, span_start) + ":" + rowcol_to_a1(row, col)
+        self.write_buffer.format(range_name, cell_format)
+        span_start = None
+    return len(changed_cols)
+
+  def format_line(self, row, nb_cols, cell_format):
+    """
+    Same as format_cells, for the nb_cols first cells of the line
+    """
+    return self.format_cells(row, range(1, nb_cols+1), cell_format)
+
+  def forget_line(self, row):
+    """
+    The next formats of that line are all sent, e.g. when a new run starts on it (someone may have reformatted it by hand)
+    """
+    self.applied_formats.pop(row, None)
@@ -0,0 +1,195 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+from .rate_limiter import FORMAT_METHODS, READ_METHODS, SPREADSHEET_READ_METHODS, WRITE_METHODS
+
+LATENCY_BUCKETS_S = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Upper bounds of the histogram buckets, the last bucket is above 10s
+QUOTA_WINDOW_S = 60.0 # The Sheets API quotas are per minute
+
+def payload_size(value):
+  """
+  Approximate size in bytes of the cell values of a request or a response (the JSON around them isn't counted)
+  """
+  if isinstance(value, str):
+    return len(value.encode("utf-8"))
+  if isinstance(value, dict):
+    return sum(payload_size(key) + payload_size(item) for key, item in value.items())
+  if isinstance(value, (list, tuple)):
+    return sum(payload_size(item) for item in value)
+  if value is None:
+    return 0
+  if isinstance(value, (bool, int, float)):
+    return len(str(value))
+  return 0 # Worksheet objects and other non-cell values
+
+class OperationStats():
+  def __init__(self):
+    self.count = 0
+    self.errors = 0
+    self.bytes_sent = 0
+    self.bytes_received = 0
+    self.total_latency_s = 0.0
+    self.max_latency_s = 0.0
+    self.latency_histogram = [0]*(len(LATENCY_BUCKETS_S)+1)
+
+  def snapshot(self):
+    return {
+      "count": self.count,
+      "errors": self.errors,
+      "bytes_sent": self.bytes_sent,
+      "bytes_received": self.bytes_received,
+      "total_latency_s": self.total_latency_s,
+      "mean_latency_s": self.total_latency_s/self.count if self.count > 0 else 0.0,
+      "max_latency_s": self.max_latency_s,
+      "latency_histogram": dict(zip([f"<={bound}s" for bound in LATENCY_BUCKETS_S] + [f">{LATENCY_BUCKETS_S[-1]}s"], self.latency_histogram)),
+    }
+
+class ApiStats():
+  def __init__(self):
+    """
+    Records every Sheets API call of the schedulers/run writers it is given to (instrumentation=api_stats):
+    per-operation counts, errors, payload bytes, latency histograms, and the calls of the last minute against the read/write quotas
+    Local work (e.g. parsing in download_data) is recorded separately with record_local()
+
+    hooks: functions called with an event dict after each API call, for example to log to Weights & Biases
+    Nothing is recorded when a scheduler has no instrumentation: the backend isn't wrapped at all
+    """
+    self.lock = threading.Lock()
+    self.operations = {} # operations[operation_name] = OperationStats
+    self.local_timings = {} # local_timings[name] = [count, total_s]
+    self.recent_calls = {"read": deque(), "write": deque()} # Call times of the last QUOTA_WINDOW_S
+    self.hooks = []
+    self.start_time = time.monotonic()
+
+  def add_hook(self, hook):
+    """
+    hook (function): hook(event) is called after each API call with event = {"operation", "kind", "latency_s", "bytes_sent", "bytes_received", "error"}
+                     kind is "read", "write" or "format". Hooks run in the thread of the call, keep them fast
+    """
+    self.hooks.append(hook)
+
+  def record(self, operation_name, kind, latency_s, bytes_sent, bytes_received, error=None):
+    now = time.monotonic()
+    with self.lock:
+      operation = self.operations.get(operation_name)
+      if operation is None:
+        operation = self.operations[operation_name] = OperationStats()
+      operation.count += 1
+      operation.errors += error is not None
+      operation.bytes_sent += bytes_sent
+      operation.bytes_received += bytes_received
+      operation.total_latency_s += latency_s
+      operation.max_latency_s = max(operation.max_latency_s, latency_s)
+      operation.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS_S, latency_s)] += 1
+
+      recent_calls = self.recent_calls["read" if kind == "read" else "write"]
+      recent_calls.append(now)
+      while recent_calls[0] < now - QUOTA_WINDOW_S:
+        recent_calls.popleft()
+
+    if len(self.hooks) > 0:
+      event = {"operation": operation_name, "kind": kind, "latency_s": latency_s, "bytes_sent": bytes_sent, "bytes_received": bytes_received, "error": error}
+      for hook in self.hooks:
+        hook(event)
+
+  def record_local(self, name, duration_s):
+    with self.lock:
+      timing = self.local_timings.setdefault(name, [0, 0.0])
+      timing[0] += 1
+      timing[1] += duration_s
+
+  def calls_last_minute(self):
+    now = time.monotonic()
+    with self.lock:
+      return {kind: sum(1 for call_time in calls if call_time >= now - QUOTA_WINDOW_S) for kind, calls in self.recent_calls.items()}
+
+  def stats(self):
+    """
+    Returns: a snapshot dict {"operations", "local", "totals", "calls_last_minute", "uptime_s"}, safe to keep or log
+    """
+    calls_last_minute = self.calls_last_minute()
+    with self.lock:
+      operations = {operation_name: operation.snapshot() for operation_name, operation in self.operations.items()}
+      local = {name: {"count": count, "total_s": total_s} for name, (count, total_s) in self.local_timings.items()}
+    totals = {
+      "calls": sum(operation["count"] for operation in operations.values()),
+      "errors": sum(operation["errors"] for operation in operations.values()),
+      "bytes_sent": sum(operation["bytes_sent"] for operation in operations.values()),
+      "bytes_received": sum(operation["bytes_received"] for operation in operations.values()),
+      "network_s": sum(operation["total_latency_s"] for operation in operations.values()),
+    }
+    return {"operations": operations, "local": local, "totals": totals, "calls_last_minute": calls_last_minute, "uptime_s": time.monotonic() - self.start_time}
+
+def operation_kind(name):
+  if name in READ_METHODS or name in SPREADSHEET_READ_METHODS:
+    return "read"
+  if name in WRITE_METHODS:
+    return "write"
+  if name in FORMAT_METHODS:
+    return "format"
+  return None
+
+class InstrumentedWorksheet():
+  def __init__(self, sheet, api_stats):
+    """
+    Wraps a worksheet: its API calls are recorded in api_stats, the other attributes are the ones of the worksheet
+    """
+    self.sheet = sheet
+    self.api_stats = api_stats
+
+  def __getattr__(self, name):
+    attribute = getattr(self.sheet, name)
+    kind = operation_kind(name)
+    if kind is None:
+      return attribute
+
+    def instrumented_call(*args, **kwargs):
+      return timed_call(self.api_stats, name, kind, attribute, *args, **kwargs)
+    return instrumented_call
+
+def timed_call(api_stats, operation_name, kind, function, *args, **kwargs):
+  bytes_sent = payload_size(args) + payload_size(kwargs) if kind != "read" else 0
+  start_time = time.perf_counter()
+  try:
+    result = function(*args, **kwargs)
+  except Exception as error:
+    api_stats.record(operation_name, kind, time.perf_counter() - start_time, bytes_sent, 0, error=error)
+    raise
+  latency_s = time.perf_counter() - start_time
+  api_stats.record(operation_name, kind, latency_s, bytes_sent, payload_size(result) if kind == "read" else 0)
+  return result
+
+class InstrumentedSpreadsheet():
+  def __init__(self, spreadsheet, api_stats):
+    """
+    Wraps a spreadsheet (gspread Spreadsheet or InMemorySpreadsheet): its worksheets are wrapped in InstrumentedWorksheet
+    """
+    self.spreadsheet = spreadsheet
+    self.api_stats = api_stats
+
+  def worksheets(self, *args, **kwargs):
+    sheets = timed_call(self.api_stats, "fetch_sheet_metadata", "read", self.spreadsheet.worksheets, *args, **kwargs)
+    return [InstrumentedWorksheet(sheet, self.api_stats) for sheet in sheets]
+
+  def get_worksheet(self, index):
+    sheet = timed_call(self.api_stats, "fetch_sheet_metadata", "read", self.spreadsheet.get_worksheet, index)
+    return InstrumentedWorksheet(sheet, self.api_stats)
+
+  def __getattr__(self, name):
+    attribute = getattr(self.spreadsheet, name)
+    if name not in SPREADSHEET_READ_METHODS:
+      return attribute
+
+    def instrumented_call(*args, **kwargs):
+      return timed_call(self.api_stats, name, "read", attribute, *args, **kwargs)
+    return instrumented_call
+
+def with_instrumentation(spreadsheet, api_stats):
+  """
+  Returns: spreadsheet wrapped in an InstrumentedSpreadsheet, or as is if api_stats is None
+  """
+  if api_stats is None:
+    return spreadsheet
+  return InstrumentedSpreadsheet(spreadsheet, api_stats)
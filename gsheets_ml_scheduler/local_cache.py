@@ -0,0 +1,82 @@
+import json
+import sqlite3
+import threading
+import time
+
+from .rate_limiter import error_code
+
+def is_permanent_error(error):
+  """
+  True for API errors that won't go away by sending the same request later (bad request, no access...), False for network errors, 429 and 5xx
+  """
+  code = error_code(error)
+  return code is not None and 400 <= code < 500 and code != 429
+
+class LocalCache():
+  def __init__(self, path):
+    """
+    path (str): SQLite file of the cache, it is created if needed. Several workers of one machine can share it
+
+    On-disk cache of a scheduler:
+      - snapshots: the raw cells of the last full download of each worksheet, so that a new scheduler starts from it and only downloads what changed
+      - journal: the status/format writes that couldn't be sent, replayed by the next flush (of this process or of the next one)
+    """
+    self.path = path
+    self.lock = threading.Lock() # The background sync thread flushes too
+    self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+    with self.lock, self.connection:
+      self.connection.execute("CREATE TABLE IF NOT EXISTS snapshots (url TEXT, sheet_index INTEGER, data TEXT, saved_at REAL, PRIMARY KEY (url, sheet_index))")
+      self.connection.execute("CREATE TABLE IF NOT EXISTS journal (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, sheet_index INTEGER, worker_name TEXT, "
+                              "row INTEGER, key TEXT, range_name TEXT, payload TEXT, created_at REAL)")
+
+  def save_snapshot(self, url, sheet_index, data):
+    with self.lock, self.connection:
+      self.connection.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", (url, sheet_index, json.dumps(data), time.time()))
+
+  def load_snapshot(self, url, sheet_index):
+    """
+    Returns: data, saved_at. The raw cells (like get_all_values) and the time of the download, (None, None) if there is no snapshot
+    """
+    with self.lock:
+      line = self.connection.execute("SELECT data, saved_at FROM snapshots WHERE url = ? AND sheet_index = ?", (url, sheet_index)).fetchone()
+    if line is None:
+      return None, None
+    return json.loads(line[0]), line[1]
+
+  def journal_writes(self, url, sheet_index, worker_name, values, formats):
+    """
+    values (list): (row, key, value) cell writes, the column is stored by name in case columns move in the meantime
+    formats (list): (row, range_name, format dict) format writes
+    """
+    now = time.time()
+    lines = [(url, sheet_index, worker_name, row, key, None, json.dumps(value), now) for row, key, value in values]
+    lines += [(url, sheet_index, worker_name, row, None, range_name, json.dumps(cell_format), now) for row, range_name, cell_format in formats]
+    with self.lock, self.connection:
+      self.connection.executemany("INSERT INTO journal (url, sheet_index, worker_name, row, key, range_name, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", lines)
+
+  def load_journal(self, url, sheet_index, worker_name=None):
+    """
+    worker_name (str, optional): Only the writes of that worker, default is the writes of all the workers
+
+    Returns: the journaled writes in the order they were made, as dicts {"id", "worker_name", "row", "key", "range_name", "payload"}
+    """
+    query = "SELECT id, worker_name, row, key, range_name, payload FROM journal WHERE url = ? AND sheet_index = ?"
+    parameters = (url, sheet_index)
+    if worker_name is not None:
+      query += " AND worker_name = ?"
+      parameters += (worker_name,)
+    with self.lock:
+      lines = self.connection.execute(query + " ORDER BY id", parameters).fetchall()
+    return [{"id": line[0], "worker_name": line[1], "row": line[2], "key": line[3], "range_name": line[4], "payload": json.loads(line[5])} for line in lines]
+
+  def delete_journal_entries(self, entry_ids):
+    with self.lock, self.connection:
+      self.connection.executemany("DELETE FROM journal WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+  def journal_size(self, url, sheet_index):
+    with self.lock:
+      return self.connection.execute("SELECT COUNT(*) FROM journal WHERE url = ? AND sheet_index = ?", (url, sheet_index)).fetchone()[0]
+
+  def close(self):
+    with self.lock:
+      self.connection.close()
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+READ_PRIORITY = 0
+WRITE_PRIORITY = 1
+FORMAT_PRIORITY = 2 # Cosmetic, waits while reads are queued
+
+RETRYABLE_ERROR_CODES = (429, 500, 502, 503, 504)
+
+READ_METHODS = ("get_all_values", "get_all_records", "get_values", "row_values", "col_values", "get", "batch_get", "acell", "cell")
+WRITE_METHODS = ("update_cell", "update_cells", "update", "batch_update", "append_row", "append_rows", "add_rows", "add_cols", "insert_row", "insert_rows", "delete_rows", "clear")
+FORMAT_METHODS = ("format", "batch_format")
+SPREADSHEET_READ_METHODS = ("get_change_marker", "get_lastUpdateTime")
+
+def error_code(error):
+  """
+  Returns: the HTTP code of a gspread APIError (or of an InMemorySpreadsheet QuotaExceededError), None for other errors
+  """
+  code = getattr(error, "code", None)
+  if isinstance(code, int) and code > 0:
+    return code
+  response = getattr(error, "response", None) # gspread sets code to -1 when the error body isn't JSON
+  return getattr(response, "status_code", None)
+
+class TokenBucket():
+  def __init__(self, rate_per_minute, burst=None):
+    """
+    rate_per_minute (float): Sustained number of calls per minute
+    burst (int, optional): Max number of calls sent at once after an idle period (default is rate_per_minute/10, at least 1)
+    """
+    self.rate_per_s = rate_per_minute/60
+    self.capacity = burst if burst is not None else max(1, int(rate_per_minute/10))
+    self.tokens = float(self.capacity)
+    self.last_time = time.monotonic()
+
+  def refill(self):
+    now = time.monotonic()
+    self.tokens = min(self.capacity, self.tokens + (now - self.last_time)*self.rate_per_s)
+    self.last_time = now
+
+  def wait_time(self):
+    """
+    Returns: the time until a token is available, 0 if one is available now
+    """
+    self.refill()
+    if self.tokens >= 1:
+      return 0.0
+    return (1 - self.tokens)/self.rate_per_s
+
+  def take(self):
+    self.tokens -= 1
+
+  def drain(self):
+    """
+    After a 429 the server quota is spent: every caller waits for the bucket to refill
+    """
+    self.refill()
+    self.tokens = min(self.tokens, 0.0)
+
+class QuotaRateLimiter():
+  def __init__(self, read_quota_per_minute=60, write_quota_per_minute=60, burst=None, max_retries=6, base_backoff_s=1.0, max_backoff_s=64.0):
+    """
+    read_quota_per_minute (float, optional): Read requests per minute (default is the Sheets API per-user quota)
+    write_quota_per_minute (float, optional): Write requests per minute, format calls included (default is the Sheets API per-user quota)
+    burst (int, optional): See TokenBucket
+    max_retries (int, optional): A call that keeps failing with 429 or 5xx errors raises its error after that many retries
+    base_backoff_s (float, optional): The n-th retry waits a random time in [0, min(max_backoff_s, base_backoff_s*2**n)] (exponential backoff, full jitter)
+    max_backoff_s (float, optional): See base_backoff_s
+
+    Token buckets shared by all the schedulers and run writers of the process (see get_shared_rate_limiter), so that calls are spread
+    instead of being rejected by the Sheets API. Waiting calls go by priority: reads, then writes, then format calls, which also wait while any read is queued
+    """
+    self.buckets = {"read": TokenBucket(read_quota_per_minute, burst), "write": TokenBucket(write_quota_per_minute, burst)}
+    self.max_retries = max_retries
+    self.base_backoff_s = base_backoff_s
+    self.max_backoff_s = max_backoff_s
+
+    self.condition = threading.Condition()
+    self.waiting = [] # Heap of (priority, arrival number, bucket name)
+    self.arrival_numbers = itertools.count()
+    self.random = random.Random()
+
+    self.nb_calls = 0
+    self.nb_retries = 0
+    self.queueing_delay_s = 0.0 # Total time spent waiting for a token
+    self.recent_queueing_delays = deque(maxlen=100)
+
+  def is_next(self, entry):
+    """
+    entry is the first waiting call of its bucket, and no read waits before a format call
+    """
+    priority, _, bucket_name = entry
+    if priority == FORMAT_PRIORITY and any(other[0] == READ_PRIORITY for other in self.waiting):
+      return False
+    return min(other for other in self.waiting if other[2] == bucket_name) == entry
+
+  def acquire(self, bucket_name, priority):
+    """
+    Blocks until the call can be sent
+    Returns: the time it waited
+    """
+    start_time = time.monotonic()
+    with self.condition:
+      entry = (priority, next(self.arrival_numbers), bucket_name)
+      heapq.heappush(self.waiting, entry)
+      bucket = self.buckets[bucket_name]
+      while True:
+        if self.is_next(entry):
+          wait_time = bucket.wait_time()
+          if wait_time == 0:
+            break
+          self.condition.wait(wait_time)
+        else:
+          self.condition.wait()
+      bucket.take()
+      self.waiting.remove(entry)
+      heapq.heapify(self.waiting)
+      self.condition.notify_all()
+
+    queueing_delay = time.monotonic() - start_time
+    self.nb_calls += 1
+    self.queueing_delay_s += queueing_delay
+    self.recent_queueing_delays.append(queueing_delay)
+    return queueing_delay
+
+  def call(self, function, bucket_name, priority, *args, **kwargs):
+    """
+    Sends function(*args, **kwargs) when the quota allows it, retries 429 and 5xx errors with jittered exponential backoff
+    """
+    for retry in range(self.max_retries+1):
+      self.acquire(bucket_name, priority)
+      try:
+        return function(*args, **kwargs)
+      except Exception as error:
+        code = error_code(error)
+        if code not in RETRYABLE_ERROR_CODES or retry == self.max_retries:
+          raise
+        if code == 429:
+          with self.condition:
+            self.buckets[bucket_name].drain()
+        self.nb_retries += 1
+        backoff_s = self.random.uniform(0, min(self.max_backoff_s, self.base_backoff_s*2**retry))
+        print(f"Sheets API error {code}, retry {retry+1}/{self.max_retries} in {backoff_s:.1f}s")
+        time.sleep(backoff_s)
+
+  def mean_queueing_delay(self):
+    """
+    Mean time the recent calls waited for a token. Close to 0 means the quotas aren't limiting: more workers can be added
+    """
+    if len(self.recent_queueing_delays) == 0:
+      return 0.0
+    return sum(self.recent_queueing_delays)/len(self.recent_queueing_delays)
+
+  def stats(self):
+    return {
+      "nb_calls": self.nb_calls,
+      "nb_retries": self.nb_retries,
+      "queueing_delay_s": self.queueing_delay_s,
+      "mean_queueing_delay_s": self.mean_queueing_delay(),
+      "nb_waiting": len(self.waiting),
+    }
+
+shared_rate_limiter = None
+shared_rate_limiter_lock = threading.Lock()
+
+def get_shared_rate_limiter():
+  """
+  Returns: the QuotaRateLimiter shared by the whole process, created with the default quotas on first use
+  """
+  global shared_rate_limiter
+  with shared_rate_limiter_lock:
+    if shared_rate_limiter is None:
+      shared_rate_limiter = QuotaRateLimiter()
+    return shared_rate_limiter
+
+class RateLimitedWorksheet():
+  def __init__(self, sheet, rate_limiter):
+    """
+    Wraps a worksheet: its API calls go through rate_limiter, the other attributes are the ones of the worksheet
+    """
+    self.sheet = sheet
+    self.rate_limiter = rate_limiter
+
+  def __getattr__(self, name):
+    attribute = getattr(self.sheet, name)
+    if name in READ_METHODS:
+      bucket_name, priority = "read", READ_PRIORITY
+    elif name in WRITE_METHODS:
+      bucket_name, priority = "write", WRITE_PRIORITY
+    elif name in FORMAT_METHODS:
+      bucket_name, priority = "write", FORMAT_PRIORITY
+    else:
+      return attribute
+
+    def rate_limited_call(*args, **kwargs):
+      return self.rate_limiter.call(attribute, bucket_name, priority, *args, **kwargs)
+    return rate_limited_call
+
+class RateLimitedSpreadsheet():
+  def __init__(self, spreadsheet, rate_limiter):
+    """
+    Wraps a spreadsheet (gspread Spreadsheet or InMemorySpreadsheet): its worksheets are wrapped in RateLimitedWorksheet
+    """
+    self.spreadsheet = spreadsheet
+    self.rate_limiter = rate_limiter
+
+  def worksheets(self, *args, **kwargs):
+    sheets = self.rate_limiter.call(self.spreadsheet.worksheets, "read", READ_PRIORITY, *args, **kwargs)
+    return [RateLimitedWorksheet(sheet, self.rate_limiter) for sheet in sheets]
+
+  def get_worksheet(self, index):
+    sheet = self.rate_limiter.call(self.spreadsheet.get_worksheet, "read", READ_PRIORITY, index)
+    return RateLimitedWorksheet(sheet, self.rate_limiter)
+
+  def __getattr__(self, name):
+    attribute = getattr(self.spreadsheet, name)
+    if name not in SPREADSHEET_READ_METHODS:
+      return attribute
+
+    def rate_limited_call(*args, **kwargs):
+      return self.rate_limiter.call(attribute, "read", READ_PRIORITY, *args, **kwargs)
+    return rate_limited_call
+
+def with_rate_limiter(spreadsheet, rate_limiter):
+  """
+  Returns: spreadsheet wrapped in a RateLimitedSpreadsheet, or as is if rate_limiter is None or False
+  """
+  if rate_limiter is None or rate_limiter is False:
+    return spreadsheet
+  return RateLimitedSpreadsheet(spreadsheet, rate_limiter)
@@ -0,0 +1,316 @@
+import heapq
+import time
+from array import array
+
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+ARRAY_TYPES = {"q": int, "d": float}
+REQUIREMENT_PREFIX = "requires_" # "requires_<resource>" columns hold the resources a run needs, see GSheetsMLScheduler capabilities
+INDEXED_KEYS = ("worker_name", "priority", "heartbeat") # With the "requires_<resource>" columns, the writes of these columns update the index
+MIN_COMPACTED_ENTRIES = 64 # The heaps are rebuilt when they hold more than 2*nb_runs + MIN_COMPACTED_ENTRIES entries, most of them stale
+
+def column_typecode(values):
+  """
+  "q" if all values are int64, "d" if all values are float, None otherwise (bools, strings and empty cells stay Python objects)
+  """
+  if len(values) == 0:
+    return None
+  value_types = set(type(value) for value in values)
+  if value_types == {int}:
+    if min(values) >= INT64_MIN and max(values) <= INT64_MAX:
+      return "q"
+    return None
+  if value_types == {float}:
+    return "d"
+  return None
+
+class TypedColumn():
+  def __init__(self, values):
+    """
+    values (list or array): The converted values of the column
+    A column of converted config values, indexed by run_id
+    Homogeneous int or float columns are stored in a typed array (8 bytes per value instead of a Python object), the others in a list
+    A value that doesn't fit the array type turns the column back into a list
+    """
+    if isinstance(values, array): # Already typed, see CellConverter.convert_column
+      self.data = values
+      return
+    typecode = column_typecode(values)
+    self.data = array(typecode, values) if typecode is not None else list(values)
+
+  def fits(self, value):
+    if not isinstance(self.data, array):
+      return True
+    if type(value) is not ARRAY_TYPES[self.data.typecode]:
+      return False
+    return self.data.typecode == "d" or INT64_MIN <= value <= INT64_MAX
+
+  def __setitem__(self, run_id, value):
+    if not self.fits(value):
+      self.data = list(self.data)
+    self.data[run_id] = value
+
+  def append(self, value):
+    if not self.fits(value):
+      self.data = list(self.data)
+    self.data.append(value)
+
+  def __getitem__(self, run_id):
+    if isinstance(run_id, slice):
+      return list(self.data[run_id])
+    return self.data[run_id]
+
+  def __len__(self):
+    return len(self.data)
+
+  def __iter__(self):
+    return iter(self.data)
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __repr__(self):
+    return repr(list(self))
+
+class StatusColumn():
+  def __init__(self, table, values):
+    """
+    The "status" column: each distinct status string is interned once and the column stores its integer code
+    Writes keep table.rows_by_status (status -> set of run_ids) and the ready run index up to date
+    """
+    self.table = table
+    self.names = [] # names[code] = status string
+    self.name_codes = {} # name_codes[status string] = code
+    self.codes = array("I", [self.code(value) for value in values])
+
+  def code(self, value):
+    if value not in self.name_codes:
+      self.name_codes[value] = len(self.names)
+      self.names.append(value)
+    return self.name_codes[value]
+
+  def __setitem__(self, run_id, value):
+    previous_value = self.names[self.codes[run_id]]
+    if value == previous_value:
+      return
+    self.codes[run_id] = self.code(value)
+    self.table.status_changed(run_id, previous_value, value)
+
+  def append(self, value):
+    self.codes.append(self.code(value))
+
+  def __getitem__(self, run_id):
+    if isinstance(run_id, slice):
+      return [self.names[code] for code in self.codes[run_id]]
+    return self.names[self.codes[run_id]]
+
+  def __len__(self):
+    return len(self.codes)
+
+  def __iter__(self):
+    return (self.names[code] for code in self.codes)
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __repr__(self):
+    return repr(list(self))
+
+class IndexedColumn(list):
+  """
+  The "worker_name", "priority", "heartbeat" and "requires_<resource>" columns, lists whose writes keep the run index up to date
+  """
+  def __init__(self, table, values):
+    super().__init__(values)
+    self.table = table
+
+  def __setitem__(self, run_id, value):
+    if value == self[run_id]:
+      return
+    super().__setitem__(run_id, value)
+    self.table.index_run(run_id)
+
+class RunTable():
+  def __init__(self, key_ids, config_keys, columns, convert=None, reclaim_time=None):
+    """
+    key_ids (dict): Key to column number conversion
+    config_keys (list): Keys of the columns holding config values
+    columns (dict): columns[key] is the list of the values of a column, without the header and defaults lines
+    convert (function, optional): Raw cell string to value conversion of the "priority" and "requires_<resource>" cells, default is convert_str_to_bool_int_float_str
+    reclaim_time (function, optional): reclaim_time(values, run_id) is the time.time() from which a claimed run may be claimable again (expired lease, dead worker), None if never
+                                       values is the dict of the columns of the table. Default is that "ready" runs with a worker_name may always be reclaimed, and no other run
+
+    Compact columnar storage of the run lines (see TypedColumn and StatusColumn)
+    with a secondary index from status to run_ids, so that the next ready unclaimed run is found without scanning the sheet
+    Ready unclaimed runs are grouped by requirements ("requires_<resource>" cells), each group is a heap ordered by "priority" (higher first), then by line
+    The other runs that may be reclaimed are in a heap ordered by reclaim time
+    The index is updated in place whenever the status, worker_name, priority, heartbeat or requirements of a run are written
+    """
+    if convert is None:
+      from .convert import convert_str_to_bool_int_float_str as convert # convert imports this module
+    self.convert = convert
+    self.reclaim_time = reclaim_time if reclaim_time is not None else default_reclaim_time
+    self.config_keys = set(config_keys)
+    self.requirement_keys = [key for key in key_ids if key.startswith(REQUIREMENT_PREFIX)]
+    self.values = {}
+    for key in key_ids:
+      self.values[key] = self.make_column(key, columns[key])
+
+    self.rows_by_status = {} # rows_by_status[status] = set of run_ids
+    for run_id, status in enumerate(self.values["status"]):
+      self.rows_by_status.setdefault(status, set()).add(run_id)
+    self.rebuild_index()
+
+  def make_column(self, key, values):
+    if key == "status":
+      return StatusColumn(self, values)
+    if key in INDEXED_KEYS or key in self.requirement_keys:
+      return IndexedColumn(self, values)
+    if key in self.config_keys:
+      return TypedColumn(values)
+    return list(values)
+
+  def add_column(self, key):
+    """
+    Adds an empty column after the last one (e.g. "heartbeat" or "metric_<name>"), it can't be a config or a "requires_<resource>" column
+    """
+    self.values[key] = self.make_column(key, [""]*self.nb_runs)
+    return self.values[key]
+
+  def rebuild_index(self):
+    """
+    Builds the heaps again from the columns, without their stale entries
+    """
+    self.ready_heaps = {} # ready_heaps[requirements] = min-heap of (-priority, run_id) of the runs that are "ready" with an empty worker_name. Stale entries are skipped lazily
+    self.reclaim_heap = [] # min-heap of (reclaim time, run_id) of the other runs that may be reclaimed, see reclaim_time. Stale entries are skipped lazily
+    self.nb_heap_entries = 0
+    for run_id in range(self.nb_runs):
+      self.index_run(run_id)
+
+  @property
+  def nb_runs(self):
+    return len(self.values["status"])
+
+  def append_run(self, run_values):
+    """
+    run_values (dict): run_values[key] is the value of the new line in the column key
+    """
+    run_id = self.nb_runs
+    for key, column in self.values.items():
+      column.append(run_values[key])
+    self.rows_by_status.setdefault(run_values["status"], set()).add(run_id)
+    self.index_run(run_id)
+
+  def status_changed(self, run_id, previous_status, status):
+    self.rows_by_status[previous_status].discard(run_id)
+    self.rows_by_status.setdefault(status, set()).add(run_id)
+    self.index_run(run_id)
+
+  def index_run(self, run_id):
+    """
+    Pushes the current state of run_id in its heap. Its previous entries become stale, they are dropped when they are met
+    """
+    if self.is_ready_unclaimed(run_id):
+      heapq.heappush(self.ready_heaps.setdefault(self.requirements(run_id), []), (-self.priority(run_id), run_id))
+    else:
+      reclaim_time = self.reclaim_time(self.values, run_id)
+      if reclaim_time is None:
+        return
+      heapq.heappush(self.reclaim_heap, (reclaim_time, run_id))
+    self.nb_heap_entries += 1
+    if self.nb_heap_entries > 2*self.nb_runs + MIN_COMPACTED_ENTRIES: # Amortized: at least nb_runs pushes happened since the last rebuild
+      self.rebuild_index()
+
+  def priority(self, run_id):
+    """
+    The "priority" cell of run_id as a number, 0 if it is empty or if there is no "priority" column. Higher priorities are claimed first
+    """
+    if "priority" not in self.values:
+      return 0
+    priority = self.convert(self.values["priority"][run_id])
+    if isinstance(priority, bool) or not isinstance(priority, (int, float)):
+      return 0
+    return priority
+
+  def requirements(self, run_id):
+    """
+    Returns: ((resource, required value), ...) for the non-empty "requires_<resource>" cells of run_id
+    """
+    requirements = []
+    for key in self.requirement_keys:
+      required = self.convert(self.values[key][run_id])
+      if required != "" and required is not False:
+        requirements.append((key[len(REQUIREMENT_PREFIX):], required))
+    return tuple(requirements)
+
+  def is_ready_unclaimed(self, run_id):
+    return self.values["status"][run_id] == "ready" and self.values["worker_name"][run_id] == ""
+
+  def run_ids_with_status(self, status):
+    return self.rows_by_status.get(status, set())
+
+  def next_ready_runs(self, nb_runs, is_reclaimable=None, fit_score=None):
+    """
+    nb_runs (int): Max number of run_ids to return
+    is_reclaimable (function, optional): is_reclaimable(run_id) tells if a claimed run whose reclaim time has passed can be claimed anyway (expired lease, dead worker)
+                                         Default is None: only the unclaimed "ready" runs are returned
+    fit_score (function, optional): fit_score(requirements) is None if the worker can't run these requirements, else a number, higher for a better fit
+                                    Default is that only the runs without requirements fit
+
+    Returns: the nb_runs best run_ids that are "ready" and unclaimed (or reclaimable), ordered by priority, fit score, then line
+    Only the first nb_runs valid entries of the heap of each fitting group are visited, and the entries of the reclaim heap whose time has passed:
+    O((nb_runs*nb groups + nb reclaimable runs)*log(heap size)), whatever the number of done or running runs. Stale entries met on the way are dropped
+    """
+    if fit_score is None:
+      fit_score = lambda requirements: 0 if len(requirements) == 0 else None
+    sort_keys = {} # sort_keys[run_id] = (-priority, -fit score, run_id)
+    for requirements, heap in self.ready_heaps.items():
+      score = fit_score(requirements)
+      if score is None:
+        continue
+      valid_entries = []
+      while len(heap) > 0 and len(valid_entries) < nb_runs:
+        entry = heapq.heappop(heap)
+        run_id = entry[1]
+        if run_id not in sort_keys and self.is_ready_unclaimed(run_id) and entry[0] == -self.priority(run_id) and self.requirements(run_id) == requirements:
+          valid_entries.append(entry)
+          sort_keys[run_id] = (entry[0], -score, run_id)
+        else:
+          self.nb_heap_entries -= 1
+      for entry in valid_entries:
+        heapq.heappush(heap, entry)
+    if is_reclaimable is not None:
+      now = time.time()
+      valid_entries = []
+      while len(self.reclaim_heap) > 0 and self.reclaim_heap[0][0] <= now:
+        entry = heapq.heappop(self.reclaim_heap)
+        run_id = entry[1]
+        if run_id in sort_keys or self.is_ready_unclaimed(run_id) or self.reclaim_time(self.values, run_id) != entry[0]:
+          self.nb_heap_entries -= 1
+          continue
+        valid_entries.append(entry)
+        score = fit_score(self.requirements(run_id))
+        if score is not None and is_reclaimable(run_id):
+          sort_keys[run_id] = (-self.priority(run_id), -score, run_id)
+        else:
+          sort_keys[run_id] = None # Seen, not a candidate
+      for entry in valid_entries:
+        heapq.heappush(self.reclaim_heap, entry)
+      sort_keys = {run_id: sort_key for run_id, sort_key in sort_keys.items() if sort_key is not None}
+    return sorted(sort_keys, key=sort_keys.get)[:nb_runs]
+
+  def next_ready_run(self, is_reclaimable=None, fit_score=None):
+    """
+    Returns: the best run_id that is "ready" and unclaimed (or reclaimable), None if there is none
+    Logarithmic time per requirements group and per reclaimable run: the top of a heap is only popped when it became stale
+    """
+    run_ids = self.next_ready_runs(1, is_reclaimable, fit_score)
+    return run_ids[0] if len(run_ids) > 0 else None
+
+def default_reclaim_time(values, run_id):
+  """
+  "ready" runs with a worker_name (claims in progress, leases) may always be reclaimed, see RunTable reclaim_time
+  """
+  if values["status"][run_id] == "ready" and values["worker_name"][run_id] != "":
+    return 0.0
+  return None
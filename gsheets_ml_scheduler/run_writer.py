@@ -1,23 +1,33 @@
-try:
-  from google.colab import auth as colab_auth
-  from google.auth import default as google_auth_default
-  is_colab = True
-except:
-  is_colab = False
+from .a1_notation import rowcol_to_a1
+from .clients import open_spreadsheet
+from .instrumentation import ApiStats, payload_size, with_instrumentation
+from .rate_limiter import get_shared_rate_limiter, with_rate_limiter
+from .scheduler import read_header_line, trim_line, write_column_names
 
-import gspread
-from gspread.utils import rowcol_to_a1
+import itertools
 
 class GSheetsMLRunWriter():
-  def __init__(self, gsheets_file_url, sheet_index=0, service_account_json_path=None):
+  def __init__(self, gsheets_file_url, sheet_index=0, service_account_json_path=None, backend=None, rate_limiter=None, instrumentation=None, cosmetics=True, column_wait_s=1.0):
     """
     gsheets_file_url (str): The URL of the Google Sheets file
     sheet_index (int, optional): In case you don't want to use the default "Sheet1" tab (default is 0)
     service_account_json_path (str, optional): Set to None (default) to get a popup asking to give this Colab instance the right to modify a Google Account (the right is revoked when the broswer tab is closed)
                                                       Set to a path to the file 'service_account.json' to connect to Google's APIs without Colab. Even to read/write a publicly modifiable Google Docs file, bots need a Google Service Account key
+    backend (optional): An already opened spreadsheet, used instead of logging in. Either a gspread Spreadsheet or an InMemorySpreadsheet (see gsheets_ml_scheduler.backends) for tests and benchmarks
+    rate_limiter (QuotaRateLimiter, optional): Every API call waits for the read/write quotas of rate_limiter and is retried on 429 and 5xx errors (see gsheets_ml_scheduler.rate_limiter)
+                                               Default is the limiter shared by the whole process when logging in to Google, and no limiter with a backend. Set to False to disable it
+    instrumentation (ApiStats or bool, optional): Records the count, payload bytes and latency of every API call in an ApiStats (see gsheets_ml_scheduler.instrumentation and stats())
+                                                  True creates one, give the same ApiStats to several schedulers/run writers to aggregate them. Default is None, nothing is recorded
+    cosmetics (bool, optional): If True (default), the names of new columns are grayed. Set to False to skip that format request, see GSheetsMLScheduler
+    column_wait_s (float, optional): Wait between the write of new column names and their read back, see add_columns
     """
     self.gsheets_file_url = gsheets_file_url
     self.service_account_json_path = service_account_json_path
+    self.backend = backend
+    self.rate_limiter = rate_limiter
+    self.api_stats = ApiStats() if instrumentation is True else (instrumentation or None)
+    self.cosmetics = cosmetics
+    self.column_wait_s = column_wait_s
 
     self.colors = {
       "new_column_name": {'red': 0.9, "green": 0.9, "blue": 0.9}
@@ -25,7 +35,7 @@ class GSheetsMLRunWriter():
     
     self.all_sheets = self.login_and_get_sheets()
     self.sheet_index = sheet_index
-    self.sheet = self.all_sheets.worksheets()[self.sheet_index]
+    self.sheet = self.all_sheets.get_worksheet(self.sheet_index)
 
     print(f'Run Writer connected to GSheet')
 
@@ -35,77 +45,170 @@ class GSheetsMLRunWriter():
     Access rights do not persist after you close the Colab browser tab
     Rights are only given to that specific Colab browser tab
 
-    This uses colab.auth library
-    """
-    if self.service_account_json_path is None: # Use Google Docs Sheets API through Colab
-      if not is_colab:
-        print("This isn't running on Colab. Outside of Colab, you must use 'service_account_json_path' to authenticate")
-        raise(Exception("NotColabNorServiceAccountError"))
-      colab_auth.authenticate_user() # That line is the only part that is Colab specific. Popup that asks for the right to modify a Google Account
-      credentials, _ = google_auth_default()
-      gclient = gspread.authorize(credentials)
-    else: # Use Google Docs Sheets API with a Google Service Account key
-      gclient = gspread.service_account(filename=self.service_account_json_path)
-    
-    all_sheets = gclient.open_by_url(self.gsheets_file_url)
-    return all_sheets
+    This uses colab.auth library, or the service account key
+    The login and the opened spreadsheet are done once per process (see gsheets_ml_scheduler.clients)
+    If a backend was given to the constructor, it is used instead
+    """
+    if self.backend is not None:
+      return with_rate_limiter(with_instrumentation(self.backend, self.api_stats), self.rate_limiter)
+
+    all_sheets = open_spreadsheet(self.gsheets_file_url, self.service_account_json_path) # Shared by all the schedulers and run writers of the process, see gsheets_ml_scheduler.clients
+    return with_rate_limiter(with_instrumentation(all_sheets, self.api_stats), get_shared_rate_limiter() if self.rate_limiter is None else self.rate_limiter)
   
-  def write_runs(self, configs):
+  def stats(self):
     """
-    configs (list): A list of config dictionaries (they can contains the "run_name" key/value).
-                            It CANNOT contain the keys "status" and "worker_name"
-    
+    Returns: a snapshot dict {"api", "rate_limiter"}, see GSheetsMLScheduler.stats
+    """
+    rate_limiter = getattr(self.all_sheets, "rate_limiter", None)
+    return {
+      "api": self.api_stats.stats() if self.api_stats is not None else None,
+      "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+    }
+
+  def write_runs(self, configs, chunk_size=500, max_chunk_bytes=2000000, progress_callback=None, resume_from=0):
+    """
+    configs (iterable): Config dictionaries (they can contains the "run_name" key/value), a list or any iterable/generator (see gsheets_ml_scheduler.search).
+                        They CANNOT contain the keys "status", "worker_name" and "heartbeat"
+    chunk_size (int, optional): Max number of runs sent in one request
+    max_chunk_bytes (int, optional): Max approximate size of the cell values sent in one request, the Sheets API rejects too big requests
+    progress_callback (function, optional): progress_callback(nb_written, nb_total) is called after each chunk. nb_total is None if configs has no len()
+    resume_from (int, optional): Number of configs of the iterable that were already written, they are skipped (see PartialWriteError)
+
+    Returns: the number of configs written, resume_from included
+
     This first downloads the sheet content to find where the config column names are located and how many lines there currenlty are
+    Then configs are consumed lazily and streamed chunk by chunk: the new columns of a chunk are created with a single header write,
+    and its runs are appended with a single batch_update
+    If a chunk fails, PartialWriteError.nb_written tells how many configs are in the sheet: call write_runs again with the same configs and resume_from=nb_written
+    """
+    self.read_sheet_layout()
+
+    nb_total = len(configs) if hasattr(configs, "__len__") else None
+    configs = itertools.islice(configs, resume_from, None)
+    nb_written = 0
+    for chunk in iter_chunks(configs, chunk_size, max_chunk_bytes):
+      try:
+        self.write_run_chunk(chunk)
+      except Exception as error:
+        raise PartialWriteError(resume_from + nb_written) from error
+      nb_written += len(chunk)
+      if progress_callback is not None:
+        progress_callback(resume_from + nb_written, nb_total)
+    return resume_from + nb_written
+
+  def read_sheet_layout(self):
+    """
+    Downloads the sheet to find where the config column names are located and how many lines there currently are
     """
     # Generic data preprocessing
     data = self.sheet.get_all_values()
 
     size = (len(data), len(data[0]))
-    keys = data[0]
-
-    key_ids = {}
-    for i in range(size[1]):
-      key_ids[keys[i]] = i
     
     self.size = size
+    self.nb_lines = size[0] # Including the header and defaults lines, the next run is written on the line below
     self.nb_runs = size[0]-2 # Not used in this code, but useful for users to iterate over get_run_config(run_id)
-    self.keys = keys # All colmun names
-    self.key_ids = key_ids # Key to column number conversion
+    self.set_keys(data[0])
+
+  def set_keys(self, keys):
+    """
+    keys (list): The first line of the sheet
+    """
+    key_ids = {}
+    for i in range(len(keys)):
+      key_ids[keys[i]] = i
 
-    def get_update_col_dict(line_start_python, n_lines, col_python, value_list):
-        cell_name_start = rowcol_to_a1(1+line_start_python, 1+col_python)
-        cell_name_end = rowcol_to_a1(1+line_start_python+n_lines-1, 1+col_python)
-        values = []
-        for value in value_list:
-          values.append([value])
-        return {'range': f'{cell_name_start}:{cell_name_end}', 'values': values}
+    self.keys = list(keys) # All colmun names
+    self.key_ids = key_ids # Key to column number conversion
 
-    updated_keys = set()
+  def write_run_chunk(self, configs):
+    """
+    configs (list): The configs of the chunk, appended below the last line (see read_sheet_layout)
+    """
+    first_line = self.nb_lines
+    lines = []
+    new_keys = []
     for i, config in enumerate(configs):
+      config = dict(config)
       # We add a number as default run_name
       if "run_name" not in config:
-        first_new_run_id = size[0] - 2
-        config["run_name"] = first_new_run_id + i
-      
+        config["run_name"] = self.nb_runs + i
       config["status"] = "ready"
 
-      updated_keys.update(config.keys()) # Reminder: it's a set not a list
-
-      # Create new columns in the sheet if some config keys don't exist
       for key in config.keys():
-        if key not in keys:
-          cell_name = rowcol_to_a1(1, 1+len(keys))
-          self.sheet.format(cell_name, {"backgroundColor": self.colors["new_column_name"]}) # New column gray
-          
-          self.sheet.update_cell(1, 1+len(keys), key)
-          key_ids[key] = len(keys)
-          keys.append(key)
-          
-    # To avoid Sheets API spam limit, we do a batch_update, column by column
-    cell_updates = []
-    for key in updated_keys:
-      values_list = []
-      for conf in configs:
-        values_list.append(conf[key] if key in conf else "")
-      cell_updates.append(get_update_col_dict(size[0], len(configs), key_ids[key], values_list))
-    self.sheet.batch_update(cell_updates)
+        if key not in self.key_ids and key not in new_keys:
+          new_keys.append(key)
+      lines.append(config)
+
+    if len(new_keys) > 0:
+      self.add_columns(new_keys)
+    self.resize_sheet(first_line + len(lines), len(self.keys))
+
+    # To avoid Sheets API spam limit, the whole chunk is a single range
+    values = [[config.get(key, "") for key in self.keys] for config in lines]
+    cell_name_start = rowcol_to_a1(1+first_line, 1)
+    cell_name_end = rowcol_to_a1(first_line+len(lines), len(self.keys))
+    self.sheet.batch_update([{'range': f'{cell_name_start}:{cell_name_end}', 'values': values}])
+    self.nb_lines += len(lines)
+    self.nb_runs += len(lines)
+
+  def add_columns(self, new_keys, max_attempts=3):
+    """
+    Writes the names of new columns after the last column, then colors them in one request (unless cosmetics is False)
+    Same protocol as GSheetsMLScheduler.add_columns: the header is read right before the write and read back after column_wait_s,
+    so that a worker or another run writer adding columns at the same time doesn't use the same cells
+    """
+    for _ in range(max_attempts):
+      header_line = read_header_line(self.sheet)
+      if header_line != trim_line(self.keys):
+        self.set_keys(header_line)
+      new_keys = [key for key in new_keys if key not in self.key_ids]
+      if len(new_keys) == 0:
+        return
+      if not write_column_names(self.sheet, self.keys, new_keys, self.column_wait_s):
+        continue # Another worker or run writer wrote columns at the same time
+
+      cell_name = rowcol_to_a1(1, 1+len(self.keys)) + ":" + rowcol_to_a1(1, len(self.keys)+len(new_keys))
+      for key in new_keys:
+        self.key_ids[key] = len(self.keys)
+        self.keys.append(key)
+      if self.cosmetics:
+        self.sheet.format(cell_name, {"backgroundColor": self.colors["new_column_name"]}) # New columns gray
+      return
+    raise(Exception("ColumnCreationContentionError"))
+
+  def resize_sheet(self, nb_lines, nb_columns):
+    """
+    The Sheets API doesn't write outside of the grid of the worksheet, it is extended first if needed
+    """
+    row_count = getattr(self.sheet, "row_count", None) # InMemorySpreadsheet worksheets have no grid limits
+    if row_count is not None and nb_lines > row_count:
+      self.sheet.add_rows(nb_lines - row_count)
+    col_count = getattr(self.sheet, "col_count", None)
+    if col_count is not None and nb_columns > col_count:
+      self.sheet.add_cols(nb_columns - col_count)
+
+def iter_chunks(configs, chunk_size, max_chunk_bytes):
+  """
+  Yields lists of at most chunk_size configs and about max_chunk_bytes of cell values, consuming configs lazily
+  """
+  chunk = []
+  chunk_bytes = 0
+  for config in configs:
+    config_bytes = payload_size(config)
+    if len(chunk) > 0 and (len(chunk) >= chunk_size or chunk_bytes + config_bytes > max_chunk_bytes):
+      yield chunk
+      chunk = []
+      chunk_bytes = 0
+    chunk.append(config)
+    chunk_bytes += config_bytes
+  if len(chunk) > 0:
+    yield chunk
+
+class PartialWriteError(Exception):
+  """
+  Raised by write_runs when a chunk failed. The first nb_written configs are in the sheet, the error of the chunk is the __cause__
+  """
+  def __init__(self, nb_written):
+    super().__init__(f"Failure, only {nb_written} configs were written, call write_runs again with resume_from={nb_written}")
+    self.nb_written = nb_written
@@ -1,21 +1,36 @@
-try:
-  from google.colab import auth as colab_auth
-  from google.auth import default as google_auth_default
-  is_colab = True
-except:
-  is_colab = False
-
-import gspread
-from gspread.utils import rowcol_to_a1
-
-import pandas as pd
+from .a1_notation import a1_to_rowcol, rowcol_to_a1
+from .background_sync import BackgroundConfigSync
+from .backends import get_change_marker_function
+from .clients import open_spreadsheet
+from .convert import CellConverter, convert_str_to_bool_int_float_str
+from .formatting import SheetFormatter
+from .instrumentation import ApiStats, with_instrumentation
+from .local_cache import LocalCache, is_permanent_error
+from .rate_limiter import get_shared_rate_limiter, with_rate_limiter
+from .run_table import REQUIREMENT_PREFIX, RunTable
+from .write_buffer import SheetWriteBuffer
 
+import atexit
+import functools
 import random
 import string
+import threading
 import time
+import weakref
+from collections import deque
+
+LEASE_SEPARATOR = "|"
+LEGACY_CLAIM_WAIT_S = 2.0
+SCHEDULER_KEYS = ("run_name", "status", "worker_name", "heartbeat", "priority") # Scheduling columns, they are not part of the run configs (nor the "requires_<resource>" columns)
+METRIC_PREFIX = "metric_" # Columns written by log(), they are not part of the run configs either
+STATUS_COLUMN_KEYS = ("status", "worker_name", "heartbeat", "priority") # Columns downloaded by read_status_columns, if they exist
+RECLAIMABLE_STATUSES = ("running", "queued") # Runs of dead workers that can be taken over, see lease_timeout_s
 
 class GSheetsMLScheduler():
-  def __init__(self, gsheets_file_url, sheet_index=0, hardcoded_default_config=None, comma_number_format=False, service_account_json_path=None):
+  def __init__(self, gsheets_file_url, sheet_index=0, hardcoded_default_config=None, comma_number_format=False, service_account_json_path=None, backend=None, auto_flush=True,
+               claim_mode="lease", lease_duration_s=60.0, claim_wait_factor=2.0, min_claim_wait_s=0.1, claim_wait_jitter=0.5,
+               prefetch=1, rate_limiter=None, instrumentation=None, max_snapshot_age_s=None,
+               local_cache=None, lease_timeout_s=None, capabilities=None, claim_spread=1, metrics_interval_s=30.0, cosmetics=True):
     """
     gsheets_file_url (str): The URL of the Google Sheets file
     sheet_index (int, optional): In case you don't want to use the default "Sheet1" tab (default is 0)
@@ -23,12 +38,86 @@ class GSheetsMLScheduler():
     comma_number_format (bool, optional): In some languages, Google Sheets uses decimal numbers with a comma, for example "-2,0" or "1,5E-3" (default is False, indicating period as the default decimal separator)
     service_account_json_path (str, optional): Set to None (default) to get a popup asking to give this Colab instance the right to modify a Google Account (the right is revoked when the broswer tab is closed)
                                                       Set to a path to the file 'service_account.json' to connect to Google's APIs without Colab. Even to read/write a publicly modifiable Google Docs file, bots need a Google Service Account key
+    backend (optional): An already opened spreadsheet, used instead of logging in. Either a gspread Spreadsheet or an InMemorySpreadsheet (see gsheets_ml_scheduler.backends) for tests and benchmarks
+    auto_flush (bool, optional): If True (default), the writes of each scheduler call are sent at the end of that call (at most one value batch and one format batch)
+                                 If False, status/config/format writes stay in scheduler.write_buffer until you call scheduler.flush(), to batch several calls on purpose
+    claim_mode (str, optional): "lease" (default) for the fast claim protocol (see lease_claim_and_start_run)
+                                "legacy" for the original protocol, with full sheet downloads and a fixed 2 seconds wait (see legacy_claim_and_start_run)
+    lease_duration_s (float, optional): A lease claim that didn't turn into a "running" run after that time (dead worker) can be taken over by other workers
+    claim_wait_factor (float, optional): The lease claim waits claim_wait_factor*(read latency + write latency), measured on the recent API calls
+    min_claim_wait_s (float, optional): Lower bound of the lease claim wait
+    claim_wait_jitter (float, optional): The lease claim wait is multiplied by a random factor in [1, 1+claim_wait_jitter], so that competing workers don't stay synchronized
+    prefetch (int, optional): Number of runs find_claim_and_start_run claims at once (see claim_runs). The runs not started yet wait in a local queue with the status "queued"
+                              Default is 1 (no queue). Bigger values amortize the claim protocol over several short runs. Requires claim_mode="lease"
+    rate_limiter (QuotaRateLimiter, optional): Every API call waits for the read/write quotas of rate_limiter and is retried on 429 and 5xx errors (see gsheets_ml_scheduler.rate_limiter)
+                                               Default is the limiter shared by the whole process when logging in to Google, and no limiter with a backend. Set to False to disable it
+    instrumentation (ApiStats or bool, optional): Records the count, payload bytes and latency of every API call in an ApiStats (see gsheets_ml_scheduler.instrumentation and stats())
+                                                  True creates one, give the same ApiStats to several schedulers/run writers to aggregate them. Default is None, nothing is recorded
+    max_snapshot_age_s (float, optional): Enables conditional refreshes: polls and ready run searches first get the change marker of the spreadsheet (a cheap metadata call)
+                                          and skip their read if the sheet didn't change since the last read of the same lines, unless that read is older than max_snapshot_age_s
+                                          Default is None (always read). Claims always read the sheet
+    local_cache (str or LocalCache, optional): Path of a SQLite file (see gsheets_ml_scheduler.local_cache). The scheduler then starts from the last downloaded sheet
+                                               and only downloads the status columns and the new lines. The writes that fail because the sheet is unreachable
+                                               are journaled and sent again by the next flush (or by the next scheduler using the same file), and status updates,
+                                               config polls and run_done keep working on the last snapshot in the meantime. Default is None (no cache)
+    lease_timeout_s (float, optional): Enables the takeover of the runs of dead workers (e.g. a Colab session that was disconnected)
+                                       Every status write also writes the current time in the "heartbeat" column (created if needed), in the same request
+                                       A "running" or "queued" run whose heartbeat is older than lease_timeout_s can be claimed by other workers, with the lease protocol
+                                       A worker must write its status, poll its config or call heartbeat() more often than that, start_background_sync does it
+                                       Default is None: runs are never taken over, but heartbeats are still written if the sheet has a "heartbeat" column
+    capabilities (dict, optional): The resources of this worker, for example {"gpu_memory_gb": 40, "tpu": False, "gpu": "A100"}
+                                   A run with a "requires_<resource>" cell is only claimed if capabilities[resource] is at least that number,
+                                   is True for a TRUE cell, or is equal to that text. Among the runs of a same priority, the ones that use the biggest part of the resources go first
+                                   Default is None: only the runs without requirements are claimed
+    claim_spread (int, optional): Claims pick at random among the claim_spread best ready runs of the top priority instead of always the first one,
+                                  so that workers starting together don't all race for the same line. Default is 1 (sheet order)
+    metrics_interval_s (float, optional): log() sends the metrics at most once per metrics_interval_s, see log()
+    cosmetics (bool, optional): If True (default), lines are colored (running/done) and default/modified config values are grayed/greened
+                                Only the format changes are sent, with the other writes. Set to False for headless fleets: no format request at all
     """
     self.gsheets_file_url = gsheets_file_url
     self.worker_name = GSheetsMLScheduler.generate_short_uuid()
     self.comma_number_format = comma_number_format
     self.hardcoded_default_config = hardcoded_default_config
     self.service_account_json_path = service_account_json_path
+    self.backend = backend
+    self.rate_limiter = rate_limiter
+    self.api_stats = ApiStats() if instrumentation is True else (instrumentation or None)
+    self.converter = CellConverter(comma_number_format) # Memo of raw string -> value conversions, reused across refreshes
+    self.auto_flush = auto_flush
+    self.claim_mode = claim_mode
+    self.lease_duration_s = lease_duration_s
+    self.claim_wait_factor = claim_wait_factor
+    self.min_claim_wait_s = min_claim_wait_s
+    self.claim_wait_jitter = claim_wait_jitter
+    if claim_mode not in ("lease", "legacy"):
+      raise(Exception("UnknownClaimModeError"))
+    self.lease_timeout_s = lease_timeout_s
+    if lease_timeout_s is not None and claim_mode == "legacy":
+      raise(Exception("LeaseTimeoutWithLegacyClaimModeError")) # The takeover relies on the lease protocol
+    if prefetch > 1 and claim_mode == "legacy":
+      raise(Exception("PrefetchWithLegacyClaimModeError")) # claim_runs only has a lease protocol
+    self.reclaimable_statuses = RECLAIMABLE_STATUSES if lease_timeout_s is not None else ()
+    self.capabilities = capabilities if capabilities is not None else {}
+    self.claim_spread = claim_spread
+    self.metrics_interval_s = metrics_interval_s
+    self.pending_metrics = {} # pending_metrics[run_id][name] = latest value given to log() and not written yet
+    self.metrics_lock = threading.Lock() # Only guards pending_metrics: log() stays non-blocking while the background sync thread holds self.lock
+    self.lock = threading.RLock() # Guards the scheduler state (table, write buffer, prefetch queue...) shared with the background sync thread. Reentrant: locked methods call each other
+    self.last_metrics_write_time = None
+    self.last_heartbeat_times = {} # last_heartbeat_times[run_id] = time.time() of the last heartbeat written for a run of this worker
+    self.replaced_worker_names = {} # replaced_worker_names[run_id] = worker_name cell overwritten by our lease on a stale run, restored if the takeover fails
+    self.taken_over_run_ids = set() # Runs of this worker taken over by other workers, their lines aren't written anymore (see check_taken_over)
+
+    self.api_latencies = {"read": deque(maxlen=20), "write": deque(maxlen=20)} # Recent API call durations, used to size the lease claim wait
+    self.claim_stats = {"attempts": 0, "wins": 0, "losses": 0, "time_s": 0.0}
+    self.prefetch = prefetch
+    self.prefetched_run_ids = deque() # Claimed runs that are not started yet
+    self.running_configs = {} # running_configs[run_id] = gsheets config of each started run, until its run_done
+    self.background_sync = None # See start_background_sync
+    self.max_snapshot_age_s = max_snapshot_age_s
+    self.snapshot_markers = {} # snapshot_markers[snapshot_name] = (change marker, time) of the last conditional read, see is_snapshot_current
+    self.local_cache = LocalCache(local_cache) if isinstance(local_cache, str) else local_cache
 
     self.colors = {
       "running": {'red': 1.0, "green": 0.93, "blue": 0.8},
@@ -39,10 +128,22 @@ class GSheetsMLScheduler():
     
     self.all_sheets = self.login_and_get_sheets()
     self.sheet_index = sheet_index
-    self.sheet = self.all_sheets.worksheets()[self.sheet_index]
-    self.download_data()
+    self.sheet = self.all_sheets.get_worksheet(self.sheet_index)
+    self.write_buffer = SheetWriteBuffer(self.sheet)
+    self.formatter = SheetFormatter(self.write_buffer, cosmetics)
+    self.change_marker_function = get_change_marker_function(self.all_sheets) if max_snapshot_age_s is not None else None
+    if not self.load_cached_snapshot():
+      self.download_data(if_changed=max_snapshot_age_s is not None)
+    if self.local_cache is not None:
+      self.flush_with_journal(worker_name=None) # Writes journaled by dead workers that are still valid
+    if lease_timeout_s is not None and "heartbeat" not in self.key_ids:
+      self.add_heartbeat_column()
 
     self.currently_running_run_id = None
+    self.exit_callback = None
+    if prefetch > 1: # Unstarted runs go back to "ready" if the process ends without close(). Weak: atexit doesn't keep the scheduler alive
+      self.exit_callback = functools.partial(call_weak_method, weakref.WeakMethod(self.release_prefetched_runs))
+      atexit.register(self.exit_callback)
     print(f'Scheduler connected to GSheets, its name is worker <{self.worker_name}>')
 
   @staticmethod
@@ -51,31 +152,7 @@ class GSheetsMLScheduler():
     Convert raw data str to bool/int/float/str. Hex isn't handled, nor other exotic types
     The number decimal separator must be a point
     """
-    if str_point_format == '':
-      return str_point_format
-
-    str_lower_case = str_point_format.lower() # Boolean
-    if str_lower_case == 'true':
-      return True
-    if str_lower_case == 'false':
-      return False
-
-    if str_point_format.isdecimal(): # Positive integer
-      try:
-        return int(str_point_format)
-      except:
-        return str_point_format
-
-    if str_point_format[0] == '-' and str_point_format[1:].isdecimal(): # Negative integer
-      try:
-        return int(str_point_format)
-      except:
-        return str_point_format
-
-    try:
-      return float(str_point_format) # We trust python's float convertion
-    except:
-      return str_point_format
+    return convert_str_to_bool_int_float_str(str_point_format)
 
   @staticmethod
   def generate_short_uuid(length=6):
@@ -85,6 +162,27 @@ class GSheetsMLScheduler():
     chars = string.ascii_uppercase + string.ascii_lowercase + string.digits
     return ''.join(random.choice(chars) for _ in range(length))
 
+  @staticmethod
+  def make_lease(worker_name, token, expiry_time):
+    """
+    Content of the worker_name cell during a lease claim: "<worker_name>|<token>|<expiry unix time>"
+    """
+    return f"{worker_name}{LEASE_SEPARATOR}{token}{LEASE_SEPARATOR}{int(expiry_time)}"
+
+  @staticmethod
+  def parse_lease(worker_name_cell):
+    """
+    Returns: (worker_name, token, expiry_time), or None if the cell doesn't contain a lease
+    """
+    parts = worker_name_cell.split(LEASE_SEPARATOR)
+    if len(parts) != 3:
+      return None
+    try:
+      expiry_time = float(parts[2])
+    except ValueError:
+      return None
+    return parts[0], parts[1], expiry_time
+
   @staticmethod
   def complete_missing_config_params(gsheets_config, hardcoded_default_config):
     """
@@ -101,79 +199,387 @@ class GSheetsMLScheduler():
     Access rights do not persist after you close the Colab browser tab
     Rights are only given to that specific Colab browser tab
 
-    This uses colab.auth library
-    """
-    if self.service_account_json_path is None: # Use Google Docs Sheets API through Colab
-      if not is_colab:
-        print("This isn't running on Colab. Outside of Colab, you must use 'service_account_json_path' to authenticate")
-        raise(Exception("NotColabNorServiceAccountError"))
-      colab_auth.authenticate_user() # That line is the only part that is Colab specific. Popup that asks for the right to modify a Google Account
-      credentials, _ = google_auth_default()
-      gclient = gspread.authorize(credentials)
-    else: # Use Google Docs Sheets API with a Google Service Account key
-      gclient = gspread.service_account(filename=self.service_account_json_path)
-    
-    all_sheets = gclient.open_by_url(self.gsheets_file_url)
-    return all_sheets
+    This uses colab.auth library, or the service account key
+    The login and the opened spreadsheet are done once per process (see gsheets_ml_scheduler.clients)
+    If a backend was given to the constructor, it is used instead
+    """
+    if self.backend is not None:
+      return with_rate_limiter(with_instrumentation(self.backend, self.api_stats), self.rate_limiter)
 
-  def download_data(self):
+    all_sheets = open_spreadsheet(self.gsheets_file_url, self.service_account_json_path) # Shared by all the schedulers and run writers of the process, see gsheets_ml_scheduler.clients
+    return with_rate_limiter(with_instrumentation(all_sheets, self.api_stats), get_shared_rate_limiter() if self.rate_limiter is None else self.rate_limiter)
+
+  def download_data(self, if_changed=False):
     """
     This refreshes the data and converts the raw gspread data into an easier to manage format
     This also converts cell raw strings to comma format if required, then as int/float/str
+
+    if_changed (bool, optional): Skip the download if the sheet didn't change since the last one (see max_snapshot_age_s)
     """
+    if if_changed:
+      is_current, marker = self.check_snapshots(["full"])
+      if is_current:
+        return
+    start_time = time.perf_counter()
     data = self.sheet.get_all_values()
+    parse_start_time = time.perf_counter()
+    self.parse_data(data)
 
-    dataframe = pd.DataFrame(data) # Panda is used for easier handling of 2d arrays with dataframe[i,j]
+    if self.api_stats is not None:
+      self.api_stats.record_local("download_data_network", parse_start_time - start_time)
+      self.api_stats.record_local("download_data_parse", time.perf_counter() - parse_start_time)
+    if if_changed:
+      self.snapshot_markers = {} # A full download covers all the other snapshots
+      self.record_snapshot("full", marker)
+    if self.local_cache is not None:
+      self.local_cache.save_snapshot(self.gsheets_file_url, self.sheet_index, data)
+
+  def parse_data(self, data):
+    """
+    data (list): Raw cells of the whole sheet, as returned by get_all_values
+    """
     size = (len(data), len(data[0]))
     keys = data[0]
 
-    config_keys = list(keys)
-    config_keys.remove("run_name")
-    config_keys.remove("status")
-    config_keys.remove("worker_name")
+    config_keys = [key for key in keys if key not in SCHEDULER_KEYS and not key.startswith(REQUIREMENT_PREFIX) and not key.startswith(METRIC_PREFIX)]
 
     key_ids = {}
     for i in range(size[1]):
       key_ids[keys[i]] = i
-    config_defaults = {}
-    for config_key in config_keys:
-      config_defaults[config_key] = data[1][key_ids[config_key]]
 
-    values = {}
-    for key in keys:
-      values[key] = list(dataframe.iloc[2:,key_ids[key]])
+    columns = {}
+    for key in key_ids:
+      columns[key] = [line[key_ids[key]] for line in data[2:]]
 
     # Here we handle the languages with comma decimal separators
     # There is no fancy way to check if it's a comma number and not a text with a comma
     # In all values of config_key, commas are replaced by points
+    config_defaults = {}
     for config_key in config_keys:
       # Part 1: The default values
-      str_value = config_defaults[config_key]
-      if self.comma_number_format:
-        point_value = str_value.replace(",", ".")
-      else:
-        point_value = str_value
-      converted_type_value = GSheetsMLScheduler.convert_str_to_bool_int_float_str(point_value)
-      config_defaults[config_key] = converted_type_value
+      config_defaults[config_key] = self.convert_cell(data[1][key_ids[config_key]])
 
       # Part 2: The config values of all lines except the first 2 (first is key names, second is defaults)
-      for i in range(len(values["status"])):
-        str_value = values[config_key][i]
-
-        if self.comma_number_format:
-          point_value = str_value.replace(",", ".")
-        else:
-          point_value = str_value
-        converted_type_value = GSheetsMLScheduler.convert_str_to_bool_int_float_str(point_value)
-        values[config_key][i] = converted_type_value
+      columns[config_key] = self.converter.convert_column(columns[config_key])
 
     self.size = size
-    self.nb_runs = size[0]-2 # Not used in this code, but useful for users to iterate over get_run_config(run_id)
     self.keys = keys # All colmun names
-    self.config_keys = config_keys # All column names except run_name/status/worker_name
+    self.config_keys = config_keys # All column names except the scheduling ones (run_name/status/worker_name/heartbeat/priority/requires_*) and the metric_* ones
     self.key_ids = key_ids # Key to column number conversion
-    self.config_defaults = config_defaults # config_defaults[config_key] contains a list of the values of a column, with the first two lines excluded (first is key names, second is defaults)
-    self.values = values # values[key] contains a list of the values of a column, with the first two lines excluded (first is key names, second is defaults)
+    self.config_defaults = config_defaults # config_defaults[config_key] contains the default value of a column (second line)
+    self.table = RunTable(key_ids, config_keys, columns, convert=self.convert_cell, reclaim_time=self.reclaim_time) # Columnar storage of the run lines, with a priority index of the ready runs
+    self.values = self.table.values # values[key] contains the values of a column, with the first two lines excluded (first is key names, second is defaults)
+    self.nb_runs = self.table.nb_runs # Not used in this code, but useful for users to iterate over get_run_config(run_id)
+
+  def add_columns(self, new_keys, max_attempts=3):
+    """
+    Writes the names of new columns after the last column, and adds them (empty) to the local data
+    Not subject to auto_flush: the header is read right before the write and read back after the claim wait (see claim_wait_time),
+    so that two workers adding columns at the same time don't both use the same cells. If the header changed,
+    the sheet is downloaded again and the columns still missing are placed after the new last column
+    The API errors are raised, nothing is journaled: offline, the names could land on columns created by other workers in the meantime
+    """
+    for _ in range(max_attempts):
+      if self.header_changed(read_header_line(self.sheet)):
+        self.download_data()
+      new_keys = [key for key in new_keys if key not in self.key_ids]
+      if len(new_keys) == 0:
+        return
+      if not write_column_names(self.sheet, self.keys, new_keys, self.claim_wait_time()):
+        continue # Another worker wrote columns at the same time
+      for key in new_keys:
+        self.key_ids[key] = len(self.keys)
+        self.keys.append(key)
+        self.table.add_column(key)
+      self.size = (self.size[0], len(self.keys))
+      return
+    raise(Exception("ColumnCreationContentionError"))
+
+  def add_heartbeat_column(self):
+    self.add_columns(["heartbeat"])
+
+  def load_cached_snapshot(self):
+    """
+    Starts from the sheet saved in the local cache by the last download_data, then downloads only the status columns and the new lines
+    The config values of the other lines are refreshed when they are read (find_ready_run, polls)
+    Returns: False if there is no local cache or no snapshot of this worksheet in it
+    """
+    if self.local_cache is None:
+      return False
+    data, _ = self.local_cache.load_snapshot(self.gsheets_file_url, self.sheet_index)
+    if data is None:
+      return False
+    self.parse_data(data)
+    self.read_status_columns() # Falls back to download_data if the header changed
+    return True
+
+  def read_or_keep_snapshot(self, read_function, *args):
+    """
+    With a local cache, a read that fails because the sheet is unreachable is reported and the last snapshot is kept,
+    so that the training goes on. Without it, the error is raised
+    """
+    if self.local_cache is None:
+      read_function(*args)
+      return
+    try:
+      read_function(*args)
+    except Exception as error:
+      if is_permanent_error(error):
+        raise
+      print(f"Failure, sheet unreachable ({error}), the last snapshot is used")
+
+  def get_change_marker(self):
+    """
+    Returns: the change marker of the spreadsheet (see gsheets_ml_scheduler.backends), None if the backend has none
+    """
+    if self.change_marker_function is None:
+      return None
+    try:
+      return self.change_marker_function()
+    except Exception as error: # E.g. credentials without access to the Drive API
+      print(f"Failure, no change marker ({error}), conditional refreshes are disabled")
+      self.change_marker_function = None
+      return None
+
+  def check_snapshots(self, snapshot_names):
+    """
+    snapshot_names (list): "full" (download_data), "status_columns" (read_status_columns), "run_line_<run_id>" (read_run_lines)
+
+    Returns: is_current, marker. is_current is True if all snapshot_names are current, marker is the change marker to record after the read
+    A snapshot is current if the change marker didn't change since it was read, and it was read less than max_snapshot_age_s ago
+    The marker is taken before the read, so a change made during the read is seen by the next check
+    """
+    marker = self.get_change_marker()
+    if marker is None:
+      return False, None
+    return all(self.is_snapshot_current(snapshot_name, marker) for snapshot_name in snapshot_names), marker
+
+  def is_snapshot_current(self, snapshot_name, marker):
+    now = time.monotonic()
+    for name in [snapshot_name, "full"]:
+      if name in self.snapshot_markers:
+        snapshot_marker, snapshot_time = self.snapshot_markers[name]
+        if snapshot_marker == marker and now - snapshot_time <= self.max_snapshot_age_s:
+          return True
+    return False
+
+  def record_snapshot(self, snapshot_name, marker):
+    if marker is not None:
+      self.snapshot_markers[snapshot_name] = (marker, time.monotonic())
+
+  def convert_cell(self, str_value):
+    """
+    Raw cell string to bool/int/float/str, with the comma_number_format handling of download_data
+    """
+    return self.converter.convert(str_value)
+
+  def header_changed(self, header):
+    """
+    header (list): A freshly downloaded first line
+    """
+    return trim_line(header) != trim_line(self.keys)
+
+  def column_range(self, key):
+    """
+    A1 range of the run values of a column, for example "B3:B"
+    """
+    cell_name = rowcol_to_a1(1+2, 1+self.key_ids[key])
+    return f"{cell_name}:{cell_name[:-1]}"
+
+  def set_defaults_line(self, line):
+    for config_key in self.config_keys:
+      col = self.key_ids[config_key]
+      self.config_defaults[config_key] = self.convert_cell(line[col] if col < len(line) else "")
+
+  def parse_run_line(self, line):
+    """
+    line (list): A freshly downloaded line of raw cell strings
+    Returns: run_values[key] the converted value of each column
+    """
+    run_values = {}
+    for key, col in self.key_ids.items():
+      str_value = line[col] if col < len(line) else ""
+      run_values[key] = self.convert_cell(str_value) if key in self.config_defaults else str_value
+    return run_values
+
+  def set_run_line(self, run_id, line):
+    """
+    Updates self.values[*][run_id] with a freshly downloaded line
+    """
+    for key, value in self.parse_run_line(line).items():
+      self.values[key][run_id] = value
+
+  def append_run_lines(self, lines):
+    for line in lines:
+      self.table.append_run(self.parse_run_line(line))
+    self.nb_runs = self.table.nb_runs
+    self.size = (self.nb_runs+2, self.size[1])
+
+  def read_run_lines(self, run_ids, if_changed=False):
+    """
+    Downloads only the header line, the defaults line and the lines of run_ids (a single API call),
+    then updates self.config_defaults and self.values for these lines
+    If the header changed (columns added, removed or moved), it falls back to a full download_data()
+
+    if_changed (bool, optional): Skip the download if the sheet didn't change since these lines were read (see max_snapshot_age_s)
+    """
+    if if_changed:
+      snapshot_names = [f"run_line_{run_id}" for run_id in run_ids]
+      is_current, marker = self.check_snapshots(snapshot_names)
+      if is_current:
+        return
+    ranges = ["1:2"] + [f"{1+2+run_id}:{1+2+run_id}" for run_id in run_ids]
+    start_time = time.perf_counter()
+    lines = self.sheet.batch_get(ranges)
+    self.api_latencies["read"].append(time.perf_counter() - start_time)
+
+    header_lines = lines[0]
+    if self.header_changed(header_lines[0] if len(header_lines) > 0 else []):
+      self.download_data()
+      return
+    self.set_defaults_line(header_lines[1] if len(header_lines) > 1 else [])
+    for run_id, line in zip(run_ids, lines[1:]):
+      self.set_run_line(run_id, line[0] if len(line) > 0 else [])
+    if if_changed:
+      for snapshot_name in snapshot_names:
+        self.record_snapshot(snapshot_name, marker)
+
+  def read_status_columns(self, if_changed=False):
+    """
+    Downloads only the header line and the "status" and "worker_name" columns, and "heartbeat" and "priority" if they exist (a single API call)
+    Lines added at the bottom of the sheet since the last download are downloaded entirely (a second API call)
+    If the header changed, it falls back to a full download_data()
+
+    The config values of the other lines aren't refreshed: use download_data() for that
+    if_changed (bool, optional): Skip the download if the sheet didn't change since these columns were read (see max_snapshot_age_s)
+    """
+    if if_changed:
+      is_current, marker = self.check_snapshots(["status_columns"])
+      if is_current:
+        return
+    keys = [key for key in STATUS_COLUMN_KEYS if key in self.key_ids]
+    ranges = ["1:1"] + [self.column_range(key) for key in keys]
+    start_time = time.perf_counter()
+    header_line, *key_columns = self.sheet.batch_get(ranges)
+    self.api_latencies["read"].append(time.perf_counter() - start_time)
+
+    if self.header_changed(header_line[0] if len(header_line) > 0 else []):
+      self.download_data()
+      return
+    columns = {key: [cell[0] if len(cell) > 0 else "" for cell in key_column] for key, key_column in zip(keys, key_columns)}
+
+    nb_runs = max(len(columns["status"]), len(columns["worker_name"]))
+    if nb_runs > self.nb_runs: # New lines
+      new_lines = self.sheet.batch_get([f"{1+2+self.nb_runs}:{2+nb_runs}"])[0]
+      new_lines = list(new_lines) + [[]]*(nb_runs - self.nb_runs - len(new_lines))
+      self.append_run_lines(new_lines)
+    for key, column in columns.items():
+      for i in range(self.nb_runs):
+        self.values[key][i] = column[i] if i < len(column) else ""
+    if if_changed:
+      self.record_snapshot("status_columns", marker)
+
+  def is_claimable(self, run_id):
+    """
+    A run can be claimed if its status is "ready" and its worker_name is empty or holds an expired lease
+    With lease_timeout_s, a "running" or "queued" run of a dead worker can be claimed too (see is_stale)
+    In both cases, the requirements of the run must fit the capabilities of the worker (see fit_score)
+    """
+    if self.fit_score(self.table.requirements(run_id)) is None:
+      return False
+    if self.values["status"][run_id] != "ready":
+      return self.is_stale(run_id)
+    worker_name_cell = self.values["worker_name"][run_id]
+    if worker_name_cell == "":
+      return True
+    lease = GSheetsMLScheduler.parse_lease(worker_name_cell)
+    return lease is not None and lease[2] < time.time()
+
+  def is_stale(self, run_id):
+    """
+    True if run_id is "running" or "queued" and its heartbeat is older than lease_timeout_s, and no other worker holds a lease on it
+    """
+    if self.values["status"][run_id] not in self.reclaimable_statuses:
+      return False
+    lease = GSheetsMLScheduler.parse_lease(self.values["worker_name"][run_id])
+    if lease is not None and lease[2] >= time.time():
+      return False # Another worker is taking it over
+    return self.heartbeat_is_old(run_id)
+
+  def heartbeat_is_old(self, run_id):
+    """
+    Runs without heartbeat (started by an older version, or written by hand) are never considered dead
+    """
+    if self.lease_timeout_s is None or "heartbeat" not in self.key_ids:
+      return False
+    try:
+      heartbeat_time = float(self.values["heartbeat"][run_id])
+    except ValueError:
+      return False
+    return heartbeat_time + self.lease_timeout_s < time.time()
+
+  def reclaim_time(self, values, run_id):
+    """
+    values (dict): The columns of self.table, which indexes the runs by reclaim time
+
+    Returns: the time from which run_id, claimed by a worker, may be claimable again (see is_claimable), None if never:
+    the expiry of the lease of a "ready" run, or the heartbeat + lease_timeout_s of a "running"/"queued" run (and the expiry of the lease of its takeover)
+    """
+    lease = GSheetsMLScheduler.parse_lease(values["worker_name"][run_id])
+    if values["status"][run_id] == "ready":
+      return lease[2] if lease is not None else None
+    if values["status"][run_id] not in self.reclaimable_statuses or "heartbeat" not in values:
+      return None
+    try:
+      heartbeat_time = float(values["heartbeat"][run_id])
+    except ValueError:
+      return None
+    if lease is not None:
+      return max(heartbeat_time + self.lease_timeout_s, lease[2])
+    return heartbeat_time + self.lease_timeout_s
+
+  def fit_score(self, requirements):
+    """
+    requirements (tuple): ((resource, required value), ...) of a run, see RunTable.requirements
+
+    Returns: None if capabilities don't meet the requirements, else the sum of the used fractions of the resources (higher is a better fit)
+    """
+    score = 0.0
+    for resource, required in requirements:
+      if resource not in self.capabilities:
+        return None
+      capability = self.capabilities[resource]
+      if isinstance(required, bool) or isinstance(capability, bool):
+        if capability is not True or required is not True:
+          return None
+        score += 1.0
+      elif isinstance(required, (int, float)) and isinstance(capability, (int, float)):
+        if capability < required:
+          return None
+        score += required/capability if capability > 0 else 1.0
+      elif str(required) == str(capability):
+        score += 1.0
+      else:
+        return None
+    return score
+
+  def next_claimable_runs(self, nb_runs):
+    """
+    Returns: up to nb_runs claimable run_ids (see is_claimable), the best ones according to the index of self.table (priority, fit, line)
+    With claim_spread > 1, the runs of the lowest priority among them are drawn at random from the claim_spread*nb_runs best candidates of that priority
+    """
+    run_ids = self.table.next_ready_runs(nb_runs*self.claim_spread, is_reclaimable=self.is_claimable, fit_score=self.fit_score)
+    if len(run_ids) <= nb_runs:
+      return run_ids
+    cutoff_priority = self.table.priority(run_ids[nb_runs-1])
+    chosen_run_ids = [run_id for run_id in run_ids[:nb_runs] if self.table.priority(run_id) > cutoff_priority]
+    same_priority_run_ids = [run_id for run_id in run_ids if self.table.priority(run_id) == cutoff_priority]
+    chosen_run_ids += random.sample(same_priority_run_ids, nb_runs - len(chosen_run_ids))
+    return sorted(chosen_run_ids, key=run_ids.index)
+
+  def next_claimable_run(self):
+    run_ids = self.next_claimable_runs(1)
+    return run_ids[0] if len(run_ids) > 0 else None
 
   def get_run_config(self, run_id):
     """
@@ -196,31 +602,72 @@ class GSheetsMLScheduler():
     This allows you to write things in other parts of the Google Sheets as drafts
     Write "ready" in the "status" column once you want this line to be runned
 
+    Only the "status" and "worker_name" columns are downloaded, then the line of the found run (see read_status_columns)
+    The ready runs are looked up in the index of self.table instead of scanning the column
+
     Returns: run_id, config. In this function (unlike in find_claim_and_start_run) it returns the run_id
     """
-    self.currently_running_run_id = None # In case we didn't use self.run_done()
+    with self.lock:
+      self.currently_running_run_id = None # In case we didn't use self.run_done()
 
-    self.download_data()
+      self.read_status_columns(if_changed=True)
 
-    for i in range(len(self.values["status"])):
-      if self.values["status"][i] == "ready" and self.values["worker_name"][i] == "":
-        config = self.get_run_config(i)
-        self.currently_running_config = config # We store the config that has gsheets values + gsheets defaults, not the one with hardcoded defaults
-        if self.hardcoded_default_config is not None:
-          config = GSheetsMLScheduler.complete_missing_config_params(config, self.hardcoded_default_config)
-        return i, config
+      while True:
+        i = self.next_claimable_run()
+        if i is None:
+          break
+        self.read_run_lines([i], if_changed=True) # Fresh config values of that line, which also updates the index
+        if self.is_claimable(i):
+          config = self.get_run_config(i)
+          self.currently_running_config = config # We store the config that has gsheets values + gsheets defaults, not the one with hardcoded defaults
+          if self.hardcoded_default_config is not None:
+            config = GSheetsMLScheduler.complete_missing_config_params(config, self.hardcoded_default_config)
+          return i, config
 
-    return None, None
+      return None, None
 
   def claim_and_start_run(self, run_id):
     """
     In case you use multiple Colab sessions at the same time, there are some checks to claim a run,
     to avoid having two sessions starting the same run
 
+    Uses the protocol selected by claim_mode: lease_claim_and_start_run (default) or legacy_claim_and_start_run
+    """
+    with self.lock:
+      start_time = time.perf_counter()
+      if self.claim_mode == "legacy":
+        claim_success = self.legacy_claim_and_start_run(run_id)
+      else:
+        claim_success = self.lease_claim_and_start_run(run_id)
+      self.record_claim(claim_success, start_time)
+      return claim_success
+
+  def record_claim(self, claim_success, start_time):
+    """
+    Updates claim_stats after a single run claim that started at start_time (time.perf_counter)
+    """
+    self.claim_stats["attempts"] += 1
+    self.claim_stats["wins" if claim_success else "losses"] += 1
+    self.claim_stats["time_s"] += time.perf_counter() - start_time
+
+  def legacy_claim_and_start_run(self, run_id):
+    """
     The claimer downloads the sheet and checks that the worker_name cell is empty
     The claimer writes its worker_name in the sheet and waits for 2 seconds
     Then, it downloads the sheet content a second time and if its worker_name didn't get erased by another worker, then it's safe to claim
     """
+    if not self.begin_legacy_claim(run_id):
+      return False
+
+    # Part 2: Wait long enough for another worker to eventually erase your claim
+    time.sleep(LEGACY_CLAIM_WAIT_S)
+
+    return self.finish_legacy_claim_and_start_run(run_id)
+
+  def begin_legacy_claim(self, run_id):
+    """
+    Part 1 of legacy_claim_and_start_run, before the wait
+    """
     # Part 1: Download and check that "worker_name" is empty aka no other worker claimed it
     self.download_data()
     if not(self.values["status"][run_id] == "ready"):
@@ -231,11 +678,13 @@ class GSheetsMLScheduler():
       print(f'Failure, run {run_id} ({self.values["run_name"][run_id]}) is already claimed by the worker <{self.values["worker_name"][run_id]}>')
       self.currently_running_config = None
       return False
-    self.sheet.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], self.worker_name) # Gsheets (0,0) cell is called (1,1)
-
-    # Part 2: Wait long enough for another worker to eventually erase your claim
-    time.sleep(2.0)
+    self.sheet.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], self.worker_name) # Gsheets (0,0) cell is called (1,1). Not buffered, the claim must be visible before waiting
+    return True
 
+  def finish_legacy_claim_and_start_run(self, run_id):
+    """
+    Part 3 of legacy_claim_and_start_run, after the wait
+    """
     # Part 3: If nobody erased your claim
     self.download_data()
     if not(self.values["status"][run_id] == "ready"):
@@ -247,73 +696,512 @@ class GSheetsMLScheduler():
       self.currently_running_config = None
       return False
 
-    self.sheet.update_cell(1+2+run_id, 1+self.key_ids["status"], "running")
-    #cell_name = rowcol_to_a1(1+2+run_id, 1+self.key_ids["status"])
-    cell_name = rowcol_to_a1(1+2+run_id, 1) + ":" + rowcol_to_a1(1+2+run_id, self.size[1])
-    self.sheet.format(cell_name, {"backgroundColor": self.colors["running"]}) # Running orange
+    self.start_claimed_run(run_id)
+    return True
+
+  def lease_claim_and_start_run(self, run_id):
+    """
+    The claimer reads only the line of the run and checks that it's ready and that worker_name is empty (or holds an expired lease)
+    The claimer writes a lease "<worker_name>|<token>|<expiry>" in the worker_name cell
+    and waits for claim_wait_time(), which is sized to the measured API latency instead of a constant
+    Then, it reads the line back: if its lease didn't get overwritten by another worker, then it's safe to claim
+
+    Any competitor that read the line before the lease was written writes its own lease at most one read+write round-trip later,
+    so after the wait the last written lease is the only one left, and every worker agrees on the winner
+    """
+    leases = self.write_leases([run_id])
+    if len(leases) > 0:
+      time.sleep(self.claim_wait_time())
+    return self.finish_lease_claim_and_start_run(run_id, leases)
+
+  def finish_lease_claim_and_start_run(self, run_id, leases):
+    """
+    Second half of lease_claim_and_start_run, after the wait
+    """
+    if len(leases) == 0 or len(self.check_leases(leases)) == 0:
+      self.currently_running_config = None
+      return False
+
+    self.currently_running_config = self.get_run_config(run_id) # The freshly read line
+    self.start_claimed_run(run_id)
+    return True
+
+  def write_leases(self, run_ids):
+    """
+    Reads the lines of run_ids, then writes a lease on the claimable ones in a single API call
+
+    Returns: leases = {run_id: lease_str, ...}
+    """
+    self.read_run_lines(run_ids)
+    self.taken_over_run_ids.difference_update(run_ids) # Our new claims can write these lines again
+    token = GSheetsMLScheduler.generate_short_uuid()
+    expiry_time = time.time() + self.lease_duration_s
+    leases = {}
+    for run_id in run_ids:
+      if not self.is_claimable(run_id):
+        print(f'Failure, run {run_id} ({self.values["run_name"][run_id]}) can\'t be claimed. Status: {self.values["status"][run_id]}, worker: <{self.values["worker_name"][run_id]}>')
+        continue
+      leases[run_id] = GSheetsMLScheduler.make_lease(self.worker_name, token, expiry_time)
+      if self.values["status"][run_id] != "ready":
+        self.replaced_worker_names[run_id] = self.values["worker_name"][run_id]
+      self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], leases[run_id])
+    if len(leases) > 0:
+      start_time = time.perf_counter()
+      self.write_buffer.flush() # Not subject to auto_flush, the leases must be visible before waiting
+      self.api_latencies["write"].append(time.perf_counter() - start_time)
+    return leases
+
+  def check_leases(self, leases):
+    """
+    Reads back the lines of the leased runs
+    A lease on a stale run (see is_stale) only wins if its heartbeat is still old: otherwise its worker is alive and gets its worker_name back
+
+    Returns: the list of run_ids for which our lease is still in place
+    """
+    self.read_run_lines(list(leases.keys()))
+    won_run_ids = []
+    for run_id, lease in leases.items():
+      replaced_worker_name = self.replaced_worker_names.pop(run_id, None)
+      if replaced_worker_name is not None and self.values["worker_name"][run_id] == lease and self.values["status"][run_id] in self.reclaimable_statuses:
+        if self.heartbeat_is_old(run_id):
+          print(f'Run {run_id} ({self.values["run_name"][run_id]}) taken over from the worker <{replaced_worker_name}>, no heartbeat for more than {self.lease_timeout_s}s')
+          won_run_ids.append(run_id)
+        else: # The worker was alive after all, it gets its run back
+          print(f'Failure, the worker <{replaced_worker_name}> of the run {run_id} ({self.values["run_name"][run_id]}) is alive')
+          self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], replaced_worker_name)
+          self.write_buffer.flush() # Not subject to auto_flush
+          self.values["worker_name"][run_id] = replaced_worker_name
+      elif not(self.values["status"][run_id] == "ready"):
+        print(f"Failure, run {run_id} ({self.values['run_name'][run_id]}) isn't ready to be claimed. Status: {self.values['status'][run_id]}")
+      elif not(self.values["worker_name"][run_id] == lease):
+        print(f'Failure, your claim on the run {run_id} ({self.values["run_name"][run_id]}) has been stolen by the worker <{self.values["worker_name"][run_id]}>')
+      else:
+        won_run_ids.append(run_id)
+    return won_run_ids
+
+  def claim_wait_time(self):
+    """
+    Jittered wait of the lease claim: claim_wait_factor times the worst recent read+write latency, at least min_claim_wait_s
+    """
+    read_latency = max(self.api_latencies["read"], default=self.min_claim_wait_s)
+    write_latency = max(self.api_latencies["write"], default=self.min_claim_wait_s)
+    wait_time = max(self.min_claim_wait_s, self.claim_wait_factor*(read_latency + write_latency))
+    return wait_time*random.uniform(1.0, 1.0 + self.claim_wait_jitter)
+
+  def claim_loss_rate(self):
+    """
+    Fraction of the claim attempts that were lost to another worker (or found the run not ready anymore)
+    """
+    if self.claim_stats["attempts"] == 0:
+      return 0.0
+    return self.claim_stats["losses"]/self.claim_stats["attempts"]
+
+  def claim_overhead_per_run(self):
+    """
+    Time spent in the claim protocol divided by the number of claimed runs (amortized by claim_runs)
+    """
+    if self.claim_stats["wins"] == 0:
+      return 0.0
+    return self.claim_stats["time_s"]/self.claim_stats["wins"]
+
+  def claim_runs(self, nb_runs):
+    """
+    Claims up to nb_runs ready runs in a single lease protocol round:
+    one read of their lines + one lease write for all of them, one wait, one read back (see lease_claim_and_start_run)
+
+    The claimed runs get the status "queued" and are put in self.prefetched_run_ids, find_claim_and_start_run starts them one by one
+    Returns: the list of claimed run_ids
+    """
+    with self.lock:
+      start_time = time.perf_counter()
+      run_ids, leases = self.begin_claim_runs(nb_runs)
+      if len(leases) > 0:
+        time.sleep(self.claim_wait_time())
+      return self.finish_claim_runs(run_ids, leases, start_time)
+
+  def begin_claim_runs(self, nb_runs):
+    """
+    First half of claim_runs, before the wait
+    Returns: run_ids, leases. The candidate runs and the leases written on them
+    """
+    self.read_status_columns()
+    run_ids = self.next_claimable_runs(nb_runs)
+    if len(run_ids) == 0:
+      return [], {}
+    return run_ids, self.write_leases(run_ids)
+
+  def finish_claim_runs(self, run_ids, leases, start_time):
+    """
+    Second half of claim_runs, after the wait
+    """
+    won_run_ids = self.check_leases(leases) if len(leases) > 0 else []
+    for run_id in won_run_ids:
+      self.write_status(run_id, "queued")
+      self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], self.worker_name)
+      self.values["worker_name"][run_id] = self.worker_name
+      self.prefetched_run_ids.append(run_id)
+    self.write_buffer.flush() # Not subject to auto_flush, the claims must be visible
+
+    self.claim_stats["attempts"] += len(run_ids)
+    self.claim_stats["wins"] += len(won_run_ids)
+    self.claim_stats["losses"] += len(run_ids) - len(won_run_ids)
+    self.claim_stats["time_s"] += time.perf_counter() - start_time
+    return won_run_ids
+
+  def release_prefetched_runs(self):
+    """
+    Gives the claimed runs that weren't started back to the other workers: status "ready" and empty worker_name
+    """
+    with self.lock:
+      if len(self.prefetched_run_ids) == 0:
+        return
+      run_ids = self.owned_queued_runs(list(self.prefetched_run_ids))
+      self.prefetched_run_ids.clear()
+      for run_id in run_ids:
+        self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["status"], "ready")
+        self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], "")
+        self.values["status"][run_id] = "ready"
+        self.values["worker_name"][run_id] = ""
+      self.flush() # Not subject to auto_flush
+
+  def close(self):
+    """
+    Stops the background sync, releases the prefetched runs and sends the buffered writes. Called automatically when the scheduler is used in a `with` block
+    """
+    self.stop_background_sync()
+    self.release_prefetched_runs()
+    self.flush()
+    if self.exit_callback is not None:
+      atexit.unregister(self.exit_callback)
+      self.exit_callback = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def start_claimed_run(self, run_id):
+    """
+    Writes "running" and our worker_name, colors the line and writes in gray the config values copied from defaults
+    """
+    self.stop_background_sync() # It was syncing the previous run
+    # All the writes below are sent together by flush()
+    self.write_status(run_id, "running")
+    self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], self.worker_name) # Replaces the lease, if any
+    self.formatter.forget_line(1+2+run_id) # New run on that line
+    self.formatter.format_line(1+2+run_id, self.size[1], {"backgroundColor": self.colors["running"]}) # Running orange
 
     # Write in gray the config values copied from default
+    default_cols = []
     for config_key in self.config_keys:
       if self.currently_running_config[config_key] != self.values[config_key][run_id]:
-        self.sheet.update_cell(1+2+run_id, 1+self.key_ids[config_key], self.currently_running_config[config_key])
-        cell_name = rowcol_to_a1(1+2+run_id, 1+self.key_ids[config_key])
-        self.sheet.format(cell_name, {"textFormat": {"foregroundColor": self.colors["default_text"]}}) # Default gray
+        self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids[config_key], self.currently_running_config[config_key])
+        default_cols.append(1+self.key_ids[config_key])
+    self.formatter.format_cells(1+2+run_id, default_cols, {"textFormat": {"foregroundColor": self.colors["default_text"]}}) # Default gray
+    self.maybe_flush()
 
+    self.values["worker_name"][run_id] = self.worker_name
     self.currently_running_run_id = run_id
-    return True
+    self.running_configs[run_id] = self.currently_running_config
+
+  def start_prefetched_run(self):
+    """
+    Starts the next run of the prefetch queue that is still ours (see owned_queued_runs)
+    Without lease_timeout_s there is no read: its line was read when it was claimed
+    Returns: run_id, config (None, None if the queue is empty)
+    """
+    with self.lock:
+      while len(self.prefetched_run_ids) > 0:
+        run_id = self.prefetched_run_ids.popleft()
+        if len(self.owned_queued_runs([run_id])) == 0:
+          continue
+        self.currently_running_config = self.get_run_config(run_id)
+        self.start_claimed_run(run_id)
+        config = self.currently_running_config
+        if self.hardcoded_default_config is not None:
+          config = GSheetsMLScheduler.complete_missing_config_params(config, self.hardcoded_default_config)
+        return run_id, config
+      return None, None
+
+  def owned_queued_runs(self, run_ids):
+    """
+    With lease_timeout_s, queued runs can be taken over like running ones (see RECLAIMABLE_STATUSES): their lines are read again (a single API call)
+    A lease of another worker on a queued line is either a takeover that our heartbeats make fail, or a losing claim written late: the line is still ours
+
+    Returns: the run_ids that are still "queued" by this worker
+    """
+    if self.lease_timeout_s is None or len(run_ids) == 0:
+      return run_ids
+    self.read_run_lines(run_ids)
+    owned_run_ids = []
+    for run_id in run_ids:
+      if self.check_taken_over(run_id):
+        continue
+      worker_name_cell = self.values["worker_name"][run_id]
+      if self.values["status"][run_id] != "queued" or (worker_name_cell != self.worker_name and GSheetsMLScheduler.parse_lease(worker_name_cell) is None):
+        print(f'Failure, the queued run {run_id} ({self.values["run_name"][run_id]}) isn\'t ours anymore. Status: {self.values["status"][run_id]}, worker: <{worker_name_cell}>')
+        continue
+      owned_run_ids.append(run_id)
+    return owned_run_ids
 
   def find_claim_and_start_run(self, auto_retry=3):
     """
     auto_retry is the number of retries in case another worker steals your claim
     Returns: run_name, config. In this function (unlike in find_ready_run) it returns run_name cell, not the run_id
+
+    With prefetch > 1, runs are taken from the local queue, which is refilled with claim_runs(prefetch) when empty
     """
-    while True:
-      ready_run_id, config = self.find_ready_run()
+    with self.lock:
+      if self.prefetch > 1:
+        for _ in range(auto_retry+1):
+          if len(self.prefetched_run_ids) == 0:
+            self.claim_runs(self.prefetch)
+          run_id, config = self.start_prefetched_run()
+          if run_id is not None:
+            return self.values["run_name"][run_id], config
+          if self.next_claimable_run() is None:
+            break # No run is ready
+        return None, None
 
-      if ready_run_id is None:
-        return None, None # No run is ready
-      else:
-        claim_success = self.claim_and_start_run(ready_run_id)
-        if not claim_success:
-          if auto_retry > 0:
-            print(f"Retry finding another ready run ({auto_retry-1} retries left)")
-            return self.find_claim_and_start_run(auto_retry=auto_retry-1)# Your claim got stolen, recursively retry
-          else:
-            print("Too much claim stealing, we abandon")
-            return None, None # We abandon, as if there was no run ready
+      while True:
+        ready_run_id, config = self.find_ready_run()
+
+        if ready_run_id is None:
+          return None, None # No run is ready
         else:
-          return self.values["run_name"][ready_run_id], config # successful claim
+          claim_success = self.claim_and_start_run(ready_run_id)
+          if not claim_success:
+            if auto_retry > 0:
+              print(f"Retry finding another ready run ({auto_retry-1} retries left)")
+              return self.find_claim_and_start_run(auto_retry=auto_retry-1)# Your claim got stolen, recursively retry
+            else:
+              print("Too much claim stealing, we abandon")
+              return None, None # We abandon, as if there was no run ready
+          else:
+            return self.values["run_name"][ready_run_id], config # successful claim
 
-  def run_done(self, new_status_str="done"):
+  def run_done(self, new_status_str="done", run_id=None):
     """
     Writes "status" as "finished" and changes the line color
+
+    run_id (int, optional): The run to end, default is the last started run. Runs started with prefetch are tracked separately until their own run_done
+    Returns: False if there is no active run, or if another worker took the run over (nothing is written then)
     """
-    if self.currently_running_run_id is None:
+    if run_id is None:
+      run_id = self.currently_running_run_id
+    if run_id is None:
       print("Failure, there is no active run")
       return False
+    self.runs_done({run_id: new_status_str})
+    return run_id not in self.taken_over_run_ids
 
-    self.download_data()
-    self.sheet.update_cell(1+2+self.currently_running_run_id, 1+self.key_ids["status"], new_status_str)
-    cell_name = rowcol_to_a1(1+2+self.currently_running_run_id, 1) + ":" + rowcol_to_a1(1+2+self.currently_running_run_id, self.size[1])
-    self.sheet.format(cell_name, {"backgroundColor": self.colors["done"]}) # Done blue
+  def runs_done(self, new_status_strs):
+    """
+    new_status_strs (dict): new_status_strs[run_id] is the final status of each run to end
 
-    self.currently_running_config = None
-    self.currently_running_run_id = None
-    return True
+    Same as run_done for several runs at once: their lines are read in one request and the writes are sent with one flush
+    Nothing is written on the lines of the runs taken over by other workers (see check_taken_over)
+    """
+    if len(new_status_strs) == 0:
+      return
+    if self.currently_running_run_id in new_status_strs:
+      self.stop_background_sync() # Sends its last pending status first
+
+    with self.lock:
+      self.read_or_keep_snapshot(self.read_run_lines, list(new_status_strs.keys())) # In case columns moved
+      self.write_pending_metrics(list(new_status_strs.keys())) # Last values given to log()
+      for run_id, new_status_str in new_status_strs.items():
+        if self.check_taken_over(run_id):
+          continue # The new owner writes its own status
+        self.write_status(run_id, new_status_str)
+        self.formatter.format_line(1+2+run_id, self.size[1], {"backgroundColor": self.colors["done"]}) # Done blue
+      self.maybe_flush()
 
-  def update_status(self, new_status_str):
+      for run_id in new_status_strs:
+        self.running_configs.pop(run_id, None)
+        self.last_heartbeat_times.pop(run_id, None)
+        if run_id == self.currently_running_run_id:
+          self.currently_running_config = None
+          self.currently_running_run_id = None
+
+  def update_status(self, new_status_str, flush=True, run_id=None):
     """
     Update the status of the currently runnning run
+
+    flush (bool, optional): Set to False to keep the write in the buffer, it is then sent with the next flush
+    run_id (int, optional): The run to update, default is the last started run
     """
-    if self.currently_running_run_id is None:
+    if run_id is None:
+      run_id = self.currently_running_run_id
+    if run_id is None:
       print("Failure, no currently runnning run")
       return
+    if self.is_synced_in_background(run_id):
+      self.background_sync.set_status(new_status_str) # Non-blocking, written by the next poll
+      return
+
+    with self.lock:
+      self.write_status(run_id, new_status_str)
+      if flush:
+        self.maybe_flush()
+
+  def log(self, metrics, run_id=None):
+    """
+    Records metrics of the running run in the "metric_<name>" columns of its line, the missing columns are created by the next flush
+
+    metrics (dict): {name: value, ...}, for example {"loss": 0.31, "accuracy": 0.92, "epoch": 3}
+    run_id (int, optional): The run of the metrics, default is the last started run
+
+    Non-blocking most of the time: values are kept locally (only the latest value of each metric) and sent at most once per metrics_interval_s,
+    by the first log() after the interval. They also go with any other write of the scheduler (update_status, polls, flush), and run_done sends the last ones
+    With a background sync, they are sent by its polls
+    The metrics of new columns wait for the next flush: log() never waits for a column creation (see add_columns)
+    """
+    if run_id is None:
+      run_id = self.currently_running_run_id
+    if run_id is None:
+      print("Failure, no currently runnning run")
+      return
+    with self.metrics_lock:
+      self.pending_metrics.setdefault(run_id, {}).update(metrics)
+    if self.is_synced_in_background(run_id):
+      return
+    if self.last_metrics_write_time is None or time.monotonic() - self.last_metrics_write_time >= self.metrics_interval_s:
+      with self.lock:
+        self.write_pending_metrics(create_columns=False)
+        if self.auto_flush:
+          self.send_buffered_writes()
+
+  def write_pending_metrics(self, run_ids=None, create_columns=True):
+    """
+    Moves the metrics given to log() into the write buffer
+
+    run_ids (list, optional): Only the metrics of these runs, default is all of them
+    create_columns (bool, optional): If False, the metrics without a column stay pending instead of creating it
+    """
+    with self.lock:
+      with self.metrics_lock:
+        if run_ids is None:
+          run_ids = list(self.pending_metrics.keys())
+        run_metrics = {run_id: self.pending_metrics.pop(run_id) for run_id in run_ids if run_id in self.pending_metrics}
+        if not create_columns:
+          for run_id, metrics in run_metrics.items():
+            new_column_metrics = {name: value for name, value in metrics.items() if METRIC_PREFIX + name not in self.key_ids}
+            if len(new_column_metrics) > 0:
+              self.pending_metrics[run_id] = new_column_metrics
+              run_metrics[run_id] = {name: value for name, value in metrics.items() if name not in new_column_metrics}
+      run_metrics = {run_id: metrics for run_id, metrics in run_metrics.items() if run_id not in self.taken_over_run_ids and len(metrics) > 0}
+      if len(run_metrics) == 0:
+        return
+      new_keys = []
+      for metrics in run_metrics.values():
+        new_keys += [METRIC_PREFIX + name for name in metrics if METRIC_PREFIX + name not in self.key_ids and METRIC_PREFIX + name not in new_keys]
+      if len(new_keys) > 0:
+        try:
+          self.add_columns(new_keys)
+        except Exception as error:
+          if self.local_cache is None or is_permanent_error(error):
+            with self.metrics_lock: # Sent again by the next flush, the values logged in the meantime are more recent
+              for run_id, metrics in run_metrics.items():
+                self.pending_metrics[run_id] = dict(metrics, **self.pending_metrics.get(run_id, {}))
+            raise
+          unsent_values = [(1+2+run_id, METRIC_PREFIX + name, value) for run_id, metrics in run_metrics.items() for name, value in metrics.items() if METRIC_PREFIX + name not in self.key_ids]
+          self.local_cache.journal_writes(self.gsheets_file_url, self.sheet_index, self.worker_name, unsent_values, [])
+          print(f"Failure, sheet unreachable ({error}), {len(unsent_values)} metrics of new columns journaled") # merge_journal creates their columns
+      for run_id, metrics in run_metrics.items():
+        for name, value in metrics.items():
+          key = METRIC_PREFIX + name
+          if key not in self.key_ids:
+            continue # Journaled above
+          self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids[key], value)
+          self.values[key][run_id] = str(value)
+      self.last_metrics_write_time = time.monotonic()
+
+  def heartbeat(self, run_id=None):
+    """
+    Writes only the heartbeat of the running run, for trainings that don't update their status nor poll their config for longer than lease_timeout_s
+
+    run_id (int, optional): The run to keep alive, default is the last started run
+    """
+    with self.lock:
+      if run_id is None:
+        run_id = self.currently_running_run_id
+      if run_id is None:
+        print("Failure, no currently runnning run")
+        return
+      self.write_heartbeat(run_id)
+      self.maybe_flush()
+
+  def write_status(self, run_id, new_status_str):
+    """
+    Buffers a status write, together with a heartbeat if the sheet has a "heartbeat" column (sent in the same batch update)
+    Nothing is written on the line of a run taken over by another worker
+    """
+    if run_id in self.taken_over_run_ids:
+      return
+    self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["status"], new_status_str)
+    self.values["status"][run_id] = new_status_str
+    self.write_heartbeat(run_id)
+
+  def write_heartbeat(self, run_id):
+    """
+    The heartbeats of the queued runs that are due go with the ones of the started runs: queued runs can be taken over too (see RECLAIMABLE_STATUSES)
+    A lease left on the line of a started run is replaced by our worker_name (see replace_lease_on_started_run), even without a "heartbeat" column
+    """
+    if run_id in self.taken_over_run_ids:
+      return
+    self.replace_lease_on_started_run(run_id)
+    if "heartbeat" not in self.key_ids:
+      return
+    now = time.time()
+    self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["heartbeat"], int(now))
+    self.values["heartbeat"][run_id] = str(int(now))
+    self.last_heartbeat_times[run_id] = now
+    if run_id not in self.prefetched_run_ids:
+      for queued_run_id in self.prefetched_run_ids:
+        if self.heartbeat_due(queued_run_id):
+          self.write_heartbeat(queued_run_id)
 
-    self.sheet.update_cell(1+2+self.currently_running_run_id, 1+self.key_ids["status"], new_status_str)
+  def replace_lease_on_started_run(self, run_id):
+    """
+    A lease of another worker can stay in the worker_name cell of a run we started: a losing claim whose write arrived late
+    (e.g. delayed by 429 backoffs), or a takeover attempt. Nothing would ever remove it, and other workers, merge_journal and check_taken_over
+    read that cell: if the last read of the line shows a lease, our worker_name is written again
+    """
+    if run_id not in self.running_configs or GSheetsMLScheduler.parse_lease(self.values["worker_name"][run_id]) is None:
+      return
+    self.write_buffer.update_cell(1+2+run_id, 1+self.key_ids["worker_name"], self.worker_name)
+    self.values["worker_name"][run_id] = self.worker_name
+
+  def heartbeat_due(self, run_id):
+    """
+    True if the last heartbeat of run_id is older than a quarter of lease_timeout_s, polls then write one
+    """
+    if self.lease_timeout_s is None or "heartbeat" not in self.key_ids:
+      return False
+    return time.time() - self.last_heartbeat_times.get(run_id, 0.0) >= self.lease_timeout_s/4
+
+  def check_taken_over(self, run_id):
+    """
+    True if, in the last read of its line, another worker took over run_id (no heartbeat of ours for more than lease_timeout_s)
+    From then on nothing is written on that line, the pending writes of the line are dropped: they would overwrite the status of the new owner
+    The training of that run should stop, its run_done writes nothing and returns False
+    """
+    if run_id in self.taken_over_run_ids:
+      return True
+    worker_name_cell = self.values["worker_name"][run_id]
+    if self.lease_timeout_s is None or worker_name_cell in ("", self.worker_name) or GSheetsMLScheduler.parse_lease(worker_name_cell) is not None:
+      return False # A lease on our line is a late losing claim or a takeover attempt, our next status or heartbeat write replaces it
+    print(f'Failure, the run {run_id} ({self.values["run_name"][run_id]}) was taken over by the worker <{worker_name_cell}>, no heartbeat for more than {self.lease_timeout_s}s')
+    self.taken_over_run_ids.add(run_id)
+    self.write_buffer.forget_row(1+2+run_id)
+    return True
 
   def check_for_config_updates(self):
     """
-    Downloads the sheet content and check if some config parameters changed
+    Downloads the header, the defaults and the line of the running run, and check if some config parameters changed
+    If a background sync is running (see start_background_sync), nothing is downloaded: its latest snapshot is returned
 
     Returns:
       updated_config = {config_key: config_value, ...} The most up-to-date dictionary of config metaparameters
@@ -322,29 +1210,52 @@ class GSheetsMLScheduler():
     if self.currently_running_run_id is None:
       print("Failure, no currently runnning run")
       return
+    if self.is_synced_in_background(self.currently_running_run_id):
+      return self.background_sync.consume_updates()
+    return self.poll_config_updates()
 
-    self.download_data()
-    updated_config = self.get_run_config(self.currently_running_run_id)
+  def poll_config_updates(self, new_status_str=None, flush=False):
+    """
+    The blocking part of sync_config_and_status, also used by the background sync thread
 
-    changed_keys = []
-    for key in updated_config.keys():
-      if key not in self.currently_running_config.keys():
-        changed_keys.append(key)
-      elif updated_config[key] != self.currently_running_config[key]:
-        changed_keys.append(key)
-    for key in changed_keys:
-      cell_name = rowcol_to_a1(1+2+self.currently_running_run_id, 1+self.key_ids[key])
-      self.sheet.format(cell_name, {"textFormat": {"foregroundColor": self.colors["modified_text"]}}) # Modified green
+    flush (bool, optional): Send the writes even with auto_flush=False, the background sync thread always does
+    """
+    with self.lock:
+      run_id = self.currently_running_run_id
+      if new_status_str is not None:
+        self.write_status(run_id, new_status_str) # Sent together with the formats below
+      elif self.heartbeat_due(run_id):
+        self.write_heartbeat(run_id)
 
-    self.currently_running_config = updated_config
+      self.read_or_keep_snapshot(self.read_run_lines, [run_id], True)
+      taken_over = self.check_taken_over(run_id)
+      updated_config = self.get_run_config(self.currently_running_run_id)
 
-    if self.hardcoded_default_config is not None:
-      updated_config = GSheetsMLScheduler.complete_missing_config_params(updated_config, self.hardcoded_default_config)
-    return updated_config, changed_keys
+      changed_keys = []
+      for key in updated_config.keys():
+        if key not in self.currently_running_config.keys():
+          changed_keys.append(key)
+        elif updated_config[key] != self.currently_running_config[key]:
+          changed_keys.append(key)
+      if not taken_over:
+        modified_cols = [1+self.key_ids[key] for key in changed_keys]
+        self.formatter.format_cells(1+2+self.currently_running_run_id, modified_cols, {"textFormat": {"foregroundColor": self.colors["modified_text"]}}) # Modified green
+      if flush:
+        self.flush()
+      else:
+        self.maybe_flush()
+
+      self.currently_running_config = updated_config
+      self.running_configs[self.currently_running_run_id] = updated_config
+
+      if self.hardcoded_default_config is not None:
+        updated_config = GSheetsMLScheduler.complete_missing_config_params(updated_config, self.hardcoded_default_config)
+      return updated_config, changed_keys
 
   def sync_config_and_status(self, new_status_str=None):
     """
     Two actions in one: update_status(new_status_str) and check_for_config_updates()
+    With a background sync, both are non-blocking
 
     new_status_str (default: None) Provide None as input if you only want to fetch config updates
 
@@ -352,7 +1263,216 @@ class GSheetsMLScheduler():
       updated_config = {config_key: config_value, ...} The most up-to-date dictionary of config metaparameters
       changed_keys = [changed_config_key, ...] The list of config keys for which the value was modified
     """
-    if new_status_str is not None:
-      self.update_status(new_status_str)
-    updated_config, changed_keys = self.check_for_config_updates()
-    return updated_config, changed_keys
+    if self.currently_running_run_id is None:
+      print("Failure, no currently runnning run")
+      return
+    if self.is_synced_in_background(self.currently_running_run_id):
+      if new_status_str is not None:
+        self.background_sync.set_status(new_status_str)
+      return self.background_sync.consume_updates()
+    return self.poll_config_updates(new_status_str)
+
+  def start_background_sync(self, min_interval_s=5.0, max_interval_s=60.0, backoff_factor=1.5, callback=None):
+    """
+    Opt-in: polls the line of the running run in a background thread (see BackgroundConfigSync)
+    Afterwards update_status, check_for_config_updates and sync_config_and_status don't block anymore,
+    and scheduler.background_sync.config always holds the latest merged config
+    The thread stops with run_done, or with stop_background_sync()
+
+    min_interval_s (float, optional): Polling interval right after a config change
+    max_interval_s (float, optional): The interval grows by backoff_factor after each poll without change, up to max_interval_s
+    callback (function, optional): callback(updated_config, changed_keys), called from the background thread when the config changed
+
+    Returns: the BackgroundConfigSync thread
+    """
+    if self.currently_running_run_id is None:
+      print("Failure, no currently runnning run")
+      return None
+    self.stop_background_sync()
+    self.background_sync = BackgroundConfigSync(self, min_interval_s, max_interval_s, backoff_factor, callback)
+    self.background_sync.start()
+    return self.background_sync
+
+  def stop_background_sync(self):
+    """
+    Stops the background thread after its last pending status write
+    """
+    if self.background_sync is not None:
+      background_sync = self.background_sync
+      background_sync.stop()
+      self.background_sync = None
+      if background_sync.pending_status is not None: # The thread gave up its last poll, the caller of stop_background_sync held self.lock
+        with self.lock:
+          self.write_status(background_sync.run_id, background_sync.pending_status)
+          self.flush()
+
+  def is_synced_in_background(self, run_id):
+    """
+    True if run_id is synced by the background thread and the caller isn't that thread
+    """
+    return (self.background_sync is not None and run_id == self.currently_running_run_id
+            and threading.current_thread() is not self.background_sync)
+
+  def flush(self):
+    """
+    Sends the buffered status/config/format writes: at most one value batch update and one format batch update
+    With a local cache, writes that can't be sent are journaled instead of raising an error, and sent together with the next flush
+    The metrics given to log() and not sent yet are sent too
+    """
+    with self.lock:
+      self.write_pending_metrics()
+      self.send_buffered_writes()
+
+  def send_buffered_writes(self):
+    """
+    flush() without the metrics given to log()
+    """
+    with self.lock:
+      if self.local_cache is None:
+        self.write_buffer.flush()
+        return
+      self.flush_with_journal(worker_name=self.worker_name)
+
+  def flush_with_journal(self, worker_name):
+    """
+    worker_name (str): Replays the journaled writes of that worker, None for the writes of the workers that are dead (see merge_journal)
+    """
+    new_values = [(row, self.keys[col-1], value) for (row, col), value in self.write_buffer.pending_values.items()]
+    new_formats = [(a1_to_rowcol(range_name.split(":")[0])[0], range_name, cell_format) for range_name, cell_format in self.write_buffer.pending_formats.items()]
+    replayed_value_ids, replayed_format_ids = [], []
+    try:
+      replayed_value_ids, replayed_format_ids = self.merge_journal(worker_name)
+      self.write_buffer.flush()
+    except Exception as error:
+      if is_permanent_error(error):
+        raise
+      if len(self.write_buffer.pending_values) == 0: # The values were sent, only the formats failed
+        self.local_cache.delete_journal_entries(replayed_value_ids)
+        new_values = []
+      self.write_buffer.clear()
+      self.local_cache.journal_writes(self.gsheets_file_url, self.sheet_index, self.worker_name, new_values, new_formats)
+      print(f"Failure, sheet unreachable ({error}), {len(new_values) + len(new_formats)} writes journaled")
+      return
+    self.local_cache.delete_journal_entries(replayed_value_ids + replayed_format_ids)
+
+  def merge_journal(self, worker_name):
+    """
+    Puts the journaled writes in the write buffer, before the pending ones. Reconciliation with the sheet:
+    the writes of a line are only replayed if its worker_name is still the worker that made them (or its lease),
+    the writes of lines taken over by other workers in the meantime are dropped
+    With worker_name=None, the writes of other workers are only replayed once they're dead (see owner_is_stale), the others stay in the journal
+    The metric columns that couldn't be created offline (see write_pending_metrics) are created first
+    Returns: replayed_value_ids, replayed_format_ids. The ids of the replayed journal entries, to delete once they're sent
+    """
+    entries = self.local_cache.load_journal(self.gsheets_file_url, self.sheet_index, worker_name)
+    if len(entries) == 0:
+      return [], []
+    self.read_status_columns() # Current owners of the lines
+    new_metric_keys = []
+    for entry in entries:
+      if entry["key"] is not None and entry["key"].startswith(METRIC_PREFIX) and entry["key"] not in self.key_ids and entry["key"] not in new_metric_keys:
+        new_metric_keys.append(entry["key"])
+    if len(new_metric_keys) > 0:
+      self.add_columns(new_metric_keys)
+
+    journal_buffer = SheetWriteBuffer(self.sheet)
+    replayed_value_ids = []
+    replayed_format_ids = []
+    dropped_entry_ids = []
+    for entry in entries:
+      run_id = entry["row"] - 3
+      owner = self.values["worker_name"][run_id].split(LEASE_SEPARATOR)[0] if 0 <= run_id < self.nb_runs else None
+      if owner != entry["worker_name"] or (entry["key"] is not None and entry["key"] not in self.key_ids):
+        dropped_entry_ids.append(entry["id"])
+        continue
+      if entry["worker_name"] != self.worker_name and not self.owner_is_stale(run_id):
+        continue # That worker is alive, its next flush sends them
+      if entry["key"] is not None:
+        journal_buffer.update_cell(entry["row"], 1+self.key_ids[entry["key"]], entry["payload"])
+        if entry["key"] in ("status", "worker_name"):
+          self.values[entry["key"]][run_id] = entry["payload"]
+        replayed_value_ids.append(entry["id"])
+      else:
+        journal_buffer.format(entry["range_name"], entry["payload"])
+        replayed_format_ids.append(entry["id"])
+    if len(dropped_entry_ids) > 0:
+      print(f"Failure, {len(dropped_entry_ids)} journaled writes dropped, their lines were taken over by other workers")
+      self.local_cache.delete_journal_entries(dropped_entry_ids)
+
+    journal_buffer.pending_values.update(self.write_buffer.pending_values) # The pending writes are more recent
+    for (row, col), value in self.write_buffer.pending_values.items():
+      if self.keys[col-1] in ("status", "worker_name") and 0 <= row-3 < self.nb_runs:
+        self.values[self.keys[col-1]][row-3] = value # Not sent yet, read_status_columns overwrote them
+    for range_name, cell_format in self.write_buffer.pending_formats.items():
+      journal_buffer.format(range_name, cell_format)
+    self.write_buffer.pending_values = journal_buffer.pending_values
+    self.write_buffer.pending_formats = journal_buffer.pending_formats
+    return replayed_value_ids, replayed_format_ids
+
+  def owner_is_stale(self, run_id):
+    """
+    True if the worker in the worker_name cell of run_id is dead: its lease expired, or its heartbeat is older than lease_timeout_s (see heartbeat_is_old)
+    """
+    lease = GSheetsMLScheduler.parse_lease(self.values["worker_name"][run_id])
+    if lease is not None:
+      return lease[2] < time.time()
+    return self.heartbeat_is_old(run_id)
+
+  def maybe_flush(self):
+    if self.auto_flush:
+      self.flush()
+
+  def stats(self):
+    """
+    Returns: a snapshot dict {"api", "claims", "rate_limiter"}
+    "api" is the ApiStats snapshot (None without instrumentation), "rate_limiter" the stats of the rate limiter (None without one)
+    """
+    rate_limiter = getattr(self.all_sheets, "rate_limiter", None)
+    return {
+      "api": self.api_stats.stats() if self.api_stats is not None else None,
+      "claims": dict(self.claim_stats, loss_rate=self.claim_loss_rate(), overhead_per_run_s=self.claim_overhead_per_run()),
+      "rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+    }
+
+def call_weak_method(weak_method):
+  """
+  Calls the method of a weakref.WeakMethod if its object still exists
+  """
+  method = weak_method()
+  if method is not None:
+    method()
+
+def read_header_line(sheet):
+  """
+  Returns: the first line of the sheet, without its trailing empty cells
+  """
+  header_line = sheet.batch_get(["1:1"])[0]
+  return trim_line(header_line[0] if len(header_line) > 0 else [])
+
+def write_column_names(sheet, keys, new_keys, wait_time):
+  """
+  keys (list): All the column names of the sheet, as read right before
+  new_keys (list): The names written after the last column
+
+  Writes new_keys, waits wait_time and reads the header back, see GSheetsMLScheduler.add_columns and GSheetsMLRunWriter.add_columns
+  Returns: False if the header isn't keys + new_keys: another worker or run writer wrote columns at the same time, read the header again and retry
+  """
+  first_col = len(keys) + 1
+  col_count = getattr(sheet, "col_count", None) # InMemorySpreadsheet worksheets have no grid limits
+  if col_count is not None and first_col + len(new_keys) - 1 > col_count:
+    sheet.add_cols(first_col + len(new_keys) - 1 - col_count)
+  header_buffer = SheetWriteBuffer(sheet)
+  for i, key in enumerate(new_keys):
+    header_buffer.update_cell(1, first_col+i, key)
+  header_buffer.flush()
+  time.sleep(wait_time)
+  return read_header_line(sheet) == trim_line(list(keys) + list(new_keys))
+
+def trim_line(line):
+  """
+  The Sheets API doesn't return trailing empty cells, get_all_values pads them: compare lines without them
+  """
+  line = list(line)
+  while len(line) > 0 and line[-1] == "":
+    line.pop()
+  return line
@@ -0,0 +1,33 @@
+import itertools
+import random
+
+def grid_search(param_grid, base_config=None):
+  """
+  param_grid (dict): param_grid[key] is the list of the values to try for key
+  base_config (dict, optional): Key/values added to every config
+
+  Yields: one config dict per combination of the Cartesian product of param_grid, lazily (no list of all the configs is built)
+  The last key varies fastest, like nested for loops. Give the generator to GSheetsMLRunWriter.write_runs
+  """
+  keys = list(param_grid.keys())
+  for values in itertools.product(*[param_grid[key] for key in keys]):
+    config = dict(base_config) if base_config is not None else {}
+    config.update(zip(keys, values))
+    yield config
+
+def random_search(param_distributions, nb_samples, seed=None, base_config=None):
+  """
+  param_distributions (dict): param_distributions[key] is either a list of values (uniformly sampled) or a function rng -> value,
+                              e.g. lambda rng: 10**rng.uniform(-5, -2) for a log-uniform learning rate (rng is a random.Random)
+  nb_samples (int): Number of configs
+  seed (int, optional): With a seed, the same configs are generated again, which write_runs(..., resume_from=...) relies on
+  base_config (dict, optional): Key/values added to every config
+
+  Yields: nb_samples config dicts, lazily
+  """
+  rng = random.Random(seed)
+  for _ in range(nb_samples):
+    config = dict(base_config) if base_config is not None else {}
+    for key, distribution in param_distributions.items():
+      config[key] = distribution(rng) if callable(distribution) else rng.choice(distribution)
+    yield config
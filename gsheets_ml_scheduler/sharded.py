@@ -0,0 +1,168 @@
+import itertools
+import zlib
+
+from .run_writer import GSheetsMLRunWriter, PartialWriteError, iter_chunks
+from .scheduler import GSheetsMLScheduler
+
+def shared_connection_kwargs(kwargs, connected):
+  """
+  kwargs of the scheduler/run writer of another shard: it reuses the spreadsheet of an already connected one
+  (already wrapped in its rate limiter and instrumentation, if any) instead of logging in again
+  """
+  kwargs = dict(kwargs)
+  kwargs["backend"] = connected.all_sheets
+  kwargs["rate_limiter"] = None
+  kwargs["instrumentation"] = None
+  return kwargs
+
+class ShardedGSheetsMLScheduler():
+  def __init__(self, gsheets_file_url, sheet_indices, **scheduler_kwargs):
+    """
+    gsheets_file_url (str): The URL of the Google Sheets file
+    sheet_indices (list): The worksheets (tabs) that form one logical run queue, each in the usual sheet format (e.g. one tab per sweep)
+    scheduler_kwargs: The other arguments of GSheetsMLScheduler (hardcoded_default_config, service_account_json_path, backend, prefetch...)
+
+    One GSheetsMLScheduler per shard, all with the same worker_name and a single login
+    Each worker has a home shard (hash of its worker_name) where it looks for ready runs first, then it tries the next shards in order
+    Workers are spread over the shards, so the reads and the claim contention of each worker only grow with the size of its shard
+    The scheduler of a shard is created (and its worksheet downloaded) the first time the worker looks into it
+    """
+    self.gsheets_file_url = gsheets_file_url
+    self.sheet_indices = list(sheet_indices)
+    self.scheduler_kwargs = scheduler_kwargs
+    self.worker_name = GSheetsMLScheduler.generate_short_uuid()
+
+    home_shard = zlib.crc32(self.worker_name.encode()) % len(self.sheet_indices)
+    self.shard_order = self.sheet_indices[home_shard:] + self.sheet_indices[:home_shard] # Home shard first
+    self.schedulers = {} # schedulers[sheet_index] = GSheetsMLScheduler of that shard
+    self.currently_running_sheet_index = None
+    self.get_scheduler(self.shard_order[0])
+
+  def get_scheduler(self, sheet_index):
+    if sheet_index not in self.schedulers:
+      kwargs = self.scheduler_kwargs
+      if len(self.schedulers) > 0:
+        kwargs = shared_connection_kwargs(kwargs, next(iter(self.schedulers.values())))
+      scheduler = GSheetsMLScheduler(self.gsheets_file_url, sheet_index=sheet_index, **kwargs)
+      scheduler.worker_name = self.worker_name
+      self.schedulers[sheet_index] = scheduler
+    return self.schedulers[sheet_index]
+
+  @property
+  def current_scheduler(self):
+    """
+    The scheduler of the shard of the last started run, None if no run was started
+    """
+    if self.currently_running_sheet_index is None:
+      return None
+    return self.schedulers[self.currently_running_sheet_index]
+
+  def find_claim_and_start_run(self, auto_retry=3):
+    """
+    Looks for a ready run in the home shard, then in the other shards
+    Returns: run_name, config. The shard of the run is in self.currently_running_sheet_index
+    """
+    for sheet_index in self.shard_order:
+      run_name, config = self.get_scheduler(sheet_index).find_claim_and_start_run(auto_retry=auto_retry)
+      if run_name is not None:
+        self.currently_running_sheet_index = sheet_index
+        return run_name, config
+    return None, None
+
+  def run_done(self, new_status_str="done"):
+    if self.current_scheduler is None:
+      print("Failure, there is no active run")
+      return False
+    return self.current_scheduler.run_done(new_status_str)
+
+  def update_status(self, new_status_str, flush=True):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return
+    self.current_scheduler.update_status(new_status_str, flush=flush)
+
+  def log(self, metrics):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return
+    self.current_scheduler.log(metrics)
+
+  def heartbeat(self):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return
+    self.current_scheduler.heartbeat()
+
+  def check_for_config_updates(self):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return
+    return self.current_scheduler.check_for_config_updates()
+
+  def sync_config_and_status(self, new_status_str=None):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return
+    return self.current_scheduler.sync_config_and_status(new_status_str)
+
+  def start_background_sync(self, **kwargs):
+    if self.current_scheduler is None:
+      print("Failure, no currently runnning run")
+      return None
+    return self.current_scheduler.start_background_sync(**kwargs)
+
+  def flush(self):
+    for scheduler in self.schedulers.values():
+      scheduler.flush()
+
+  def close(self):
+    for scheduler in self.schedulers.values():
+      scheduler.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def stats(self):
+    """
+    Returns: stats[sheet_index] is the stats() of the scheduler of each connected shard
+    """
+    return {sheet_index: scheduler.stats() for sheet_index, scheduler in self.schedulers.items()}
+
+class ShardedGSheetsMLRunWriter():
+  def __init__(self, gsheets_file_url, sheet_indices, **writer_kwargs):
+    """
+    gsheets_file_url (str): The URL of the Google Sheets file
+    sheet_indices (list): The worksheets (tabs) of the run queue, see ShardedGSheetsMLScheduler
+    writer_kwargs: The other arguments of GSheetsMLRunWriter (service_account_json_path, backend...)
+    """
+    self.writers = []
+    for sheet_index in sheet_indices:
+      kwargs = writer_kwargs if len(self.writers) == 0 else shared_connection_kwargs(writer_kwargs, self.writers[0])
+      self.writers.append(GSheetsMLRunWriter(gsheets_file_url, sheet_index=sheet_index, **kwargs))
+
+  def write_runs(self, configs, chunk_size=500, max_chunk_bytes=2000000, progress_callback=None, resume_from=0):
+    """
+    Same as GSheetsMLRunWriter.write_runs, each chunk is appended to the shard that has the fewest runs
+    Default run_names are numbers unique across the shards
+    """
+    for writer in self.writers:
+      writer.read_sheet_layout()
+
+    nb_total = len(configs) if hasattr(configs, "__len__") else None
+    configs = itertools.islice(configs, resume_from, None)
+    first_new_run_id = sum(writer.nb_runs for writer in self.writers)
+    nb_written = 0
+    for chunk in iter_chunks(configs, chunk_size, max_chunk_bytes):
+      chunk = [config if "run_name" in config else dict(config, run_name=first_new_run_id+nb_written+i) for i, config in enumerate(chunk)]
+      writer = min(self.writers, key=lambda writer: writer.nb_runs)
+      try:
+        writer.write_run_chunk(chunk)
+      except Exception as error:
+        raise PartialWriteError(resume_from + nb_written) from error
+      nb_written += len(chunk)
+      if progress_callback is not None:
+        progress_callback(resume_from + nb_written, nb_total)
+    return resume_from + nb_written
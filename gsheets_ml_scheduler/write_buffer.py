@@ -0,0 +1,84 @@
+from .a1_notation import a1_to_rowcol, rowcol_to_a1
+
+class SheetWriteBuffer():
+  def __init__(self, sheet):
+    """
+    sheet: The worksheet the buffered writes are sent to
+
+    Gathers cell value and cell format changes, then flush() sends them as
+    one values.batchUpdate (sheet.batch_update) plus one spreadsheets.batchUpdate (sheet.batch_format)
+    instead of one update_cell/format round-trip per change
+    """
+    self.sheet = sheet
+    self.pending_values = {} # pending_values[(row, col)] = value, a later write to the same cell replaces the earlier one
+    self.pending_formats = {} # pending_formats[a1_range] = format dict, merged key by key
+
+  def update_cell(self, row, col, value):
+    """
+    Same arguments as gspread update_cell: (1,1) is the top left cell
+    """
+    self.pending_values[(row, col)] = value
+
+  def format(self, range_name, cell_format):
+    """
+    Same arguments as gspread format, for a single A1 range
+    """
+    if range_name in self.pending_formats:
+      merged_format = dict(self.pending_formats[range_name])
+      merged_format.update(cell_format)
+      cell_format = merged_format
+    self.pending_formats[range_name] = cell_format
+
+  def is_empty(self):
+    return len(self.pending_values) == 0 and len(self.pending_formats) == 0
+
+  def clear(self):
+    self.pending_values = {}
+    self.pending_formats = {}
+
+  def forget_row(self, row):
+    """
+    Drops the pending value and format changes of a line (format ranges never span several lines)
+    """
+    self.pending_values = {(cell_row, col): value for (cell_row, col), value in self.pending_values.items() if cell_row != row}
+    self.pending_formats = {range_name: cell_format for range_name, cell_format in self.pending_formats.items() if a1_to_rowcol(range_name.split(":")[0])[0] != row}
+
+  def value_ranges(self):
+    """
+    Converts pending_values into batch_update ranges, contiguous cells of a same line are merged into one range
+    """
+    ranges = []
+    line_start = None
+    for row, col in sorted(self.pending_values.keys()):
+      value = self.pending_values[(row, col)]
+      if line_start is not None and row == line_start[0] and col == line_start[1] + len(line_values):
+        line_values.append(value)
+        continue
+      if line_start is not None:
+        ranges.append(get_line_range_dict(line_start, line_values))
+      line_start = (row, col)
+      line_values = [value]
+    if line_start is not None:
+      ranges.append(get_line_range_dict(line_start, line_values))
+    return ranges
+
+  def flush(self):
+    """
+    Sends all the pending changes, at most 2 API calls
+    Values are sent as USER_ENTERED (raw=False), like gspread update_cell does
+    If a call fails, its changes stay pending and are sent again by the next flush()
+    """
+    value_ranges = self.value_ranges()
+    if len(value_ranges) > 0:
+      self.sheet.batch_update(value_ranges, raw=False)
+    self.pending_values = {}
+
+    format_ranges = [{"range": range_name, "format": cell_format} for range_name, cell_format in self.pending_formats.items()]
+    if len(format_ranges) > 0:
+      self.sheet.batch_format(format_ranges)
+    self.pending_formats = {}
+
+def get_line_range_dict(line_start, line_values):
+  cell_name_start = rowcol_to_a1(line_start[0], line_start[1])
+  cell_name_end = rowcol_to_a1(line_start[0], line_start[1]+len(line_values)-1)
+  return {"range": f"{cell_name_start}:{cell_name_end}", "values": [line_values]}
@@ -0,0 +1,24 @@
+import contextlib
+import io
+import unittest
+
+def make_sheet_data(nb_runs, defaults=None):
+    """
+    A sheet in the template format: header line, defaults line, then nb_runs "ready" runs with empty config cells
+    defaults (dict, optional): {column name: default cell} of the columns after run_name/status/worker_name, default is {"lr": "0.1"}
+    """
+    defaults = {"lr": "0.1"} if defaults is None else defaults
+    data = [["run_name", "status", "worker_name"] + list(defaults.keys()), ["", "", ""] + list(defaults.values())]
+    for i in range(nb_runs):
+        data.append([str(i+1), "ready", ""] + [""]*len(defaults))
+    return data
+
+class QuietTestCase(unittest.TestCase):
+    """
+    Silences the prints of the schedulers during each test. Subclasses that override setUp call super().setUp() first
+    """
+
+    def setUp(self):
+        stdout = contextlib.redirect_stdout(io.StringIO())
+        stdout.__enter__()
+        self.addCleanup(stdout.__exit__, None, None, None)
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import unittest
+
+from gsheets_ml_scheduler.async_scheduler import AsyncGSheetsMLRunWriter, AsyncGSheetsMLScheduler
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+class TestAsyncScheduler(QuietTestCase):
+
+    def test_concurrent_workers_never_share_a_run(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(6)], latency_s=0.002)
+
+        async def work(scheduler):
+            run_names = []
+            while True:
+                run_name, config = await scheduler.find_claim_and_start_run(auto_retry=100)
+                if run_name is None:
+                    return run_names
+                self.assertEqual(config, {"lr": 0.1})
+                run_names.append(run_name)
+                await scheduler.update_status("epoch 1")
+                await scheduler.run_done()
+
+        async def main():
+            schedulers = [await AsyncGSheetsMLScheduler.create(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01) for _ in range(3)]
+            return await asyncio.gather(*[work(scheduler) for scheduler in schedulers])
+
+        run_names = sum(asyncio.run(main()), [])
+        self.assertEqual(sorted(run_names), [str(i+1) for i in range(6)])
+        self.assertEqual(spreadsheet.worksheets()[0].col_values(2)[2:], ["done"]*6)
+
+    def test_prefetch_and_close(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(4)])
+
+        async def main():
+            async with await AsyncGSheetsMLScheduler.create(spreadsheet.url, backend=spreadsheet, prefetch=3, min_claim_wait_s=0.01) as scheduler:
+                self.assertEqual((await scheduler.find_claim_and_start_run())[0], "1")
+                self.assertEqual(scheduler.scheduler.claim_stats["wins"], 3)
+
+        asyncio.run(main())
+        self.assertEqual(spreadsheet.worksheets()[0].col_values(2)[2:], ["running", "ready", "ready", "ready"])
+
+    def test_claims_hold_the_scheduler_lock(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+        lock_was_free = []
+
+        async def main():
+            scheduler = await AsyncGSheetsMLScheduler.create(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01)
+            write_leases = scheduler.scheduler.write_leases
+
+            def checked_write_leases(*args, **kwargs):
+                def try_lock(): # As a background sync thread polling the previous run
+                    lock_was_free.append(scheduler.scheduler.lock.acquire(blocking=False))
+                    if lock_was_free[-1]:
+                        scheduler.scheduler.lock.release()
+
+                other_thread = threading.Thread(target=try_lock)
+                other_thread.start()
+                other_thread.join()
+                return write_leases(*args, **kwargs)
+
+            scheduler.scheduler.write_leases = checked_write_leases
+            return await scheduler.find_claim_and_start_run()
+
+        self.assertEqual(asyncio.run(main())[0], "1")
+        self.assertEqual(lock_was_free, [False])
+
+    def test_run_writer(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+
+        async def main():
+            writer = await AsyncGSheetsMLRunWriter.create(spreadsheet.url, backend=spreadsheet)
+            await writer.write_runs([{"run_name": "2", "lr": 0.5}])
+
+        asyncio.run(main())
+        self.assertEqual(spreadsheet.worksheets()[0].row_values(4)[:2], ["2", "ready"])
+
+if __name__ == '__main__':
+    unittest.main()
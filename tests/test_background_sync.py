@@ -0,0 +1,80 @@
+import contextlib
+import io
+import time
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import make_sheet_data
+
+def wait_until(condition, timeout_s=2.0):
+    start_time = time.monotonic()
+    while not condition():
+        if time.monotonic() - start_time > timeout_s:
+            return False
+        time.sleep(0.005)
+    return True
+
+class TestBackgroundSync(unittest.TestCase):
+
+    def setUp(self):
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, hardcoded_default_config={"seed": 0})
+            self.scheduler.find_claim_and_start_run()
+
+    def test_config_snapshot_and_callback(self):
+        callbacks = []
+        sync = self.scheduler.start_background_sync(min_interval_s=0.01, max_interval_s=0.02, callback=lambda config, keys: callbacks.append(keys))
+        self.assertEqual(sync.config, {"lr": 0.1, "seed": 0})
+
+        self.sheet.update_cell(3, 4, "0.5")
+        self.assertTrue(wait_until(lambda: sync.config["lr"] == 0.5))
+        self.assertEqual(callbacks, [["lr"]])
+
+        nb_reads = self.spreadsheet.api_calls["batch_get"]
+        updated_config, changed_keys = self.scheduler.check_for_config_updates() # Zero latency
+        self.assertEqual((updated_config, changed_keys), ({"lr": 0.5, "seed": 0}, ["lr"]))
+        self.assertEqual(self.scheduler.check_for_config_updates()[1], [])
+        self.assertLessEqual(self.spreadsheet.api_calls["batch_get"] - nb_reads, 1) # Only the background thread reads
+        self.scheduler.stop_background_sync()
+
+    def test_status_writes_are_pushed_by_the_thread(self):
+        sync = self.scheduler.start_background_sync(min_interval_s=10.0)
+        nb_writes = self.spreadsheet.api_calls["batch_update"]
+        self.scheduler.update_status("epoch 1")
+        self.scheduler.update_status("epoch 2")
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], nb_writes) # Non-blocking
+
+        self.scheduler.stop_background_sync() # The last pending status is written before the thread ends
+        self.assertFalse(sync.is_alive())
+        self.assertEqual(self.sheet.row_values(3)[1], "epoch 2")
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], nb_writes + 1)
+
+    def test_run_done_stops_the_thread(self):
+        sync = self.scheduler.start_background_sync(min_interval_s=0.01)
+        self.scheduler.run_done()
+        self.assertFalse(sync.is_alive())
+        self.assertIsNone(self.scheduler.background_sync)
+        self.assertEqual(self.sheet.row_values(3)[1], "done")
+
+    def test_thread_writes_are_sent_without_auto_flush(self):
+        self.scheduler.auto_flush = False
+        self.scheduler.start_background_sync(min_interval_s=0.01)
+        self.scheduler.update_status("epoch 1")
+        self.assertTrue(wait_until(lambda: self.sheet.row_values(3)[1] == "epoch 1"))
+        self.assertTrue(self.scheduler.write_buffer.is_empty())
+        self.scheduler.stop_background_sync()
+
+    def test_stop_while_holding_the_scheduler_lock(self):
+        sync = self.scheduler.start_background_sync(min_interval_s=10.0)
+        with self.scheduler.lock:
+            self.scheduler.update_status("epoch 1")
+            self.scheduler.stop_background_sync() # The thread can't poll anymore, the pending status is written here
+        self.assertFalse(sync.is_alive())
+        self.assertEqual(self.sheet.row_values(3)[1], "epoch 1")
+
+if __name__ == '__main__':
+    unittest.main()
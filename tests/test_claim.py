@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+class TestLeaseClaim(QuietTestCase):
+
+    def test_make_and_parse_lease(self):
+        lease = GSheetsMLScheduler.make_lease("AbCdEf", "tok123", 1700000000.7)
+        self.assertEqual(lease, "AbCdEf|tok123|1700000000")
+        self.assertEqual(GSheetsMLScheduler.parse_lease(lease), ("AbCdEf", "tok123", 1700000000.0))
+        self.assertIsNone(GSheetsMLScheduler.parse_lease("AbCdEf"))
+        self.assertIsNone(GSheetsMLScheduler.parse_lease("a|b|not_a_time"))
+
+    def test_lease_claim_reads_only_the_claimed_line(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(3)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet)
+        run_id, _ = scheduler.find_ready_run()
+        nb_line_reads = spreadsheet.api_calls["batch_get"]
+
+        self.assertTrue(scheduler.claim_and_start_run(run_id))
+        self.assertEqual(spreadsheet.api_calls["get_all_values"], 1) # Only the one of the constructor
+        self.assertEqual(spreadsheet.api_calls["batch_get"], nb_line_reads + 2)
+        self.assertEqual(spreadsheet.worksheets()[0].row_values(3), ["1", "running", scheduler.worker_name, "0.1"])
+        self.assertEqual(scheduler.claim_stats["wins"], 1)
+
+    def test_expired_lease_is_claimable(self):
+        data = make_sheet_data(2)
+        data[2][2] = GSheetsMLScheduler.make_lease("DeadWk", "tok", time.time() - 10)
+        data[3][2] = GSheetsMLScheduler.make_lease("LiveWk", "tok", time.time() + 60)
+        spreadsheet = InMemorySpreadsheet([data])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet)
+        self.assertTrue(scheduler.is_claimable(0))
+        self.assertFalse(scheduler.is_claimable(1))
+        self.assertEqual(scheduler.find_claim_and_start_run()[0], "1")
+        self.assertEqual(scheduler.find_claim_and_start_run(auto_retry=0), (None, None))
+
+    def test_late_lease_on_a_started_run_is_replaced(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+        sheet = spreadsheet.worksheets()[0]
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01)
+        scheduler.find_claim_and_start_run()
+        sheet.update_cell(3, 3, GSheetsMLScheduler.make_lease("LateWk", "tok", time.time() + 60)) # Losing claim delayed by backoffs
+
+        scheduler.check_for_config_updates()
+        self.assertTrue(sheet.row_values(3)[2].startswith("LateWk|")) # Seen by the poll, no heartbeat was due
+        scheduler.update_status("epoch 1")
+        self.assertEqual(sheet.row_values(3)[1:3], ["epoch 1", scheduler.worker_name])
+
+    def test_concurrent_workers_never_share_a_run(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(12)], latency_s=(0.002, 0.01), seed=1)
+        claimed_run_names = []
+        lock = threading.Lock()
+
+        def worker():
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.02)
+            while True:
+                run_name, _ = scheduler.find_claim_and_start_run(auto_retry=20)
+                if run_name is None:
+                    return
+                with lock:
+                    claimed_run_names.append(run_name)
+                scheduler.run_done()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed_run_names, key=int), [str(i+1) for i in range(12)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from gspread import utils as gspread_utils
+
+from gsheets_ml_scheduler import a1_notation, clients
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.run_writer import GSheetsMLRunWriter
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeClient():
+    def __init__(self):
+        self.spreadsheet = InMemorySpreadsheet([[["run_name", "status", "worker_name", "lr"], ["", "", "", "0.1"], ["1", "ready", "", ""]]])
+        self.nb_opens = 0
+
+    def open_by_url(self, url):
+        self.nb_opens += 1
+        return self.spreadsheet
+
+class TestA1Notation(unittest.TestCase):
+
+    def test_same_as_gspread(self):
+        for row, col in [(1, 1), (9, 26), (10, 27), (123, 52), (5, 702), (1, 703), (2, 18278)]:
+            label = gspread_utils.rowcol_to_a1(row, col)
+            self.assertEqual(a1_notation.rowcol_to_a1(row, col), label)
+            self.assertEqual(a1_notation.a1_to_rowcol(label), gspread_utils.a1_to_rowcol(label))
+        for range_name in ["A1", "A3:B4", "B4:A3", "C:C", "A2:AB", "3:5", "ZZ10:AAA12"]:
+            self.assertEqual(a1_notation.a1_range_to_grid_range(range_name), gspread_utils.a1_range_to_grid_range(range_name))
+
+    def test_invalid_labels(self):
+        with self.assertRaises(ValueError):
+            a1_notation.a1_to_rowcol("A0")
+        with self.assertRaises(ValueError):
+            a1_notation.rowcol_to_a1(0, 1)
+
+class TestClients(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.authorize = clients.authorize
+        self.nb_logins = 0
+        self.client = FakeClient()
+        def fake_authorize(service_account_json_path):
+            self.nb_logins += 1
+            return self.client
+        clients.authorize = fake_authorize
+        clients.clear_cache()
+
+    def tearDown(self):
+        clients.authorize = self.authorize
+        clients.clear_cache()
+
+    def test_one_login_per_process(self):
+        first_scheduler = GSheetsMLScheduler("url", service_account_json_path="key.json", rate_limiter=False)
+        second_scheduler = GSheetsMLScheduler("url", service_account_json_path="key.json", rate_limiter=False)
+        GSheetsMLRunWriter("url", service_account_json_path="key.json", rate_limiter=False)
+        self.assertEqual((self.nb_logins, self.client.nb_opens), (1, 1))
+        self.assertEqual(self.client.spreadsheet.api_calls["fetch_sheet_metadata"], 1)
+        self.assertIs(first_scheduler.sheet, second_scheduler.sheet)
+
+        clients.open_spreadsheet("other url", "key.json")
+        self.assertEqual((self.nb_logins, self.client.nb_opens), (1, 2))
+        clients.open_spreadsheet("url", "other_key.json")
+        self.assertEqual(self.nb_logins, 2)
+
+    def test_worksheets_refreshes_the_memo(self):
+        shared_spreadsheet = clients.open_spreadsheet("url", "key.json")
+        self.assertIs(shared_spreadsheet.get_worksheet(0), shared_spreadsheet.get_worksheet(0))
+        self.client.spreadsheet.add_worksheet(rows=[["run_name"]])
+        self.assertEqual(len(shared_spreadsheet.worksheets()), 2)
+        self.assertEqual(shared_spreadsheet.get_worksheet(1).title, "Sheet2")
+        self.assertEqual(self.client.spreadsheet.api_calls["fetch_sheet_metadata"], 2)
+
+class TestColdImport(unittest.TestCase):
+
+    def test_heavy_modules_are_not_imported(self):
+        script = "import sys, gsheets_ml_scheduler.scheduler, gsheets_ml_scheduler.run_writer; print([name for name in ('numpy', 'pandas', 'gspread') if name in sys.modules])"
+        output = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "[]")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+class TestConditionalRefresh(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(3)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+
+    def test_revision_changes_with_every_write(self):
+        revision = self.spreadsheet.get_change_marker()
+        self.sheet.update_cell(3, 4, "0.5")
+        self.assertEqual(self.spreadsheet.get_change_marker(), revision + 1)
+        self.sheet.format("A3", {"backgroundColor": {"red": 1.0}})
+        self.assertEqual(self.spreadsheet.get_change_marker(), revision + 2)
+        self.sheet.get_all_values()
+        self.assertEqual(self.spreadsheet.get_change_marker(), revision + 2)
+
+    def test_unchanged_sheet_is_not_read_again(self):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, max_snapshot_age_s=60.0, min_claim_wait_s=0.01)
+        scheduler.find_claim_and_start_run()
+        scheduler.check_for_config_updates() # The claim changed the sheet
+
+        nb_reads = self.spreadsheet.api_calls["batch_get"]
+        self.assertEqual(scheduler.check_for_config_updates(), ({"lr": 0.1}, []))
+        self.assertEqual(self.spreadsheet.api_calls["batch_get"], nb_reads) # Only the change marker was fetched
+
+        self.sheet.update_cell(3, 4, "0.01") # Someone edits the run
+        self.assertEqual(scheduler.check_for_config_updates(), ({"lr": 0.01}, ["lr"]))
+        self.assertEqual(self.spreadsheet.api_calls["batch_get"], nb_reads + 1)
+
+    def test_old_snapshots_are_read_again(self):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, max_snapshot_age_s=0.0)
+        nb_full_reads = self.spreadsheet.api_calls["get_all_values"]
+        scheduler.download_data(if_changed=True)
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], nb_full_reads + 1)
+
+    def test_disabled_by_default(self):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet)
+        scheduler.find_ready_run()
+        scheduler.download_data(if_changed=True)
+        self.assertEqual(self.spreadsheet.api_calls["get_change_marker"], 0)
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+from array import array
+
+from gsheets_ml_scheduler.convert import CellConverter
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+RAW_STRINGS = ["", "TRUE", "false", "42", "0", "-42", "0.01", ".01", "-2E-4", "1,5", "-2,0", "1,5E-3", "Whatever", "a,b",
+               "nan", "inf", " 7", "1_000", "99999999999999999999999", "-", "٣", "1e400", "0x10"]
+
+def reference_conversion(str_value, comma_number_format):
+    point_value = str_value.replace(",", ".") if comma_number_format else str_value
+    return GSheetsMLScheduler.convert_str_to_bool_int_float_str(point_value)
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float) and a != a:
+        return b != b # nan
+    return type(a) is type(b) and a == b
+
+class TestConvertColumn(unittest.TestCase):
+
+    def check_column(self, str_values, comma_number_format):
+        converter = CellConverter(comma_number_format)
+        converted_values = list(converter.convert_column(str_values))
+        self.assertEqual(len(converted_values), len(str_values))
+        for str_value, converted_value in zip(str_values, converted_values):
+            expected_value = reference_conversion(str_value, comma_number_format)
+            self.assertTrue(same_value(converted_value, expected_value), (str_value, converted_value, expected_value))
+
+    def test_same_results_as_convert_str_to_bool_int_float_str(self):
+        rng = random.Random(0)
+        for comma_number_format in [False, True]:
+            self.check_column(RAW_STRINGS, comma_number_format) # Small column, memo path
+            self.check_column([rng.choice(RAW_STRINGS) for _ in range(1000)], comma_number_format) # Factorized path
+
+    def test_homogeneous_columns_are_typed(self):
+        converter = CellConverter()
+        self.assertEqual(converter.convert_column(["1", "-2", "3"]*100), array("q", [1, -2, 3]*100))
+        self.assertEqual(converter.convert_column(["0.5", "1e-4"]*100), array("d", [0.5, 1e-4]*100))
+        self.assertIsInstance(converter.convert_column(["1", ""]*100), list)
+        self.assertIsInstance(converter.convert_column(["1", "99999999999999999999999"]*100), list)
+
+    def test_memo_is_reused_and_bounded(self):
+        converter = CellConverter(max_memo_size=3)
+        converter.convert_column(["1", "2"])
+        self.assertEqual(converter.memo, {"1": 1, "2": 2})
+        converter.convert_column(["3", "4", "5"])
+        self.assertLessEqual(len(converter.memo), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import queue
+import time
+import unittest
+from concurrent.futures import Future
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.dispatcher import LocalDispatcher
+
+from sheet_fixtures import make_sheet_data
+
+def train(run_name, config, report):
+    report("epoch 1")
+    if run_name == "3":
+        raise ValueError("Diverged")
+    return f"done lr={config['lr']}"
+
+class TestLocalDispatcher(unittest.TestCase):
+
+    def test_slots_train_all_runs_with_one_connection(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(5)])
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            dispatcher = LocalDispatcher(spreadsheet.url, train, nb_slots=2, poll_interval_s=0.05, backend=spreadsheet, min_claim_wait_s=0.01)
+            final_statuses = dispatcher.run()
+
+        self.assertEqual(final_statuses, {"1": "done lr=0.1", "2": "done lr=0.1", "3": "failed", "4": "done lr=0.1", "5": "done lr=0.1"})
+        sheet = spreadsheet.worksheets()[0]
+        self.assertEqual(sheet.col_values(2)[2:], ["done lr=0.1", "done lr=0.1", "failed", "done lr=0.1", "done lr=0.1"])
+        self.assertEqual(set(sheet.col_values(3)[2:]), {dispatcher.scheduler.worker_name})
+        self.assertEqual(spreadsheet.api_calls["get_all_values"], 1) # Only the one of the constructor
+        self.assertEqual(dispatcher.scheduler.claim_stats["losses"], 0)
+
+    def test_late_report_does_not_overwrite_the_final_status(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            dispatcher = LocalDispatcher(spreadsheet.url, train, nb_slots=1, backend=spreadsheet, min_claim_wait_s=0.01)
+            dispatcher.scheduler.claim_runs(1)
+            run_id, config = dispatcher.scheduler.start_prefetched_run()
+            future = Future()
+            dispatcher.running_futures[future] = run_id
+
+            status_queue = queue.Queue()
+            dispatcher.apply_status_updates(status_queue)
+            status_queue.put((run_id, "epoch 9", None)) # Reported after the queue was emptied, then the run returned
+            future.set_result("done")
+            dispatcher.finish_done_runs(status_queue)
+            dispatcher.scheduler.flush()
+            dispatcher.apply_status_updates(status_queue)
+            dispatcher.scheduler.flush()
+
+        self.assertEqual(spreadsheet.worksheets()[0].col_values(2)[2:], ["done"])
+
+    def test_heartbeats_of_the_running_runs(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(3)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            dispatcher = LocalDispatcher(spreadsheet.url, train, nb_slots=2, backend=spreadsheet, min_claim_wait_s=0.01, lease_timeout_s=600.0)
+            dispatcher.scheduler.claim_runs(2)
+            for _ in range(2):
+                run_id, config = dispatcher.scheduler.start_prefetched_run()
+                dispatcher.running_futures[Future()] = run_id
+            dispatcher.scheduler.flush()
+            dispatcher.scheduler.last_heartbeat_times[1] = time.time() - 600.0 # Due
+            spreadsheet.worksheets()[0].update_cell(4, 5, "1")
+            dispatcher.scheduler.prefetched_run_ids.append(2) # Claimed, not started yet
+            dispatcher.scheduler.last_heartbeat_times[2] = time.time() - 600.0
+
+            nb_writes = spreadsheet.api_calls["batch_update"]
+            dispatcher.write_heartbeats()
+            dispatcher.scheduler.flush()
+
+        self.assertEqual(spreadsheet.api_calls["batch_update"], nb_writes + 1)
+        self.assertLessEqual(abs(float(spreadsheet.worksheets()[0].row_values(4)[4]) - time.time()), 5)
+        self.assertLessEqual(abs(float(spreadsheet.worksheets()[0].row_values(5)[4]) - time.time()), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.formatting import SheetFormatter
+from gsheets_ml_scheduler.run_writer import GSheetsMLRunWriter
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+from gsheets_ml_scheduler.write_buffer import SheetWriteBuffer
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+GREEN = {"red": 0.0, "green": 0.7, "blue": 0.12}
+
+DEFAULTS = {"lr": "0.1", "batch_size": "32", "optimizer": "adam"}
+
+class TestSheetFormatter(unittest.TestCase):
+
+    def setUp(self):
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(2, DEFAULTS)])
+        self.write_buffer = SheetWriteBuffer(self.spreadsheet.worksheets()[0])
+
+    def test_adjacent_cells_are_merged_and_unchanged_cells_skipped(self):
+        formatter = SheetFormatter(self.write_buffer)
+        self.assertEqual(formatter.format_cells(3, [6, 4, 5, 2], {"textFormat": {"foregroundColor": GREEN}}), 4)
+        self.assertEqual(list(self.write_buffer.pending_formats.keys()), ["B3", "D3:F3"])
+        self.write_buffer.flush()
+
+        self.assertEqual(formatter.format_cells(3, [4, 5], {"textFormat": {"foregroundColor": GREEN}}), 0)
+        self.assertEqual(formatter.format_line(3, 6, {"backgroundColor": GREEN}), 6) # Other field, the text colors are kept
+        self.assertEqual(list(self.write_buffer.pending_formats.keys()), ["A3:F3"])
+        formatter.forget_line(3)
+        self.assertEqual(formatter.format_cells(3, [4], {"textFormat": {"foregroundColor": GREEN}}), 1)
+
+    def test_no_cosmetics(self):
+        formatter = SheetFormatter(self.write_buffer, cosmetics=False)
+        self.assertEqual(formatter.format_line(3, 6, {"backgroundColor": GREEN}), 0)
+        self.assertTrue(self.write_buffer.is_empty())
+
+class TestSchedulerFormats(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(2, DEFAULTS)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+
+    def test_one_format_request_per_call(self):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, min_claim_wait_s=0.01)
+        scheduler.find_claim_and_start_run()
+        self.assertEqual(self.spreadsheet.api_calls["batch_format"], 1) # Running line and the 3 default cells, in 2 ranges
+        self.assertEqual(self.sheet.formats[(3, 5)], {"backgroundColor": scheduler.colors["running"], "textFormat": {"foregroundColor": scheduler.colors["default_text"]}})
+
+        self.sheet.update_cell(3, 4, "0.5")
+        self.assertEqual(scheduler.check_for_config_updates()[1], ["lr"])
+        self.assertEqual(self.spreadsheet.api_calls["batch_format"], 2)
+        self.sheet.update_cell(3, 4, "0.2")
+        self.assertEqual(scheduler.check_for_config_updates()[1], ["lr"])
+        self.assertEqual(self.spreadsheet.api_calls["batch_format"], 2) # Already green
+
+        scheduler.run_done()
+        self.assertEqual(self.spreadsheet.api_calls["batch_format"], 3)
+        self.assertEqual(self.sheet.formats[(3, 1)]["backgroundColor"], scheduler.colors["done"])
+
+    def test_no_cosmetics(self):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, min_claim_wait_s=0.01, cosmetics=False)
+        scheduler.find_claim_and_start_run()
+        self.sheet.update_cell(3, 4, "0.5")
+        scheduler.check_for_config_updates()
+        scheduler.run_done()
+        run_writer = GSheetsMLRunWriter(self.spreadsheet.url, backend=self.spreadsheet, cosmetics=False)
+        run_writer.write_runs([{"run_name": "3", "momentum": 0.9}])
+        self.assertEqual(self.spreadsheet.api_calls["batch_format"] + self.spreadsheet.api_calls["format"], 0)
+        self.assertEqual(self.sheet.row_values(3)[1], "done")
+        self.assertEqual(self.sheet.formats, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet, QuotaExceededError
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+def make_template_data():
+    return [
+        ["run_name", "status", "worker_name", "n_epoch", "learning_rate"],
+        ["", "", "", "10", "0.001"],
+        ["1", "done", "AbCdEf", "", "0.0005"],
+        ["2", "ready", "", "", "0.0001"],
+        ["3", "ready", "", "5", ""],
+    ]
+
+class TestInMemorySpreadsheet(unittest.TestCase):
+
+    def test_reads_are_trimmed_like_the_sheets_api(self):
+        sheet = InMemorySpreadsheet([[["a", "b", ""], ["c", "", ""], ["", "", ""]]]).worksheets()[0]
+        self.assertEqual(sheet.get_all_values(), [["a", "b"], ["c", ""]])
+        self.assertEqual(sheet.row_values(2), ["c"])
+        self.assertEqual(sheet.col_values(2), ["b"])
+        self.assertEqual(sheet.batch_get(["A1:B1", "B:B"]), [[["a", "b"]], [["b"]]])
+
+    def test_writes_are_last_writer_wins(self):
+        sheet = InMemorySpreadsheet([[["a"]]]).worksheets()[0]
+        sheet.update_cell(2, 3, "first")
+        sheet.batch_update([{"range": "C2:D2", "values": [["second", True]]}])
+        self.assertEqual(sheet.row_values(2), ["", "", "second", "TRUE"])
+
+        sheet.format("A1:B1", {"backgroundColor": {"red": 1.0}})
+        sheet.batch_format([{"range": "B1", "format": {"textFormat": {"bold": True}}}])
+        self.assertEqual(sheet.formats[(1, 2)], {"backgroundColor": {"red": 1.0}, "textFormat": {"bold": True}})
+
+    def test_quota_per_minute(self):
+        spreadsheet = InMemorySpreadsheet([[["a"]]], read_quota_per_minute=3)
+        sheet = spreadsheet.get_worksheet(0)
+        sheet.get_all_values()
+        sheet.get_all_values()
+        with self.assertRaises(QuotaExceededError) as context:
+            sheet.get_all_values()
+        self.assertEqual(context.exception.code, 429)
+        sheet.update_cell(1, 1, "b") # Writes have their own quota
+        self.assertEqual(spreadsheet.rejected_calls["get_all_values"], 1)
+
+class TestSchedulerOnInMemoryBackend(unittest.TestCase):
+
+    def test_find_claim_and_run_done(self):
+        spreadsheet = InMemorySpreadsheet([make_template_data()])
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, hardcoded_default_config={"batch_size": 32})
+
+            run_name, config = scheduler.find_claim_and_start_run()
+            self.assertEqual(run_name, "2")
+            self.assertEqual(config, {"n_epoch": 10, "learning_rate": 0.0001, "batch_size": 32})
+
+            sheet = spreadsheet.worksheets()[0]
+            self.assertEqual(sheet.row_values(4), ["2", "running", scheduler.worker_name, "10", "0.0001"])
+            self.assertEqual(sheet.formats[(4, 4)]["textFormat"]["foregroundColor"], scheduler.colors["default_text"])
+
+            self.assertTrue(scheduler.run_done())
+            self.assertEqual(sheet.row_values(4)[1], "done")
+            self.assertEqual(sheet.formats[(4, 1)]["backgroundColor"], scheduler.colors["done"])
+
+if __name__ == '__main__':
+    unittest.main()
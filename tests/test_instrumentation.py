@@ -0,0 +1,54 @@
+import contextlib
+import io
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.instrumentation import ApiStats, InstrumentedSpreadsheet, payload_size
+from gsheets_ml_scheduler.run_writer import GSheetsMLRunWriter
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import make_sheet_data
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_payload_size(self):
+        self.assertEqual(payload_size([["ab", "é"], [1.5, True, None]]), 2 + 2 + 3 + 4)
+        self.assertEqual(payload_size([{"range": "A1", "values": [["x"]]}]), len("range") + 2 + len("values") + 1)
+
+    def test_every_call_is_recorded(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(3)])
+        api_stats = ApiStats()
+        events = []
+        api_stats.add_hook(events.append)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, instrumentation=api_stats, min_claim_wait_s=0.01)
+            scheduler.find_claim_and_start_run()
+            scheduler.run_done()
+            run_writer = GSheetsMLRunWriter(spreadsheet.url, backend=spreadsheet, instrumentation=api_stats)
+            run_writer.write_runs([{"lr": 0.5}])
+
+        stats = scheduler.stats()
+        operations = stats["api"]["operations"]
+        for operation_name, count in spreadsheet.api_calls.items():
+            self.assertEqual(operations[operation_name]["count"], count, operation_name)
+        self.assertEqual(len(events), spreadsheet.total_api_calls())
+        self.assertEqual(stats["api"]["totals"]["calls"], spreadsheet.total_api_calls())
+        self.assertGreater(operations["get_all_values"]["bytes_received"], 0)
+        self.assertGreater(operations["batch_update"]["bytes_sent"], 0)
+        self.assertEqual(sum(operations["batch_get"]["latency_histogram"].values()), operations["batch_get"]["count"])
+        self.assertEqual(stats["api"]["calls_last_minute"]["read"] + stats["api"]["calls_last_minute"]["write"], spreadsheet.total_api_calls())
+        self.assertEqual(stats["api"]["local"]["download_data_parse"]["count"], 1)
+        self.assertEqual(stats["claims"]["wins"], 1)
+
+    def test_disabled_by_default(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet)
+        self.assertIs(scheduler.all_sheets, spreadsheet)
+        self.assertIsNone(scheduler.stats()["api"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, instrumentation=True)
+        self.assertIsInstance(scheduler.all_sheets, InstrumentedSpreadsheet)
+
+if __name__ == '__main__':
+    unittest.main()
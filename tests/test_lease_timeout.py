@@ -0,0 +1,113 @@
+import time
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+DEFAULTS = {"lr": "0.1", "heartbeat": ""}
+
+class TestLeaseTimeout(QuietTestCase):
+
+    def make_dead_worker_data(self, heartbeat_age_s):
+        data = make_sheet_data(2, DEFAULTS)
+        data[2][1:3] = ["running", "DeadWk"]
+        data[2][4] = str(int(time.time() - heartbeat_age_s))
+        data[3][1] = "done"
+        return data
+
+    def test_heartbeat_column_is_created_and_not_a_config_key(self):
+        data = [row[:4] for row in make_sheet_data(2, DEFAULTS)]
+        spreadsheet = InMemorySpreadsheet([data])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01)
+        self.assertEqual(spreadsheet.worksheets()[0].row_values(1), ["run_name", "status", "worker_name", "lr", "heartbeat"])
+        self.assertEqual(scheduler.config_keys, ["lr"])
+        self.assertEqual(scheduler.find_claim_and_start_run(), ("1", {"lr": 0.1}))
+
+    def test_heartbeat_is_written_with_the_status(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1, DEFAULTS)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01)
+        scheduler.find_claim_and_start_run()
+        nb_writes = spreadsheet.api_calls["batch_update"]
+        scheduler.update_status("epoch 1")
+        self.assertEqual(spreadsheet.api_calls["batch_update"], nb_writes + 1)
+        heartbeat = spreadsheet.worksheets()[0].row_values(3)[4]
+        self.assertLessEqual(abs(float(heartbeat) - time.time()), 5)
+
+    def test_stale_run_is_taken_over(self):
+        spreadsheet = InMemorySpreadsheet([self.make_dead_worker_data(heartbeat_age_s=3600)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01)
+        self.assertTrue(scheduler.is_claimable(0))
+        self.assertEqual(scheduler.find_claim_and_start_run(), ("1", {"lr": 0.1}))
+        self.assertEqual(spreadsheet.worksheets()[0].row_values(3)[1:3], ["running", scheduler.worker_name])
+
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01) # Without lease_timeout_s nothing is taken over
+        self.assertFalse(scheduler.is_claimable(0))
+
+    def test_live_run_is_not_taken_over(self):
+        spreadsheet = InMemorySpreadsheet([self.make_dead_worker_data(heartbeat_age_s=10)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01)
+        self.assertEqual(scheduler.find_claim_and_start_run(), (None, None))
+
+    def test_worker_that_comes_back_keeps_its_run(self):
+        spreadsheet = InMemorySpreadsheet([self.make_dead_worker_data(heartbeat_age_s=3600)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01)
+        leases = scheduler.write_leases([0])
+        self.assertEqual(len(leases), 1)
+        spreadsheet.worksheets()[0].update_cell(3, 5, str(int(time.time()))) # The worker writes a heartbeat during the claim wait
+        self.assertFalse(scheduler.finish_lease_claim_and_start_run(0, leases))
+        self.assertEqual(spreadsheet.worksheets()[0].row_values(3)[1:3], ["running", "DeadWk"])
+
+    def test_legacy_claim_mode_is_refused(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1, DEFAULTS)])
+        with self.assertRaises(Exception):
+            GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, claim_mode="legacy", lease_timeout_s=600.0)
+
+    def test_taken_over_worker_stops_writing_its_line(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(1, DEFAULTS)])
+        sheet = spreadsheet.worksheets()[0]
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01)
+        scheduler.find_claim_and_start_run()
+        sheet.update_cell(3, 2, "epoch 3 (new owner)") # Another worker took the run over
+        sheet.update_cell(3, 3, "NewWk")
+
+        scheduler.sync_config_and_status("epoch 5")
+        self.assertEqual(scheduler.taken_over_run_ids, {0})
+        scheduler.log({"loss": 0.1})
+        scheduler.heartbeat()
+        self.assertFalse(scheduler.run_done())
+        self.assertEqual(sheet.row_values(3)[1:3], ["epoch 3 (new owner)", "NewWk"])
+        self.assertNotIn("metric_loss", sheet.row_values(1))
+
+    def make_prefetching_scheduler(self, nb_runs, prefetch):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(nb_runs, DEFAULTS)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, lease_timeout_s=600.0, min_claim_wait_s=0.01, prefetch=prefetch)
+        scheduler.find_claim_and_start_run()
+        return spreadsheet.worksheets()[0], scheduler
+
+    def test_queued_runs_get_heartbeats(self):
+        sheet, scheduler = self.make_prefetching_scheduler(2, prefetch=2)
+        scheduler.last_heartbeat_times[1] = time.time() - 600.0 # Due
+        sheet.update_cell(4, 5, "1")
+        scheduler.update_status("epoch 1")
+        self.assertLessEqual(abs(float(sheet.row_values(4)[4]) - time.time()), 5)
+
+    def test_taken_over_queued_run_is_not_started(self):
+        sheet, scheduler = self.make_prefetching_scheduler(3, prefetch=2)
+        sheet.update_cell(4, 2, "running") # Another worker took the queued run over
+        sheet.update_cell(4, 3, "NewWk")
+        scheduler.run_done()
+        self.assertEqual(scheduler.find_claim_and_start_run(), ("3", {"lr": 0.1}))
+        self.assertEqual(sheet.row_values(4)[1:3], ["running", "NewWk"])
+
+    def test_taken_over_queued_run_is_not_released(self):
+        sheet, scheduler = self.make_prefetching_scheduler(3, prefetch=3)
+        sheet.update_cell(4, 2, "running")
+        sheet.update_cell(4, 3, "NewWk")
+        scheduler.close()
+        self.assertEqual(sheet.row_values(4)[1:3], ["running", "NewWk"])
+        self.assertEqual(sheet.row_values(5)[1:3], ["ready", ""])
+
+if __name__ == '__main__':
+    unittest.main()
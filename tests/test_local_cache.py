@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.local_cache import LocalCache, is_permanent_error
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+class OfflineError(Exception):
+    def __init__(self):
+        super().__init__("Connection reset")
+        self.code = 503
+
+class TestLocalCache(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(3)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_scheduler(self, **kwargs):
+        return GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, local_cache=self.cache_path, min_claim_wait_s=0.01, **kwargs)
+
+    def go_offline(self, scheduler):
+        def offline_call(*args, **kwargs):
+            raise OfflineError()
+        for name in ["batch_update", "batch_format", "batch_get"]:
+            setattr(scheduler.sheet, name, offline_call)
+
+    def go_online(self, scheduler):
+        for name in ["batch_update", "batch_format", "batch_get"]:
+            delattr(scheduler.sheet, name)
+
+    def test_permanent_errors(self):
+        self.assertFalse(is_permanent_error(OfflineError()))
+        self.assertFalse(is_permanent_error(ConnectionError()))
+        error = Exception("Bad request")
+        error.code = 400
+        self.assertTrue(is_permanent_error(error))
+
+    def test_warm_start_only_reads_the_status_columns(self):
+        self.make_scheduler().close()
+        self.sheet.update_cell(4, 4, "0.5") # Config change of run 2 after the snapshot
+        nb_full_reads = self.spreadsheet.api_calls["get_all_values"]
+        nb_reads = self.spreadsheet.api_calls["batch_get"]
+
+        scheduler = self.make_scheduler()
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], nb_full_reads)
+        self.assertEqual(self.spreadsheet.api_calls["batch_get"], nb_reads + 1)
+        self.assertEqual(scheduler.nb_runs, 3)
+        run_name, config = scheduler.find_claim_and_start_run()
+        run_name, config = scheduler.find_claim_and_start_run()
+        self.assertEqual((run_name, config), ("2", {"lr": 0.5})) # Refreshed before the claim
+
+    def test_failed_writes_are_journaled_and_replayed(self):
+        scheduler = self.make_scheduler()
+        scheduler.find_claim_and_start_run()
+        self.go_offline(scheduler)
+        scheduler.update_status("epoch 1")
+        self.assertEqual(scheduler.check_for_config_updates(), ({"lr": 0.1}, [])) # Last snapshot
+        self.assertTrue(scheduler.run_done())
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 3) # 2 status values and 1 format
+        self.assertEqual(self.sheet.get_all_values()[2][1], "running")
+
+        self.go_online(scheduler)
+        scheduler.flush()
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 0)
+        self.assertEqual(self.sheet.get_all_values()[2][1], "done")
+        self.assertEqual(scheduler.values["status"][0], "done")
+
+    def test_metrics_of_new_columns_logged_offline(self):
+        scheduler = self.make_scheduler(metrics_interval_s=0.0)
+        scheduler.find_claim_and_start_run()
+        self.go_offline(scheduler)
+        scheduler.log({"loss": 0.5})
+        scheduler.flush() # Creates the column, the metric is journaled
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 1)
+
+        self.go_online(scheduler)
+        scheduler.flush()
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 0)
+        self.assertEqual(self.sheet.row_values(1)[4:], ["metric_loss"])
+        self.assertEqual(self.sheet.row_values(3)[4:], ["0.5"])
+
+    def test_writes_of_taken_over_lines_are_dropped(self):
+        scheduler = self.make_scheduler()
+        scheduler.find_claim_and_start_run()
+        self.go_offline(scheduler)
+        scheduler.update_status("epoch 1")
+        self.go_online(scheduler)
+        self.sheet.update_cell(3, 2, "running") # Another worker took the run over
+        self.sheet.update_cell(3, 3, "other_worker")
+
+        scheduler.flush()
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 0)
+        self.assertEqual(self.sheet.get_all_values()[2][1:3], ["running", "other_worker"])
+
+    def test_partially_sent_flush(self):
+        scheduler = self.make_scheduler()
+        scheduler.find_claim_and_start_run()
+        self.go_offline(scheduler)
+        scheduler.update_status("epoch 1")
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 1)
+
+        self.go_online(scheduler)
+        def offline_call(*args, **kwargs):
+            raise OfflineError()
+        scheduler.sheet.batch_format = offline_call # The values are sent, not the formats
+        scheduler.run_done()
+        self.assertEqual(self.sheet.get_all_values()[2][1], "done")
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 1) # Only the format, the replayed status was sent
+
+        del scheduler.sheet.batch_format
+        scheduler.flush()
+        self.assertEqual(scheduler.local_cache.journal_size(self.spreadsheet.url, 0), 0)
+        self.assertEqual(self.sheet.get_all_values()[2][1], "done")
+        self.assertEqual(self.sheet.formats[(3, 1)]["backgroundColor"], scheduler.colors["done"])
+
+    def test_new_process_replays_the_journal_of_dead_workers(self):
+        scheduler = self.make_scheduler(lease_timeout_s=60.0)
+        scheduler.find_claim_and_start_run()
+        self.go_offline(scheduler)
+        scheduler.run_done()
+        scheduler.local_cache.close() # The process dies
+        self.go_online(scheduler)
+
+        self.make_scheduler(lease_timeout_s=60.0).local_cache.close()
+        self.assertEqual(self.sheet.get_all_values()[2][1], "running") # Its heartbeat is recent, it may still flush its journal
+        self.assertEqual(LocalCache(self.cache_path).journal_size(self.spreadsheet.url, 0), 3)
+
+        self.sheet.update_cell(3, 5, "1") # Heartbeat column
+        self.make_scheduler(lease_timeout_s=60.0)
+        self.assertEqual(self.sheet.get_all_values()[2][1], "done")
+        self.assertEqual(LocalCache(self.cache_path).journal_size(self.spreadsheet.url, 0), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase, make_sheet_data
+
+class TestMetrics(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(2)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+
+    def make_scheduler(self, **kwargs):
+        scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, min_claim_wait_s=0.01, **kwargs)
+        scheduler.find_claim_and_start_run()
+        return scheduler
+
+    def test_logs_are_debounced_and_flushed_by_run_done(self):
+        scheduler = self.make_scheduler(metrics_interval_s=3600.0)
+        scheduler.log({"loss": 1.0})
+        scheduler.flush() # Creates the columns
+        self.assertEqual(self.sheet.row_values(1), ["run_name", "status", "worker_name", "lr", "metric_loss"])
+        nb_writes = self.spreadsheet.api_calls["batch_update"]
+        scheduler.last_metrics_write_time = None
+        for step in range(100):
+            scheduler.log({"loss": 1.0/(step+1), "step": step})
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], nb_writes + 1) # Only the first log(), without the new column
+        self.assertEqual(self.sheet.row_values(1), ["run_name", "status", "worker_name", "lr", "metric_loss"])
+        self.assertEqual(self.sheet.row_values(3)[4:], ["1.0"])
+
+        scheduler.run_done()
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], nb_writes + 3) # The new column name, then the last values and the status
+        self.assertEqual(self.sheet.row_values(1)[4:], ["metric_loss", "metric_step"])
+        self.assertEqual(self.sheet.row_values(3)[1], "done")
+        self.assertEqual(self.sheet.row_values(3)[4:], ["0.01", "99"])
+
+    def test_logs_go_with_status_updates(self):
+        scheduler = self.make_scheduler(metrics_interval_s=3600.0)
+        scheduler.log({"loss": 0.5})
+        scheduler.log({"loss": 0.25})
+        nb_writes = self.spreadsheet.api_calls["batch_update"]
+        scheduler.update_status("epoch 2")
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], nb_writes + 2) # The new column name, then the status and the metric
+        self.assertEqual(self.sheet.row_values(3)[1:], ["epoch 2", scheduler.worker_name, "0.1", "0.25"])
+
+    def test_new_columns_are_not_created_by_log(self):
+        scheduler = self.make_scheduler(metrics_interval_s=0.0)
+        nb_calls = sum(self.spreadsheet.api_calls.values())
+        scheduler.log({"accuracy": 0.9})
+        self.assertEqual(sum(self.spreadsheet.api_calls.values()), nb_calls) # No claim wait of add_columns on the training thread
+        self.assertEqual(scheduler.pending_metrics, {0: {"accuracy": 0.9}})
+
+        scheduler.flush()
+        self.assertEqual(self.sheet.row_values(1)[4:], ["metric_accuracy"])
+        self.assertEqual(self.sheet.row_values(3)[4:], ["0.9"])
+
+    def test_metric_columns_are_not_config(self):
+        scheduler = self.make_scheduler(metrics_interval_s=0.0)
+        scheduler.log({"accuracy": 0.9})
+        scheduler.flush()
+        self.assertEqual(scheduler.check_for_config_updates(), ({"lr": 0.1}, []))
+        other_scheduler = self.make_scheduler()
+        self.assertEqual(other_scheduler.config_keys, ["lr"])
+        self.assertEqual(other_scheduler.currently_running_config, {"lr": 0.1})
+
+    def test_columns_created_at_the_same_time_by_another_worker(self):
+        scheduler = self.make_scheduler(metrics_interval_s=0.0)
+        batch_update = scheduler.sheet.batch_update
+        def racing_batch_update(data, **kwargs):
+            batch_update(data, **kwargs)
+            if data[0]["range"].startswith("E1"):
+                del scheduler.sheet.batch_update
+                self.sheet.update_cell(1, 5, "metric_accuracy") # Written by the other worker right after ours
+        scheduler.sheet.batch_update = racing_batch_update
+
+        scheduler.log({"loss": 0.5})
+        scheduler.flush()
+        self.assertEqual(self.sheet.row_values(1)[4:], ["metric_accuracy", "metric_loss"])
+        self.assertEqual(self.sheet.row_values(3)[4:], ["", "0.5"])
+        self.assertEqual(scheduler.key_ids["metric_loss"], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import atexit
+import contextlib
+import gc
+import io
+import unittest
+import weakref
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import make_sheet_data
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data(5)])
+        self.sheet = self.spreadsheet.worksheets()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, prefetch=3)
+
+    def test_runs_are_claimed_in_one_round_and_started_one_by_one(self):
+        run_name, config = self.scheduler.find_claim_and_start_run()
+        self.assertEqual((run_name, config), ("1", {"lr": 0.1}))
+        self.assertEqual(self.sheet.col_values(2)[2:], ["running", "queued", "queued", "ready", "ready"])
+        self.assertEqual(self.scheduler.claim_stats["wins"], 3)
+
+        nb_reads = self.spreadsheet.api_calls["batch_get"]
+        self.assertEqual(self.scheduler.find_claim_and_start_run()[0], "2")
+        self.assertEqual(self.spreadsheet.api_calls["batch_get"], nb_reads) # Started from the queue without any read
+        self.assertGreater(self.scheduler.claim_overhead_per_run(), 0.0)
+
+    def test_started_runs_are_tracked_separately(self):
+        self.scheduler.find_claim_and_start_run()
+        self.scheduler.find_claim_and_start_run()
+        self.assertEqual(sorted(self.scheduler.running_configs.keys()), [0, 1])
+
+        self.assertTrue(self.scheduler.run_done(run_id=0))
+        self.assertEqual(self.scheduler.currently_running_run_id, 1)
+        self.assertTrue(self.scheduler.run_done())
+        self.assertEqual(self.sheet.col_values(2)[2:5], ["done", "done", "queued"])
+        self.assertEqual(self.scheduler.running_configs, {})
+
+    def test_close_releases_unstarted_runs(self):
+        with self.scheduler:
+            self.scheduler.find_claim_and_start_run()
+        self.assertEqual(self.sheet.col_values(2)[2:], ["running", "ready", "ready", "ready", "ready"])
+        self.assertEqual(self.sheet.col_values(3)[2:], [self.scheduler.worker_name])
+
+    def test_legacy_claim_mode_is_refused(self):
+        with self.assertRaises(Exception) as context:
+            GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, prefetch=3, claim_mode="legacy")
+        self.assertEqual(str(context.exception), "PrefetchWithLegacyClaimModeError")
+
+    def test_exit_callback_is_weak_and_removed_by_close(self):
+        self.assertIsNotNone(self.scheduler.exit_callback)
+        self.scheduler.close()
+        self.assertIsNone(self.scheduler.exit_callback) # Unregistered
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet, prefetch=3)
+        scheduler_ref = weakref.ref(scheduler)
+        exit_callback = scheduler.exit_callback
+        del scheduler
+        gc.collect()
+        self.assertIsNone(scheduler_ref())
+        exit_callback() # Does nothing once the scheduler is gone
+        atexit.unregister(exit_callback)
+
+if __name__ == '__main__':
+    unittest.main()
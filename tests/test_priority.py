@@ -0,0 +1,72 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.run_table import RunTable
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase
+
+def make_table(priorities, requirements):
+    nb_runs = len(priorities)
+    key_ids = {"run_name": 0, "status": 1, "worker_name": 2, "priority": 3, "requires_gpu_memory_gb": 4}
+    columns = {
+        "run_name": [str(i) for i in range(nb_runs)],
+        "status": ["ready"]*nb_runs,
+        "worker_name": [""]*nb_runs,
+        "priority": priorities,
+        "requires_gpu_memory_gb": requirements,
+    }
+    return RunTable(key_ids, [], columns)
+
+def make_sheet_data(priorities, requirements):
+    data = [["run_name", "status", "worker_name", "priority", "requires_gpu_memory_gb", "lr"], ["", "", "", "", "", "0.1"]]
+    for i, (priority, requirement) in enumerate(zip(priorities, requirements)):
+        data.append([str(i+1), "ready", "", priority, requirement, ""])
+    return data
+
+class TestPriorityIndex(unittest.TestCase):
+
+    def test_higher_priority_first_then_sheet_order(self):
+        table = make_table(["", "5", "", "5", "-1"], [""]*5)
+        self.assertEqual(table.next_ready_runs(5), [1, 3, 0, 2, 4])
+        table.values["priority"][2] = "10" # Edited priority
+        self.assertEqual(table.next_ready_run(), 2)
+        table.values["worker_name"][2] = "me"
+        self.assertEqual(table.next_ready_run(), 1)
+
+    def test_requirements_groups(self):
+        table = make_table(["", "", "", ""], ["", "80", "16", ""])
+        self.assertEqual(table.requirements(1), (("gpu_memory_gb", 80),))
+        self.assertEqual(table.next_ready_runs(4), [0, 3]) # Default: only the runs without requirements
+        fit_score = lambda requirements: sum(required/40 for _, required in requirements) if all(required <= 40 for _, required in requirements) else None
+        self.assertEqual(table.next_ready_runs(4, fit_score=fit_score), [2, 0, 3]) # 16 GB fits a 40 GB worker and uses it better
+
+class TestPriorityClaims(QuietTestCase):
+
+    def test_claims_follow_priority_and_capabilities(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(["", "2", "", "1"], ["", "", "40", "16"])])
+        small_worker = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, min_claim_wait_s=0.01)
+        self.assertEqual(small_worker.config_keys, ["lr"])
+        self.assertEqual(small_worker.find_claim_and_start_run(), ("2", {"lr": 0.1}))
+        self.assertEqual(small_worker.find_claim_and_start_run()[0], "1")
+        self.assertEqual(small_worker.find_claim_and_start_run(), (None, None)) # Runs 3 and 4 need a GPU
+
+        big_worker = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, capabilities={"gpu_memory_gb": 48}, min_claim_wait_s=0.01)
+        self.assertEqual(big_worker.find_claim_and_start_run()[0], "4") # Priority 1
+        self.assertEqual(big_worker.find_claim_and_start_run()[0], "3")
+
+    def test_claim_spread(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(["1", "", "", "", ""], [""]*5)])
+        scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, claim_spread=4, min_claim_wait_s=0.01)
+        self.assertEqual(scheduler.next_claimable_runs(1), [0]) # The only run of the top priority
+        self.assertEqual(scheduler.fit_score((("gpu_memory_gb", 16),)), None)
+
+        drawn_run_ids = set()
+        for _ in range(50):
+            run_ids = scheduler.next_claimable_runs(2)
+            self.assertEqual(run_ids[0], 0)
+            drawn_run_ids.add(run_ids[1])
+        self.assertEqual(drawn_run_ids, {1, 2, 3, 4})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import time
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet, QuotaExceededError
+from gsheets_ml_scheduler.rate_limiter import FORMAT_PRIORITY, READ_PRIORITY, WRITE_PRIORITY, QuotaRateLimiter, RateLimitedSpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+from sheet_fixtures import make_sheet_data
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_calls_are_paced_by_the_quota(self):
+        rate_limiter = QuotaRateLimiter(read_quota_per_minute=600, burst=2) # 10 calls per second
+        start_time = time.monotonic()
+        for _ in range(5):
+            rate_limiter.acquire("read", READ_PRIORITY)
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.25) # 2 calls from the burst, 3 paced calls
+        self.assertGreater(rate_limiter.mean_queueing_delay(), 0.0)
+        self.assertEqual(rate_limiter.stats()["nb_calls"], 5)
+
+    def test_format_calls_wait_for_queued_reads(self):
+        rate_limiter = QuotaRateLimiter()
+        format_entry = (FORMAT_PRIORITY, 0, "write")
+        rate_limiter.waiting = [format_entry, (READ_PRIORITY, 1, "read")]
+        self.assertFalse(rate_limiter.is_next(format_entry))
+        write_entry = (WRITE_PRIORITY, 2, "write")
+        rate_limiter.waiting = [format_entry, write_entry]
+        self.assertTrue(rate_limiter.is_next(write_entry))
+        self.assertFalse(rate_limiter.is_next(format_entry))
+
+    def test_429_errors_are_retried(self):
+        calls = []
+        def flaky_call():
+            calls.append(None)
+            if len(calls) < 3:
+                raise QuotaExceededError("Quota exceeded")
+            return "ok"
+        rate_limiter = QuotaRateLimiter(write_quota_per_minute=60000, base_backoff_s=0.001)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(rate_limiter.call(flaky_call, "write", WRITE_PRIORITY), "ok")
+        self.assertEqual(rate_limiter.nb_retries, 2)
+
+        rate_limiter = QuotaRateLimiter(max_retries=0)
+        with self.assertRaises(ValueError):
+            rate_limiter.call(lambda: int("not a number"), "read", READ_PRIORITY) # Other errors are not retried
+
+    def test_scheduler_survives_random_429_errors(self):
+        spreadsheet = InMemorySpreadsheet([make_sheet_data(5)], error_rate=0.2, seed=0)
+        rate_limiter = QuotaRateLimiter(read_quota_per_minute=60000, write_quota_per_minute=60000, base_backoff_s=0.001, max_retries=20)
+        with contextlib.redirect_stdout(io.StringIO()):
+            scheduler = GSheetsMLScheduler(spreadsheet.url, backend=spreadsheet, rate_limiter=rate_limiter, min_claim_wait_s=0.01)
+            run_names = []
+            while True:
+                run_name, _ = scheduler.find_claim_and_start_run()
+                if run_name is None:
+                    break
+                run_names.append(run_name)
+                scheduler.run_done()
+        self.assertIsInstance(scheduler.all_sheets, RateLimitedSpreadsheet)
+        self.assertEqual(run_names, ["1", "2", "3", "4", "5"])
+        self.assertGreater(sum(spreadsheet.rejected_calls.values()), 0)
+        self.assertEqual(rate_limiter.nb_retries, sum(spreadsheet.rejected_calls.values()))
+
+if __name__ == '__main__':
+    unittest.main()
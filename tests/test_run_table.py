@@ -0,0 +1,95 @@
+import time
+import unittest
+from array import array
+
+from gsheets_ml_scheduler.run_table import RunTable, TypedColumn
+
+def make_table(statuses, worker_names):
+    key_ids = {"run_name": 0, "status": 1, "worker_name": 2, "lr": 3}
+    columns = {
+        "run_name": [str(i) for i in range(len(statuses))],
+        "status": statuses,
+        "worker_name": worker_names,
+        "lr": [0.1*i for i in range(len(statuses))],
+    }
+    return RunTable(key_ids, ["lr"], columns)
+
+class TestTypedColumn(unittest.TestCase):
+
+    def test_homogeneous_columns_use_typed_arrays(self):
+        self.assertEqual(TypedColumn([1, 2, 3]).data.typecode, "q")
+        self.assertEqual(TypedColumn([0.5, 1e-4]).data.typecode, "d")
+        self.assertIsInstance(TypedColumn([1, ""]).data, list)
+        self.assertIsInstance(TypedColumn([True, False]).data, list) # bools must stay bools
+        self.assertIsInstance(TypedColumn([2**70]).data, list)
+
+    def test_writes_keep_python_types(self):
+        column = TypedColumn([1, 2, 3])
+        column[0] = 5
+        self.assertIsInstance(column.data, array)
+        self.assertIsInstance(column[0], int)
+        column[1] = "" # The user emptied a cell
+        column.append(0.5)
+        self.assertEqual(column, [5, "", 3, 0.5])
+        self.assertIsInstance(column.data, list)
+
+class TestRunTable(unittest.TestCase):
+
+    def test_status_index(self):
+        table = make_table(["done", "ready", "running", "ready"], ["A", "", "B", ""])
+        self.assertEqual(table.run_ids_with_status("ready"), {1, 3})
+        self.assertEqual(table.values["status"], ["done", "ready", "running", "ready"])
+        self.assertIs(table.values["status"][1], table.values["status"][3]) # Interned
+
+        table.values["status"][1] = "running"
+        self.assertEqual(table.run_ids_with_status("ready"), {3})
+        self.assertEqual(table.run_ids_with_status("running"), {1, 2})
+
+    def test_next_ready_run(self):
+        table = make_table(["done", "ready", "ready", "ready"], ["A", "", "lease", ""])
+        self.assertEqual(table.next_ready_run(), 1)
+        table.values["worker_name"][1] = "me"
+        self.assertEqual(table.next_ready_run(), 3)
+        self.assertEqual(table.next_ready_run(is_reclaimable=lambda run_id: True), 1)
+
+        table.values["status"][3] = "done"
+        table.append_run({"run_name": "4", "status": "ready", "worker_name": "", "lr": 0.5})
+        self.assertEqual(table.next_ready_run(), 4)
+        table.values["worker_name"][1] = ""
+        self.assertEqual(table.next_ready_run(), 1)
+
+    def test_next_ready_run_on_a_large_history(self):
+        nb_runs = 50000
+        table = make_table(["done"]*(nb_runs-1) + ["ready"], ["W"]*(nb_runs-1) + [""])
+        self.assertEqual(table.next_ready_run(), nb_runs-1)
+        self.assertEqual(table.values["lr"].data.typecode, "d")
+
+    def test_only_expired_claims_are_visited(self):
+        nb_runs = 10000
+        statuses = ["running"]*nb_runs
+        worker_names = ["W"]*nb_runs
+        statuses[5] = "ready"
+        worker_names[5] = ""
+        expiries = {7: 0.0, 9: time.time() + 3600} # Dead worker of run 7, run 9 is alive
+        columns = {"run_name": [str(i) for i in range(nb_runs)], "status": statuses, "worker_name": worker_names}
+        table = RunTable({"run_name": 0, "status": 1, "worker_name": 2}, [], columns, reclaim_time=lambda values, run_id: expiries.get(run_id))
+        visited_run_ids = []
+        def is_reclaimable(run_id):
+            visited_run_ids.append(run_id)
+            return True
+        self.assertEqual(table.next_ready_runs(5, is_reclaimable=is_reclaimable), [5, 7])
+        self.assertEqual(visited_run_ids, [7])
+
+        table.values["status"][7] = "done"
+        del expiries[7]
+        self.assertEqual(table.next_ready_runs(5, is_reclaimable=is_reclaimable), [5])
+
+    def test_stale_entries_are_compacted(self):
+        table = make_table(["ready"]*10, [""]*10)
+        for i in range(1000):
+            table.values["worker_name"][i%10] = "W" if i%20 < 10 else ""
+        self.assertLessEqual(sum(len(heap) for heap in table.ready_heaps.values()), 2*10 + 64)
+        self.assertEqual(table.next_ready_runs(10), list(range(10)))
+
+if __name__ == '__main__':
+    unittest.main()
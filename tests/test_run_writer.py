@@ -0,0 +1,77 @@
+import contextlib
+import io
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet, QuotaExceededError
+from gsheets_ml_scheduler.run_writer import GSheetsMLRunWriter, PartialWriteError, iter_chunks
+from gsheets_ml_scheduler.search import grid_search, random_search
+
+def make_sheet_data():
+    return [["run_name", "status", "worker_name", "lr"], ["", "", "", "0.1"], ["0", "done", "AbCdEf", "0.5"]]
+
+class TestRunWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.spreadsheet = InMemorySpreadsheet([make_sheet_data()])
+        self.sheet = self.spreadsheet.worksheets()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.run_writer = GSheetsMLRunWriter(self.spreadsheet.url, backend=self.spreadsheet, column_wait_s=0.01)
+
+    def test_generator_is_streamed_in_chunks(self):
+        progress = []
+        nb_written = self.run_writer.write_runs(grid_search({"lr": [0.1, 0.01, 0.001], "batch_size": [16, 32, 64, 128]}, base_config={"optimizer": "adam"}),
+                                                chunk_size=5, progress_callback=lambda nb_written, nb_total: progress.append((nb_written, nb_total)))
+        self.assertEqual(nb_written, 12)
+        self.assertEqual(progress, [(5, None), (10, None), (12, None)])
+        data = self.sheet.get_all_values()
+        self.assertEqual(data[0], ["run_name", "status", "worker_name", "lr", "optimizer", "batch_size"])
+        self.assertEqual(data[3], ["1", "ready", "", "0.1", "adam", "16"])
+        self.assertEqual(data[14], ["12", "ready", "", "0.001", "adam", "128"])
+        self.assertEqual(len(data), 15)
+        self.assertEqual(self.spreadsheet.api_calls["batch_update"], 1 + 3) # One header write, one write per chunk
+        self.assertEqual(self.spreadsheet.api_calls["format"], 1)
+
+    def test_chunks_are_size_bounded(self):
+        configs = [{"note": "x"*100} for _ in range(10)]
+        self.assertEqual([len(chunk) for chunk in iter_chunks(configs, 500, 350)], [3, 3, 3, 1])
+        self.assertEqual([len(chunk) for chunk in iter_chunks(configs, 4, 10**6)], [4, 4, 2])
+
+    def test_resume_after_partial_failure(self):
+        configs = list(random_search({"lr": lambda rng: 10**rng.uniform(-5, -2), "depth": [2, 4, 8]}, 7, seed=0))
+        self.assertEqual(configs, list(random_search({"lr": lambda rng: 10**rng.uniform(-5, -2), "depth": [2, 4, 8]}, 7, seed=0)))
+
+        batch_update = self.sheet.batch_update
+        nb_calls = []
+        def failing_batch_update(*args, **kwargs):
+            nb_calls.append(None)
+            if len(nb_calls) == 3: # Header, first chunk, then the second chunk fails
+                raise QuotaExceededError("Quota exceeded")
+            return batch_update(*args, **kwargs)
+        self.sheet.batch_update = failing_batch_update
+
+        with self.assertRaises(PartialWriteError) as context:
+            self.run_writer.write_runs(configs, chunk_size=3)
+        self.assertEqual(context.exception.nb_written, 3)
+        self.assertEqual(self.run_writer.write_runs(configs, chunk_size=3, resume_from=context.exception.nb_written), 7)
+
+        data = self.sheet.get_all_values()
+        self.assertEqual([line[0] for line in data[3:]], [str(i+1) for i in range(7)])
+        self.assertEqual([line[4] for line in data[3:]], [str(config["depth"]) for config in configs])
+
+    def test_columns_written_at_the_same_time_are_not_shared(self):
+        batch_update = self.sheet.batch_update
+        def racing_batch_update(data, *args, **kwargs):
+            data = list(data)
+            result = batch_update(data, *args, **kwargs)
+            if data[0]["range"].startswith("E1") and self.sheet.row_values(1)[4] == "optimizer":
+                self.sheet.update_cell(1, 5, "epochs") # A worker creating its metric column after us, on the same cell
+            return result
+        self.sheet.batch_update = racing_batch_update
+
+        self.run_writer.write_runs([{"lr": 0.01, "optimizer": "adam"}])
+        data = self.sheet.get_all_values()
+        self.assertEqual(data[0], ["run_name", "status", "worker_name", "lr", "epochs", "optimizer"])
+        self.assertEqual(data[3], ["1", "ready", "", "0.01", "", "adam"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import contextlib
+import io
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.scheduler import GSheetsMLScheduler
+
+class TestScopedReads(unittest.TestCase):
+
+    def setUp(self):
+        data = [["run_name", "status", "worker_name", "lr", "n_epoch"], ["", "", "", "0.1", "10"]]
+        for i in range(5):
+            data.append([str(i+1), "done", "OldWkr", "", ""])
+        self.spreadsheet = InMemorySpreadsheet([data])
+        self.sheet = self.spreadsheet.worksheets()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler = GSheetsMLScheduler(self.spreadsheet.url, backend=self.spreadsheet)
+
+    def test_find_ready_run_downloads_new_lines_only(self):
+        self.sheet.batch_update([{"range": "A8:E9", "values": [["6", "ready", "", "0.5", ""], ["7", "ready", "", "", "3"]]}])
+
+        run_id, config = self.scheduler.find_ready_run()
+        self.assertEqual((run_id, config), (5, {"lr": 0.5, "n_epoch": 10}))
+        self.assertEqual(self.scheduler.nb_runs, 7)
+        self.assertEqual(self.scheduler.get_run_config(6), {"lr": 0.1, "n_epoch": 3})
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], 1) # Only the one of the constructor
+
+    def test_header_change_triggers_a_full_refresh(self):
+        self.sheet.batch_update([{"range": "F1:F3", "values": [["batch_size"], ["32"], ["64"]]}])
+        self.scheduler.find_ready_run()
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], 2)
+        self.assertEqual(self.scheduler.config_keys, ["lr", "n_epoch", "batch_size"])
+        self.assertEqual(self.scheduler.get_run_config(0)["batch_size"], 64)
+
+    def test_check_for_config_updates_reads_the_running_line(self):
+        self.sheet.batch_update([{"range": "B7:C7", "values": [["ready", ""]]}])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.scheduler.find_claim_and_start_run()
+        self.sheet.update_cell(7, 4, "0.01")
+        self.sheet.update_cell(2, 5, "20")
+
+        updated_config, changed_keys = self.scheduler.check_for_config_updates()
+        self.assertEqual(updated_config, {"lr": 0.01, "n_epoch": 10})
+        self.assertEqual(changed_keys, ["lr"]) # n_epoch was written from the defaults when the run started
+        self.assertEqual(self.spreadsheet.api_calls["get_all_values"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet
+from gsheets_ml_scheduler.sharded import ShardedGSheetsMLRunWriter, ShardedGSheetsMLScheduler
+
+from sheet_fixtures import QuietTestCase
+
+def make_empty_shard():
+    return [["run_name", "status", "worker_name", "lr"], ["", "", "", "0.1"]]
+
+class TestSharded(QuietTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.spreadsheet = InMemorySpreadsheet([make_empty_shard() for _ in range(3)])
+
+    def test_writer_spreads_runs_over_the_shards(self):
+        run_writer = ShardedGSheetsMLRunWriter(self.spreadsheet.url, [0, 1, 2], backend=self.spreadsheet)
+        self.assertEqual(run_writer.write_runs([{"lr": 0.01*i} for i in range(9)], chunk_size=2), 9)
+        self.assertEqual(self.spreadsheet.api_calls["fetch_sheet_metadata"], 3) # One per shard, no login per shard
+
+        shard_run_names = [sheet.col_values(1)[2:] for sheet in self.spreadsheet.worksheets()]
+        self.assertEqual([len(run_names) for run_names in shard_run_names], [4, 3, 2]) # Chunks go to the shard with the fewest runs
+        self.assertEqual(sorted(sum(shard_run_names, []), key=int), [str(i) for i in range(9)])
+
+    def test_workers_start_at_home_and_fall_back(self):
+        run_writer = ShardedGSheetsMLRunWriter(self.spreadsheet.url, [0, 1, 2], backend=self.spreadsheet)
+        run_writer.write_runs([{"lr": 0.5} for _ in range(6)], chunk_size=1)
+        schedulers = [ShardedGSheetsMLScheduler(self.spreadsheet.url, [0, 1, 2], backend=self.spreadsheet, min_claim_wait_s=0.01) for _ in range(2)]
+
+        run_names = []
+        for scheduler in schedulers:
+            self.assertEqual(list(scheduler.schedulers.keys()), [scheduler.shard_order[0]]) # Only the home shard is connected
+            run_name, config = scheduler.find_claim_and_start_run()
+            self.assertEqual(config, {"lr": 0.5})
+            self.assertEqual(scheduler.currently_running_sheet_index, scheduler.shard_order[0])
+            self.assertEqual(scheduler.current_scheduler.worker_name, scheduler.worker_name)
+            scheduler.update_status("epoch 1")
+            scheduler.run_done()
+            run_names.append(run_name)
+        while True:
+            run_name, _ = schedulers[0].find_claim_and_start_run()
+            if run_name is None:
+                break
+            schedulers[0].run_done()
+            run_names.append(run_name)
+
+        self.assertEqual(sorted(run_names, key=int), [str(i) for i in range(6)])
+        self.assertEqual(sorted(schedulers[0].schedulers.keys()), [0, 1, 2])
+        for sheet in self.spreadsheet.worksheets():
+            self.assertEqual(sheet.col_values(2)[2:], ["done", "done"])
+
+    def test_calls_without_a_running_run(self):
+        scheduler = ShardedGSheetsMLScheduler(self.spreadsheet.url, [0, 1, 2], backend=self.spreadsheet)
+        self.assertIsNone(scheduler.check_for_config_updates())
+        self.assertIsNone(scheduler.sync_config_and_status("epoch 1"))
+        self.assertIsNone(scheduler.start_background_sync())
+
+if __name__ == '__main__':
+    unittest.main()
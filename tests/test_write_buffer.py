@@ -0,0 +1,40 @@
+import unittest
+
+from gsheets_ml_scheduler.backends import InMemorySpreadsheet, QuotaExceededError
+from gsheets_ml_scheduler.write_buffer import SheetWriteBuffer
+
+class TestSheetWriteBuffer(unittest.TestCase):
+
+    def test_flush_is_one_value_batch_and_one_format_batch(self):
+        spreadsheet = InMemorySpreadsheet([[["a", "b", "c", "d"]]])
+        sheet = spreadsheet.worksheets()[0]
+        write_buffer = SheetWriteBuffer(sheet)
+
+        write_buffer.update_cell(2, 1, "x")
+        write_buffer.update_cell(2, 2, "y")
+        write_buffer.update_cell(2, 4, "z")
+        write_buffer.update_cell(2, 1, "last") # Same cell, last write wins
+        write_buffer.format("A2:D2", {"backgroundColor": {"red": 1.0}})
+        write_buffer.format("A2:D2", {"textFormat": {"bold": True}})
+        self.assertEqual(write_buffer.value_ranges(), [{"range": "A2:B2", "values": [["last", "y"]]}, {"range": "D2:D2", "values": [["z"]]}])
+
+        write_buffer.flush()
+        self.assertTrue(write_buffer.is_empty())
+        self.assertEqual(spreadsheet.api_calls["batch_update"], 1)
+        self.assertEqual(spreadsheet.api_calls["batch_format"], 1)
+        self.assertEqual(sheet.row_values(2), ["last", "y", "", "z"])
+        self.assertEqual(sheet.formats[(2, 3)], {"backgroundColor": {"red": 1.0}, "textFormat": {"bold": True}})
+
+        write_buffer.flush() # Nothing pending, no API call
+        self.assertEqual(spreadsheet.total_api_calls(), 4)
+
+    def test_failed_flush_keeps_pending_writes(self):
+        spreadsheet = InMemorySpreadsheet([[["a"]]], write_quota_per_minute=0)
+        write_buffer = SheetWriteBuffer(spreadsheet.worksheets()[0])
+        write_buffer.update_cell(1, 1, "b")
+        with self.assertRaises(QuotaExceededError):
+            write_buffer.flush()
+        self.assertEqual(write_buffer.pending_values, {(1, 1): "b"})
+
+if __name__ == '__main__':
+    unittest.main()